@@ -7,11 +7,14 @@ import clueslib.platform
 import cpyutils.log
 import clues.configcli as configcli
 import collections
+import heapq
 # import simdatacenter
 import random
+import time
 import clues.cluesserver as cluesserver
 
 import cluessim as simdatacenter
+import cluessim.traces
 
 
 try:
@@ -29,8 +32,8 @@ class Event():
     self.t = t
   def do(self, lrms, powermanager, nodepool):
     raise Exception("not implemented")
-  def schedule(self, lrms, powermanager, nodepool):
-    raise Exception("not implemented")
+  def simulate(self, simulation):
+    self.do(simulation.lrms, simulation.powermanager, simulation.nodepool)
 
 class LaunchJob(Event):
   # This is a job launcher. It is used to program a "qsub" of a job. This class is able to emulate the workflow of CLUES: 
@@ -45,13 +48,15 @@ class LaunchJob(Event):
     Event.__init__(self, t)
     self._job = job
     self.timeout = 180
-    self.proxy = configcli.get_clues_proxy_from_config()
+    self.proxy = None
     self.req_id = None
     self.sec_info = configcli.config_client.CLUES_SECRET_TOKEN
     self.makerequest = makerequest
 
   def _launch_job(self, lrms):
     if self.makerequest:
+      if self.proxy is None:
+        self.proxy = configcli.get_clues_proxy_from_config()
       succeed, req_id = self.proxy.request_create(self.sec_info, self._job.cores, self._job.memory, self._job.nodecount, self._job.nodecount, "")
       if succeed:
         self.req_id = req_id
@@ -72,8 +77,12 @@ class LaunchJob(Event):
         self.timeout -= 0.5
         cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event(0.5, description = "wait for request %s" % self.req_id, callback = self._wait_job_and_launch, parameters = [lrms], mute = True))
 
-  def schedule(self, lrms, powermanager, nodepool):
-    cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event(self.t, description = "submit job", callback = self._launch_job, parameters = [lrms], threaded_callback = False))
+  def do(self, lrms, powermanager, nodepool):
+    self._launch_job(lrms)
+
+  def simulate(self, simulation):
+    # In headless mode the request is made to the daemon in the same process (see cluessim.Simulation)
+    simulation.submit(self._job, self.makerequest)
 
   def __repr__(self):
     return "@%d: (Job: %.2f cores, %.2f mem, %.2f sec)" % (self.t, self._job.cores, self._job.memory, self._job.seconds)
@@ -101,6 +110,16 @@ class AddNode(Event):
   def __repr__(self):
     return "@%s: (Node: %s, %.2f cores, %.2f mem)" % (self.t, self._node.name, self._node.cores, self._node.total_memory)
 
+class SetPowerModel(Event):
+  def __init__(self, t, node_class, power_model):
+    Event.__init__(self, t)
+    self._node_class = node_class
+    self._power_model = power_model
+  def do(self, lrms, powermanager, nodepool):
+    nodepool.set_power_model(self._node_class, self._power_model)
+  def __repr__(self):
+    return "@%s: (Power model of %s: %s)" % (self.t, self._node_class, self._power_model)
+
 class RemoveNode(Event):
   def __init__(self, t, nodename):
     Event.__init__(self, t)
@@ -137,11 +156,11 @@ def parse_command(t, fields):
     if count != 1:
       count = int(count)
     if count == 1:
-      return [AddNode(t, simdatacenter.Node(cores, memory, name))]
+      return [AddNode(t, simdatacenter.Node(cores, memory, name, name))]
     else:
       nodes = []
       for i in range(0, count):
-        nodes.append(AddNode(t, simdatacenter.Node(cores, memory, "%s%.02d" % (name, i))))
+        nodes.append(AddNode(t, simdatacenter.Node(cores, memory, "%s%.02d" % (name, i), name)))
       return nodes
 
     AddNode(t, simdatacenter.Node(cores, memory, name))
@@ -151,7 +170,7 @@ def parse_command(t, fields):
     seconds = get_value(fields, 4, "seconds")
     nodecount = get_value(fields, 5, "nodecount", 1)
     control = ""
-    if len(fields)>5: control = fields[6]
+    if len(fields)>6: control = fields[6]
     if slots is None:
       slots = random.randint(1, max_slots)
     if memory is None:
@@ -174,9 +193,150 @@ def parse_command(t, fields):
 
     _LOGGER.debug("creating a job: slots:%d memory:%d nodecount:%d duration: %d" % (slots, memory, nodecount, seconds))
     return [LaunchJob(t, simdatacenter.Job(slots, memory, seconds, nodecount), makerequest)]
+  elif command == "power":
+    # The power model of a class of nodes (i.e. the nodes created with that name): the time to power on and to power off them
+    #   (fixed:<seconds>, uniform:<min>:<max> or empirical:<file>) and the probability of failing to power them on and off
+    name = get_value(fields, 2, "name", "node", to_float=False)
+    model = simdatacenter.PowerModel()
+    try:
+      poweron = get_value(fields, 3, "power on time", None, to_float=False)
+      if poweron is not None:
+        model.poweron = simdatacenter.powermodel.parse_distribution(poweron)
+      poweroff = get_value(fields, 4, "power off time", None, to_float=False)
+      if poweroff is not None:
+        model.poweroff = simdatacenter.powermodel.parse_distribution(poweroff)
+    except Exception as e:
+      _LOGGER.error("invalid power model for %s: %s" % (name, e))
+      sys.exit(-1)
+    model.poweron_failure = get_value(fields, 5, "power on failure", model.poweron_failure)
+    model.poweroff_failure = get_value(fields, 6, "power off failure", model.poweroff_failure)
+    _LOGGER.debug("power model for nodes %s: %s" % (name, model))
+    return [SetPowerModel(t, name, model)]
   else:
     print("do not know what to do with command %s" % command)
-  
+
+def _simulation_file_commands(filename):
+  # Reads the simulation file line by line, and yields the time of each command (None if it has no time) and its events
+  time_started = False
+  with open(filename) as jobfile:
+    for line in jobfile:
+      line = line.strip().split('#')[0]
+      fields = line.split(";")
+      if len(fields) < 2:
+        # print("ignoring line")
+        continue
+
+      T=fields[0]
+      command=fields[1]
+      if T == "":
+        if time_started:
+          print("missing time")
+          continue
+        print("%s happened before anything start" % command)
+        T = None
+      else:
+        time_started = True
+        T=int(T)
+
+      fields[0]=T
+      eventlist = parse_command(T, fields)
+      if eventlist is not None:
+        yield T, eventlist
+
+def read_simulation_file(filename):
+  # Returns the actions that happen before the simulation starts (i.e. the commands without time) and a generator for the rest of
+  #   the events, so that the file is not loaded in memory
+  commands = _simulation_file_commands(filename)
+  previous_actions = []
+  first_events = []
+  for T, eventlist in commands:
+    if T is None:
+      previous_actions = previous_actions + eventlist
+    else:
+      first_events = eventlist
+      break
+
+  def events():
+    for event in first_events:
+      yield event
+    for _, eventlist in commands:
+      for event in eventlist:
+        yield event
+  return previous_actions, events()
+
+def read_trace(filename, trace_format, cores_per_node, offset):
+  # Creates the events to launch the jobs of a workload trace (the trace is read lazily)
+  if trace_format == "swf":
+    jobs = cluessim.traces.read_swf(filename, cores_per_node, offset)
+  elif trace_format == "sacct":
+    jobs = cluessim.traces.read_sacct(filename, offset)
+  else:
+    raise Exception("invalid format for the trace: %s" % trace_format)
+  for job in cluessim.traces.sort_by_time(jobs):
+    yield LaunchJob(job.t, simdatacenter.Job(job.cores, job.memory, job.seconds, job.nodecount, job.name))
+
+def merge_events(*eventlists):
+  # Merges the lists of events (each of them ordered by time) lazily
+  pending = []
+  for i, events in enumerate(eventlists):
+    events = iter(events)
+    for event in events:
+      heapq.heappush(pending, (event.t, i, event, events))
+      break
+  while len(pending) > 0:
+    _, i, event, events = heapq.heappop(pending)
+    yield event
+    for event in events:
+      heapq.heappush(pending, (event.t, i, event, events))
+      break
+
+def feed_events(events, lrms, powermanager, nodepool):
+  # Schedules the events one by one in the event loop (the next event is scheduled when the previous one happens), so that the
+  #   whole workload is not in memory
+  t0 = cpyutils.eventloop.now()
+  def next_event():
+    for event in events:
+      cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event(max(0, t0 + event.t - cpyutils.eventloop.now()), description = "simulation event", callback = do_event, parameters = [event], threaded_callback = False))
+      break
+  def do_event(event):
+    event.do(lrms, powermanager, nodepool)
+    next_event()
+  next_event()
+
+SCHEDULER_CLASSES = "clueslib.schedulers.CLUES_Scheduler_PowOn_Requests,clueslib.schedulers.CLUES_Scheduler_Reconsider_Jobs, clueslib.schedulers.CLUES_Scheduler_PowOff_IDLE"
+
+def create_platform(sim_file, trace_file = None, trace_format = None, trace_offset = 10, cores_per_node = None, backfill = False, seed = None):
+  # Creates the simulated platform from the simulation file, and returns it along with the events of the simulation (the events of
+  #   the simulation file and the jobs of the trace, if any, that are read lazily)
+  previous_actions, events = read_simulation_file(sim_file)
+  events = cluessim.traces.sort_by_time(events)
+
+  nodepool = simdatacenter.NodePool(seed)
+  lrms = simdatacenter.LRMS_FIFO(nodepool, backfill)
+  powermanager = simdatacenter.PowerManager_dummy(nodepool)
+
+  for action in previous_actions:
+    action.do(lrms, powermanager, nodepool)
+
+  if trace_file is not None:
+    if trace_format is None:
+      trace_format = "swf" if trace_file.lower().endswith(".swf") else "sacct"
+    if cores_per_node is None:
+      # The jobs of SWF traces are split in nodes as big as the biggest node of the platform
+      cores_per_node = max([ n.total_cores for n in nodepool ] + [ 0 ]) or None
+    events = merge_events(events, read_trace(trace_file, trace_format, cores_per_node, trace_offset))
+  return nodepool, lrms, powermanager, events
+
+def configure_simulation(database_file):
+  # Sets the configuration of CLUES for the simulations (if database_file is None, the results are not stored in a database)
+  if database_file is None:
+    configserver._CONFIGURATION_CLUES.DB_CONNECTION_STRING = ""
+  else:
+    configserver._CONFIGURATION_CLUES.DB_CONNECTION_STRING = "sqlite://%s" % database_file
+  clueslib.configlib._CONFIGURATION_MONITORING.PERIOD_MONITORING_JOBS = 10
+  clueslib.configlib._CONFIGURATION_MONITORING.COOLDOWN_SERVED_REQUESTS = 30
+  configserver.config_scheduling.SCHEDULER_CLASSES = SCHEDULER_CLASSES
+
 def main(options):
   if options.SIM_FILE is None:
     print("nothing to do")
@@ -201,73 +361,42 @@ def main(options):
     except:
       pass
 
-  for i in [ "-f", "--simulation-file", "-d", "--database-file"]:
+  for i in [ "-f", "--simulation-file", "-d", "--database-file", "-T", "--trace", "--trace-format", "--trace-offset", "--cores-per-node" ]:
     while sys.argv.count(i):
       pos = sys.argv.index(i)
       del sys.argv[pos+1]
       del sys.argv[pos]
 
-  for i in [ "-t", "--truncate-database", "-F", "--force-truncate", "-tF", "-Ft", "-n", "--no-end" ]:
+  for i in [ "-t", "--truncate-database", "-F", "--force-truncate", "-tF", "-Ft", "-n", "--no-end", "-B", "--backfill" ]:
     while sys.argv.count(i):
       pos = sys.argv.index(i)
       del sys.argv[pos]
 
-  with open(options.SIM_FILE) as jobfile:
-    content = jobfile.readlines()
-  content = [x.strip() for x in content]
-
-  time_started = False
-  previous_actions = []
-  events = []
-
-  for line in content:
-    line = line.split('#')[0]
-    fields = line.split(";")
-    if len(fields) < 2:
-      # print("ignoring line")
-      continue
-
-    T=fields[0]
-    command=fields[1]
-    if T == "":
-      if time_started:
-        print("missing time")
-      else:
-        print("%s happened before anything start" % command)
-    else:
-      time_started = True
-      T=int(T)
-
-    fields[0]=T
-    eventlist = parse_command(T, fields)
-    if eventlist is not None:
-      if not time_started:
-        previous_actions = previous_actions + eventlist
-      else:
-        events = events + eventlist
-
-  nodepool = simdatacenter.NodePool()
-  lrms = simdatacenter.LRMS_FIFO(nodepool)
-  powermanager = simdatacenter.PowerManager_dummy(nodepool)
+  if options.HEADLESS and (options.RANDOM_SEED is not None):
+    random.seed(int(options.RANDOM_SEED))
 
-  for action in previous_actions:
-    action.do(lrms, powermanager, nodepool)
+  nodepool, lrms, powermanager, events = create_platform(options.SIM_FILE, options.TRACE_FILE, options.TRACE_FORMAT, options.TRACE_OFFSET, options.CORES_PER_NODE, options.BACKFILL, options.RANDOM_SEED)
 
   def queue_jobs(lrms):
     if options.END:
       _LOGGER.debug("setting end after 10 seconds without new events")
       cpyutils.eventloop.get_eventloop().set_endless_loop(False)
       cpyutils.eventloop.get_eventloop().limit_time_without_new_events(10)
-      for event in events:
-        event.schedule(lrms, powermanager, nodepool)
+      feed_events(events, lrms, powermanager, nodepool)
 
   print(nodepool)
   print("-"*100 + "\n" + str(cpyutils.eventloop.get_eventloop()))
   
-  configserver._CONFIGURATION_CLUES.DB_CONNECTION_STRING = "sqlite://%s" % options.OUT_FILE
-  clueslib.configlib._CONFIGURATION_MONITORING.PERIOD_MONITORING_JOBS = 10
-  clueslib.configlib._CONFIGURATION_MONITORING.COOLDOWN_SERVED_REQUESTS = 30
-  configserver.config_scheduling.SCHEDULER_CLASSES = "clueslib.schedulers.CLUES_Scheduler_PowOn_Requests,clueslib.schedulers.CLUES_Scheduler_Reconsider_Jobs, clueslib.schedulers.CLUES_Scheduler_PowOff_IDLE"
+  configure_simulation(options.OUT_FILE)
+
+  if options.HEADLESS:
+    # The daemon, the LRMS and the power manager run in this process, and the time jumps from one event to the next one
+    simulation = simdatacenter.Simulation(nodepool, lrms, powermanager, configserver.config_scheduling.SCHEDULER_CLASSES)
+    walltime = time.time()
+    t = simulation.run(events)
+    _LOGGER.info("simulation of %.2f seconds finished in %.2f seconds" % (t, time.time() - walltime))
+    return
+
   cluesserver.main_loop(lrms, powermanager, queue_jobs, [lrms])
 
 if __name__ == "__main__":
@@ -280,6 +409,12 @@ if __name__ == "__main__":
   parser.add_option("-t", "--truncate-database", dest="TRUNCATE", default=False, action="store_true", help="WARNING: truncates the database file (for simulation purposes only)")
   parser.add_option("-F", "--force-truncate", dest="FORCETRUNCATE", default=False, action="store_true", help="force confirmation for -t flag")
   parser.add_option("-n", "--no-end", dest="END", default=True, action="store_false", help="do not end simulation (useful to have a running platform to monitor)")
+  parser.add_option("-T", "--trace", dest="TRACE_FILE", default=None, help="workload trace with the jobs to launch (besides the jobs in the simulation file)")
+  parser.add_option("--trace-format", dest="TRACE_FORMAT", default=None, type="choice", choices=["swf", "sacct"], help="format of the trace: swf (Standard Workload Format) or sacct (output of sacct --parsable2); by default, swf for .swf files and sacct otherwise")
+  parser.add_option("--trace-offset", dest="TRACE_OFFSET", default=10, type="float", help="time of the simulation in which the first job of the trace is launched")
+  parser.add_option("--cores-per-node", dest="CORES_PER_NODE", default=None, type="int", help="cores of the nodes in which the jobs of a SWF trace are split (by default, the cores of the biggest node)")
+  parser.add_option("-B", "--backfill", dest="BACKFILL", default=False, action="store_true", help="the LRMS lets the jobs start before the first job in the queue if they do not delay it (backfilling)")
+  parser.add_option("-H", "--headless", dest="HEADLESS", default=False, action="store_true", help="runs CLUES in this process, in simulated time and without the RPC server (the simulation ends when all the jobs have finished)")
 
   (options, args) = parser.parse_args()
   main(options)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+import sys
+import os
+import csv
+import time
+import random
+import logging
+import collections
+import multiprocessing
+import clues.configserver as configserver
+import cluessim
+import cluessim.sweep
+import clues_sim
+
+def run_simulation(run):
+  # Runs one of the simulations of the sweep in this process. Each process of the pool runs a single simulation, so the values of the
+  #   configuration (that are module-level objects) and the state of the simulator are not shared between simulations
+  if not run["verbose"]:
+    logging.disable(logging.INFO)
+  random.seed(run["seed"])
+  clues_sim.configure_simulation(run["database"])
+  cluessim.sweep.set_parameters(run["parameters"])
+
+  nodepool, lrms, powermanager, events = clues_sim.create_platform(run["sim_file"], run["trace_file"], run["trace_format"], run["trace_offset"], run["cores_per_node"], run["backfill"], run["seed"])
+  simulation = cluessim.Simulation(nodepool, lrms, powermanager, configserver.config_scheduling.SCHEDULER_CLASSES)
+  cluessim.sweep.set_parameters(run["parameters"], simulation.schedulers)
+  walltime = time.time()
+  simulation.run(events)
+
+  results = collections.OrderedDict([ ("run", run["id"]), ("seed", run["seed"]) ])
+  for name, value in run["parameters"].items():
+    results[name.split(".", 1)[1]] = value
+  results.update(simulation.get_results(run["watts"]))
+  results["walltime"] = time.time() - walltime
+  return results
+
+def create_runs(options, parameters):
+  if options.RANDOM is not None:
+    combinations = cluessim.sweep.random_search(parameters, options.RANDOM, random.Random(options.RANDOM_SEED))
+  else:
+    combinations = cluessim.sweep.grid_search(parameters)
+
+  run_id = 0
+  for values in combinations:
+    for repetition in range(options.REPETITIONS):
+      database = None
+      if options.DATABASE_DIR is not None:
+        database = os.path.join(options.DATABASE_DIR, "run%04d.db" % run_id)
+      yield {
+        "id": run_id,
+        "seed": options.RANDOM_SEED + repetition,
+        "parameters": values,
+        "sim_file": options.SIM_FILE,
+        "trace_file": options.TRACE_FILE,
+        "trace_format": options.TRACE_FORMAT,
+        "trace_offset": options.TRACE_OFFSET,
+        "cores_per_node": options.CORES_PER_NODE,
+        "backfill": options.BACKFILL,
+        "database": database,
+        "watts": options.WATTS,
+        "verbose": options.VERBOSE
+      }
+      run_id += 1
+
+def main(options):
+  if options.SIM_FILE is None:
+    print("please set the simulation file")
+    sys.exit(1)
+
+  # The schedulers of the simulations are created to find their options (the configuration of this process is not modified)
+  schedulers = cluessim.Simulation._create_schedulers(clues_sim.SCHEDULER_CLASSES)
+  parameters = [ cluessim.sweep.Parameter.parse(p, schedulers) for p in options.PARAMETERS ]
+  runs = list(create_runs(options, parameters))
+  print("running %d simulations in %d processes" % (len(runs), options.PROCESSES))
+
+  output = None
+  writer = None
+  if options.OUTPUT_FILE is not None:
+    output = open(options.OUTPUT_FILE, "w")
+
+  # Each process of the pool is used for a single simulation (maxtasksperchild), so that the simulations are isolated
+  pool = multiprocessing.Pool(options.PROCESSES, maxtasksperchild = 1)
+  rows = []
+  try:
+    for results in pool.imap_unordered(run_simulation, runs):
+      rows.append(results)
+      print("run %d finished (%d/%d)" % (results["run"], len(rows), len(runs)))
+      if output is not None:
+        if writer is None:
+          writer = csv.DictWriter(output, list(results.keys()))
+          writer.writeheader()
+        writer.writerow(results)
+        output.flush()
+  finally:
+    pool.close()
+    pool.join()
+    if output is not None:
+      output.close()
+
+  print(cluessim.sweep.format_table(sorted(rows, key = lambda r: r["run"])))
+
+if __name__ == "__main__":
+  from optparse import OptionParser
+  parser = OptionParser(usage = "%prog -f <simulation file> [-T <trace>] -p NAME=value1,value2 [-p NAME=min:max ...] [options]")
+  parser.add_option("-f", "--simulation-file", dest="SIM_FILE", default=None, help="file with the platform (and the jobs) of the simulations")
+  parser.add_option("-T", "--trace", dest="TRACE_FILE", default=None, help="workload trace with the jobs to launch (see clues_sim.py)")
+  parser.add_option("--trace-format", dest="TRACE_FORMAT", default=None, type="choice", choices=["swf", "sacct"], help="format of the trace: swf or sacct")
+  parser.add_option("--trace-offset", dest="TRACE_OFFSET", default=10, type="float", help="time of the simulation in which the first job of the trace is launched")
+  parser.add_option("--cores-per-node", dest="CORES_PER_NODE", default=None, type="int", help="cores of the nodes in which the jobs of a SWF trace are split")
+  parser.add_option("-B", "--backfill", dest="BACKFILL", default=False, action="store_true", help="the LRMS of the simulations uses backfilling")
+  parser.add_option("-p", "--parameter", dest="PARAMETERS", default=[], action="append", help="option of the sections scheduling or monitoring to explore (e.g. IDLE_TIME=600,1800 or monitoring.PERIOD_LIFECYCLE=5:30); it can be repeated")
+  parser.add_option("--random", dest="RANDOM", default=None, type="int", help="makes a random search with this number of combinations (instead of a grid search)")
+  parser.add_option("--repetitions", dest="REPETITIONS", default=1, type="int", help="number of simulations for each combination (each one with a different random seed)")
+  parser.add_option("-r", "--random-seed", dest="RANDOM_SEED", default=0, type="int", help="the seed of the random search and of the first repetition of each combination")
+  parser.add_option("-j", "--processes", dest="PROCESSES", default=multiprocessing.cpu_count(), type="int", help="number of simulations to run at the same time")
+  parser.add_option("-o", "--output", dest="OUTPUT_FILE", default=None, help="CSV file to store the results")
+  parser.add_option("-D", "--database-dir", dest="DATABASE_DIR", default=None, help="directory in which the database of each simulation is stored (by default the simulations are not stored)")
+  parser.add_option("-w", "--watts", dest="WATTS", default="", help="power of the nodes in each state to estimate the energy (default: %s)" % ",".join([ "%s=%s" % (k, v) for (k, v) in cluessim.sweep.DEFAULT_WATTS.items() ]))
+  parser.add_option("-v", "--verbose", dest="VERBOSE", default=False, action="store_true", help="shows the log of the simulations")
+
+  (options, args) = parser.parse_args()
+  options.WATTS = cluessim.sweep.parse_watts(options.WATTS)
+  main(options)
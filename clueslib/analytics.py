@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import cpyutils.config
+import cpyutils.db
+from . import reports
+from .node import Node
+from .request import Request
+
+try:
+    config_analytics
+except:
+    config_analytics = cpyutils.config.Configuration("analytics",
+        {
+            "WATTS_IDLE": 100.0,
+            "WATTS_BUSY": 200.0,
+            "WATTS_OFF": 0.0,
+            "WATTS_POWERING": 150.0,
+            "WATTS_NODES": ""
+        })
+
+# The names of the states of the nodes and the requests in the results
+_NODE_STATES = Node.state2str
+_REQUEST_STATES = Request.STATE2STR
+
+def parse_node_watts(node_watts):
+    # Parses a string in the form "node1=IDLE:BUSY,node2=IDLE:BUSY" to a dictionary { "node1": (IDLE, BUSY), "node2": (IDLE, BUSY) }
+    watts = {}
+    for entry in node_watts.split(","):
+        entry = entry.strip()
+        if entry == "":
+            continue
+        try:
+            name, values = entry.split("=", 1)
+            idle, busy = values.split(":", 1)
+            watts[name.strip()] = (float(idle), float(busy))
+        except:
+            raise Exception("invalid wattage '%s' for a node (the format is name=IDLE:BUSY)" % entry)
+    return watts
+
+class PowerModel(object):
+    # The power (in watts) that a node uses in each state: when it is on, it uses from the idle to the busy power, according to the
+    #   fraction of its slots that are used; when it is being powered on or off it uses the powering power, and otherwise it uses
+    #   the off power. The idle and busy power can be set for each node.
+    def __init__(self, idle, busy, off = 0.0, powering = None, nodes = {}):
+        self.idle = float(idle)
+        self.busy = float(busy)
+        self.off = float(off)
+        if powering is None:
+            powering = busy
+        self.powering = float(powering)
+        self.nodes = nodes
+
+    @staticmethod
+    def create_from_config():
+        return PowerModel(config_analytics.WATTS_IDLE, config_analytics.WATTS_BUSY, config_analytics.WATTS_OFF, config_analytics.WATTS_POWERING, parse_node_watts(config_analytics.WATTS_NODES))
+
+    def watts(self, name, state, slots, slots_used):
+        # Returns the power that the node uses in that state, and the power that it would use if CLUES did not power it off
+        idle, busy = self.nodes.get(name, (self.idle, self.busy))
+        if state in [ Node.IDLE, Node.USED ]:
+            load = 0.0
+            if slots > 0:
+                load = min(1.0, max(0.0, float(slots_used) / slots))
+            power = idle + (busy - idle) * load
+            return power, power
+        if state in [ Node.POW_ON, Node.POW_OFF ]:
+            return self.powering, idle
+        if state == Node.OFF:
+            return self.off, idle
+        # The nodes in error or unknown state are considered to be on, but not used
+        return idle, idle
+
+def percentiles(values, points = [ 50, 90, 99 ]):
+    # Gets a summary of the values (count, mean, max and the percentiles, using the nearest rank)
+    result = { "count": len(values) }
+    if len(values) == 0:
+        return result
+    values = sorted(values)
+    result["mean"] = sum(values) / float(len(values))
+    result["max"] = values[-1]
+    for p in points:
+        result["p%d" % p] = values[max(0, -(-p * len(values) // 100) - 1)]
+    return result
+
+class _HostAnalytics(object):
+    def __init__(self, name, power_model):
+        self.name = name
+        self._power_model = power_model
+        self.time = {}
+        self.energy = 0.0
+        self.energy_baseline = 0.0
+        self.slot_seconds = 0.0
+        self.slot_seconds_used = 0.0
+        self.power_ons = 0
+        self.failed_power_ons = 0
+        self._current = None
+        self._power_on_start = None
+
+    def _account(self, t_end):
+        (t, slots, slots_used, memory, memory_used, state) = self._current
+        dt = max(0, t_end - t)
+        self.time[state] = self.time.get(state, 0) + dt
+        power, power_baseline = self._power_model.watts(self.name, state, slots, slots_used)
+        self.energy += power * dt
+        self.energy_baseline += power_baseline * dt
+        if state in [ Node.IDLE, Node.USED ]:
+            self.slot_seconds += slots * dt
+            self.slot_seconds_used += slots_used * dt
+
+    def add(self, event, latencies):
+        # Adds the event (that is in the form of reports._HostEvents) and accounts the time since the previous one
+        state = event[5]
+        if self._current is not None:
+            self._account(event[0])
+            previous_state = self._current[5]
+            if state != previous_state:
+                if state == Node.POW_ON:
+                    self._power_on_start = event[0]
+                elif previous_state == Node.POW_ON and self._power_on_start is not None:
+                    if state in [ Node.IDLE, Node.USED ]:
+                        self.power_ons += 1
+                        latencies.append(event[0] - self._power_on_start)
+                    else:
+                        self.failed_power_ons += 1
+                    self._power_on_start = None
+        elif state == Node.POW_ON:
+            self._power_on_start = event[0]
+        self._current = event
+
+    def end(self, t_end):
+        if self._current is not None:
+            self._account(t_end)
+            self._current = None
+
+    def summary(self):
+        return {
+            "time": dict((_NODE_STATES.get(s, str(s)), v) for (s, v) in self.time.items()),
+            "energy_kwh": self.energy / 3600000.0,
+            "energy_baseline_kwh": self.energy_baseline / 3600000.0,
+            "slot_utilization": self.slot_seconds_used / self.slot_seconds if self.slot_seconds > 0 else None,
+            "power_ons": self.power_ons,
+            "failed_power_ons": self.failed_power_ons
+        }
+
+def _requests_analytics(db, FROM, TO, check = None):
+    states = {}
+    waits = []
+    for (state, timestamp_created, timestamp_state) in reports._query_iterator(db, "select state, timestamp_created, timestamp_state from requests where timestamp_created >= %d and timestamp_created <= %d" % (FROM, TO), check = check):
+        state = _REQUEST_STATES.get(state, str(state))
+        states[state] = states.get(state, 0) + 1
+        if state == _REQUEST_STATES[Request.SERVED]:
+            waits.append(timestamp_state - timestamp_created)
+    return { "count": sum(states.values()), "states": states, "wait_served": percentiles(waits) }
+
+def get_analytics(connection_string, FROM, TO, power_model = None, per_host = False, check = None):
+    # Computes the energy and utilization metrics of the hosts and the requests in the window [FROM, TO] (the same than in
+    #   reports.get_reports_data), in a single pass over the events of the hosts. Each event lasts until the next event of the
+    #   host or the end of the window; for the information that has been rolled up, the precision is the interval of the rollups.
+    #   If check is not None, it is called while the information is read (see reports._query_iterator).
+    if power_model is None:
+        power_model = PowerModel.create_from_config()
+
+    db = cpyutils.db.DB.create_from_string(connection_string)
+    FROM_h, TO_h, min_timestamp, max_timestamp, rollup_to = reports._get_reports_window(db, FROM, TO)
+
+    hosts = {}
+    latencies = []
+    current = None
+    for name, event in reports._host_events(db, FROM_h, TO_h, rollup_to, 0, check):
+        if (current is None) or (current.name != name):
+            if current is not None:
+                current.end(TO_h)
+            current = _HostAnalytics(name, power_model)
+            hosts[name] = current
+        current.add(event, latencies)
+    if current is not None:
+        current.end(TO_h)
+
+    time = {}
+    energy = energy_baseline = slot_seconds = slot_seconds_used = 0.0
+    failed_power_ons = 0
+    for h in hosts.values():
+        for s, v in h.time.items():
+            time[s] = time.get(s, 0) + v
+        energy += h.energy
+        energy_baseline += h.energy_baseline
+        slot_seconds += h.slot_seconds
+        slot_seconds_used += h.slot_seconds_used
+        failed_power_ons += h.failed_power_ons
+
+    FROM_r, TO_r, _, _ = reports._get_requests_window(db, FROM, TO)
+    result = {
+        "from": FROM_h,
+        "to": TO_h,
+        "mintime_avail": min_timestamp,
+        "maxtime_avail": max_timestamp,
+        "hosts_count": len(hosts),
+        "node_hours": dict((_NODE_STATES.get(s, str(s)), v / 3600.0) for (s, v) in time.items()),
+        "node_hours_off": time.get(Node.OFF, 0) / 3600.0,
+        "energy_kwh": energy / 3600000.0,
+        "energy_baseline_kwh": energy_baseline / 3600000.0,
+        "energy_saved_kwh": (energy_baseline - energy) / 3600000.0,
+        "energy_saved_pct": 100.0 * (energy_baseline - energy) / energy_baseline if energy_baseline > 0 else 0.0,
+        "slot_utilization": slot_seconds_used / slot_seconds if slot_seconds > 0 else None,
+        "power_on_latency": percentiles(latencies),
+        "failed_power_ons": failed_power_ons,
+        "requests": _requests_analytics(db, FROM_r, TO_r, check)
+    }
+    if per_host:
+        result["hosts"] = dict((name, h.summary()) for (name, h) in hosts.items())
+    return result
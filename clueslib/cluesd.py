@@ -20,10 +20,16 @@ import cpyutils.db
 import cpyutils.eventloop
 import logging
 import time
+import threading
+import atexit
 from . import schedulers
 from . import helpers
 import collections
 from . import hooks
+from . import poweroperations
+from . import reports
+from . import snapshot
+from . import metrics
 from clues.configserver import _CONFIGURATION_MONITORING, _CONFIGURATION_CLUES
 from .node import Node, NodeList, NodeInfo
 from .request import JobList, RequestList, Request
@@ -41,6 +47,12 @@ class DBSystem_dummy(object):
     def store_node_info(self, host_data):
         if host_data.name not in self._hosts:
             self.enable_host(host_data.name, True)
+
+    def store_request_info(self, request):
+        pass
+
+    def update_request_info(self, request):
+        pass
     
     def retrieve_latest_monitoring_data(self):
         return None
@@ -48,6 +60,9 @@ class DBSystem_dummy(object):
     def get_hosts(self):
         return self._hosts
 
+    def flush(self):
+        return True
+
 class DBSystem(DBSystem_dummy):
     @staticmethod
     def create_from_connection_string(connection_string = None):
@@ -58,13 +73,42 @@ class DBSystem(DBSystem_dummy):
         else:
             return DBSystem(connection_string)
     
+    # The migrations of the schema of the database: each entry contains the sentences that upgrade the database from
+    #   one version to the next one (the version of the database is the number of migrations applied). The sentences
+    #   must be idempotent, because a migration that fails in the middle is applied again from the beginning. The indexes
+    #   are expressed as (name, table, columns), because MySQL does not support CREATE INDEX IF NOT EXISTS (see _create_index)
+    _MIGRATIONS = [
+        [
+            ("host_monitoring_name_timestamp", "host_monitoring", "name, timestamp"),
+            ("host_monitoring_timestamp_state", "host_monitoring", "timestamp_state"),
+            ("requests_timestamp_created", "requests", "timestamp_created"),
+        ],
+        [
+            # The latest monitoring data of each host, to avoid looking for it in the whole host_monitoring table
+            "CREATE TABLE IF NOT EXISTS host_latest(name varchar(128) PRIMARY KEY, timestamp_state INTEGER, slots_count INTEGER, slots_free INTEGER, memory_total INTEGER, memory_free INTEGER, state INTEGER, timestamp INTEGER)",
+            "REPLACE INTO host_latest SELECT name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp FROM host_monitoring WHERE x IN (SELECT max(x) FROM host_monitoring GROUP BY name)",
+        ],
+    ]
+    # The version of the schema from which the table host_latest is available
+    _HOST_LATEST_VERSION = 2
+
     def __init__(self, connection_string):
         self._connection_string = connection_string
         self._db = cpyutils.db.DB.create_from_string(connection_string)
+        self._schema_version = 0
         self._create_db()
+        self._migrate_db()
         self._hosts = collections.OrderedDict()
         self._get_hosts()
 
+        # The monitoring information and the new requests are not inserted one by one, but they are buffered and
+        #   inserted in a single transaction (when the buffer is full, each DB_WRITE_BUFFER_PERIOD seconds or at exit)
+        self._buffer_lock = threading.Lock()
+        self._host_monitoring_rows = []
+        self._requests_rows = []
+        self._timestamp_flush = cpyutils.eventloop.now()
+        atexit.register(self.flush)
+
     def _get_hosts(self):
         result, row_count, rows = self._db.sql_query("SELECT name, enabled from hostdata")
         _hosts = collections.OrderedDict()
@@ -82,6 +126,54 @@ class DBSystem(DBSystem_dummy):
         result3, _, _ = self._db.sql_query("CREATE TABLE IF NOT EXISTS requests(reqid varchar, timestamp_created INTEGER, timestamp_state INTEGER, state INTEGER, slots INTEGER, memory INTEGER, expressions varchar, taskcount INTEGER, maxtaskspernode INTEGER, jobid varchar, nodes varchar, x INTEGER PRIMARY KEY)", True)
         return (result1 and result2 and result3)
 
+    def _migrate_db(self):
+        result, _, rows = self._db.sql_query("SELECT version FROM schema_version")
+        if (not result) or (len(rows) == 0):
+            self._db.sql_query("CREATE TABLE IF NOT EXISTS schema_version(version INTEGER)", True)
+            self._db.sql_query("INSERT INTO schema_version VALUES (0)", True)
+            version = 0
+        else:
+            version = int(rows[0][0])
+        self._schema_version = version
+
+        # If a migration fails, the database keeps the previous version (and CLUES works with it); the migration will be
+        #   applied again the next time that CLUES starts
+        while version < len(DBSystem._MIGRATIONS):
+            _LOGGER.info("upgrading the schema of the database to version %d" % (version + 1))
+            for sql in DBSystem._MIGRATIONS[version]:
+                try:
+                    if isinstance(sql, tuple):
+                        result = self._create_index(*sql)
+                        sql = "CREATE INDEX %s ON %s(%s)" % sql
+                    else:
+                        result, _, _ = self._db.sql_query(sql, True)
+                    error = "the sentence failed"
+                except Exception as e:
+                    result, error = False, str(e)
+                if not result:
+                    _LOGGER.error("could not upgrade the schema of the database to version %d (%s): %s" % (version + 1, error, sql))
+                    return False
+            version += 1
+            result, _, _ = self._db.sql_query("UPDATE schema_version SET version = %d" % version, True)
+            if not result:
+                _LOGGER.error("could not set the version of the schema of the database to %d" % version)
+                return False
+            self._schema_version = version
+        return True
+
+    def _create_index(self, name, table, columns):
+        # Creates the index unless it already exists
+        if isinstance(self._db, cpyutils.db.DB_mysql):
+            result, _, rows = self._db.sql_query("SELECT index_name FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = '%s' AND index_name = '%s'" % (table, name))
+        else:
+            result, _, rows = self._db.sql_query("SELECT name FROM sqlite_master WHERE type = 'index' AND name = '%s'" % name)
+        if not result:
+            return False
+        if len(rows) > 0:
+            return True
+        result, _, _ = self._db.sql_query("CREATE INDEX %s ON %s(%s)" % (name, table, columns), True)
+        return result
+
     def enable_host(self, host, enable = True):
         if not self._get_hosts(): return False
         
@@ -94,49 +186,106 @@ class DBSystem(DBSystem_dummy):
             self._hosts[ host ] = enable
         return result
 
+    def _connect(self):
+        # Gets a connection to the database that supports parameterized queries (cpyutils.db only accepts plain sql sentences)
+        connection, placeholder = helpers.raw_connection(self._db)
+        if connection is None:
+            raise Exception("unsupported database type for connection string %s" % self._connection_string)
+        return connection, placeholder
+
+    def _executemany(self, sentences):
+        # Executes a list of (sql, rows) in a single transaction. The sql uses ? as placeholder for the values
+        connection = None
+        try:
+            connection, placeholder = self._connect()
+            cursor = connection.cursor()
+            for sql, rows in sentences:
+                if len(rows) > 0:
+                    cursor.executemany(sql.replace("?", placeholder), rows)
+            connection.commit()
+            return True
+        except Exception as e:
+            _LOGGER.error("could not write the information to the database: %s" % str(e))
+            return False
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def flush(self):
+        with self._buffer_lock:
+            self._timestamp_flush = cpyutils.eventloop.now()
+            if (len(self._host_monitoring_rows) == 0) and (len(self._requests_rows) == 0):
+                return True
+
+            # Only the last row of each host is needed to update the latest information
+            host_latest_rows = []
+            if self._schema_version >= DBSystem._HOST_LATEST_VERSION:
+                host_latest_rows = list(collections.OrderedDict([ (row[0], row) for row in self._host_monitoring_rows ]).values())
+
+            result = self._executemany([
+                ("INSERT INTO host_monitoring(name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._host_monitoring_rows),
+                ("REPLACE INTO host_latest(name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", host_latest_rows),
+                ("INSERT INTO requests(reqid, timestamp_created, timestamp_state, state, slots, memory, expressions, taskcount, maxtaskspernode, jobid, nodes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._requests_rows)
+            ])
+
+            # If the information could not be written, we will try it again in the next flush
+            if result:
+                self._host_monitoring_rows = []
+                self._requests_rows = []
+            return result
+
+    def _flush_if_needed(self):
+        now = cpyutils.eventloop.now()
+        with self._buffer_lock:
+            pending = len(self._host_monitoring_rows) + len(self._requests_rows)
+            should_flush = (pending >= _CONFIGURATION_CLUES.DB_WRITE_BUFFER_SIZE) or (now - self._timestamp_flush >= _CONFIGURATION_CLUES.DB_WRITE_BUFFER_PERIOD)
+        if should_flush:
+            self.flush()
+
     def store_node_info(self, host_data):
         now = cpyutils.eventloop.now()
-        result, _, _ = self._db.sql_query("INSERT INTO host_monitoring(name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp) VALUES (\"%s\", %s, %s, %s, %s, %s, %s, %s)" % \
-                                          ( host_data.name, \
-                                           host_data.timestamp_state, \
-                                           host_data.slots_count, \
-                                           host_data.slots_free, \
-                                           host_data.memory_total, \
-                                           host_data.memory_free, \
-                                           host_data.state, \
-                                           now \
-                                           )\
-                                          , True)
+        with self._buffer_lock:
+            self._host_monitoring_rows.append((host_data.name, host_data.timestamp_state, host_data.slots_count, host_data.slots_free, host_data.memory_total, host_data.memory_free, host_data.state, now))
+        self._flush_if_needed()
         
         if host_data.name not in self._hosts:
             self.enable_host(host_data.name, True)
 
     def store_request_info(self, request):
         import json
-        result, _, _ = self._db.sql_query("INSERT INTO requests(reqid, timestamp_created, timestamp_state, state, slots, memory, expressions, taskcount, maxtaskspernode, jobid, nodes) VALUES (\"%s\", %s, %s, %d, %d, %d, '%s', %d, %d, \"%s\", '%s')" % \
-        (request.id, \
-        request.timestamp_created, \
-        request.timestamp_state, \
-        request.state, \
-        request.resources.resources.slots, \
-        request.resources.resources.memory, \
-        json.dumps(request.resources.resources.requests), \
-        request.resources.taskcount, \
-        request.resources.maxtaskspernode, \
-        request.job_id if request.job_id is not None else "null", \
-        json.dumps(request.job_nodes_ids)), True)
-        return result
+        with self._buffer_lock:
+            self._requests_rows.append((str(request.id), \
+            request.timestamp_created, \
+            request.timestamp_state, \
+            int(request.state), \
+            int(request.resources.resources.slots), \
+            int(request.resources.resources.memory), \
+            json.dumps(request.resources.resources.requests), \
+            int(request.resources.taskcount), \
+            int(request.resources.maxtaskspernode), \
+            str(request.job_id) if request.job_id is not None else "null", \
+            json.dumps(request.job_nodes_ids)))
+        self._flush_if_needed()
+        return True
 
     def update_request_info(self, request):
+        # The request may be still in the buffer
+        self.flush()
         result, _, _ = self._db.sql_query("UPDATE requests SET timestamp_state = %d, state = %d WHERE reqid = \"%s\"" % \
         ( request.timestamp_state, request.state, request.id ), True)
         return result
 
     def retrieve_latest_monitoring_data(self):
-        result, row_count, rows = self._db.sql_query("select max(timestamp), m.*, d.enabled from host_monitoring as m left join hostdata as d on m.name=d.name group by m.name")
+        self.flush()
+        if self._schema_version >= DBSystem._HOST_LATEST_VERSION:
+            result, row_count, rows = self._db.sql_query("select m.*, d.enabled from host_latest as m left join hostdata as d on m.name=d.name order by m.name")
+        else:
+            # The database could not be upgraded, so the latest data is searched in the whole host_monitoring table (the last
+            #   row inserted for each host)
+            result, row_count, rows = self._db.sql_query("select m.name, m.timestamp_state, m.slots_count, m.slots_free, m.memory_total, m.memory_free, m.state, m.timestamp, d.enabled from host_monitoring as m join (select max(x) as x from host_monitoring group by name) as l on m.x = l.x left join hostdata as d on m.name = d.name order by m.name")
         _nodes = collections.OrderedDict()
         if result:
-            for (timestamp, name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, _, _, enabled) in rows:
+            for (name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp, enabled) in rows:
                 n = Node(name, slots_count, slots_free, memory_total, memory_free)
                 n.state = state
                 # int is suggested by 2to3; will accept
@@ -212,21 +361,38 @@ class CluesDaemon:
         self._timestamp_mark = cpyutils.eventloop.now()
         
         self._db_system = DBSystem.create_from_connection_string()
+        self._compact_pending = False
+
+        # The lock protects the information about the nodes, the jobs and the requests: the event loop holds it while it updates
+        #   them, and the calls that come from other threads (e.g. the RPC server) hold it to read or modify them
+        self._lock = threading.RLock()
+        self._snapshots = snapshot.SnapshotPublisher()
+
+        self._power_executor = None
+        if schedulers.config_scheduling.POWER_OPERATIONS_WORKERS > 0:
+            self._power_executor = poweroperations.PowerOperationsExecutor(schedulers.config_scheduling.POWER_OPERATIONS_WORKERS, poweroperations.parse_plugin_concurrency(schedulers.config_scheduling.POWER_OPERATIONS_PLUGIN_CONCURRENCY))
+
+    def _publish_snapshot(self):
+        # Publishes the current state for the readers in other threads (it must be called holding the lock)
+        jobs = None
+        if self._lrms_joblist is not None:
+            jobs = list(self._lrms_joblist)
+        return self._snapshots.publish(self._lrms_nodelist, list(self._requests_queue), jobs, self._timestamp_nodelist, self._timestamp_joblist, cpyutils.eventloop.now())
+
+    def get_snapshot(self):
+        # Gets the last snapshot of the state (see snapshot.StateSnapshot); it is not copied, so it is the preferred way to read
+        #   the state from other threads
+        return self._snapshots.get()
 
     def get_nodelist(self):
-        if self._lrms_nodelist is not None:
-            return NodeList(self._lrms_nodelist)
-        return NodeList(collections.OrderedDict())
+        return self.get_snapshot().get_nodelist()
 
     def get_node(self, nname):
-        if self._lrms_nodelist is None:
-            return None
-        if nname in self._lrms_nodelist:
-            return self._lrms_nodelist[nname]
-        return None
+        return self.get_snapshot().get_node(nname)
 
     def get_monitoring_info(self):
-        return MonitoringInfo(NodeList(self._lrms_nodelist), self._timestamp_nodelist, self._lrms_joblist, self._timestamp_joblist)
+        with self._lock:
+            return MonitoringInfo(NodeList(collections.OrderedDict(self._lrms_nodelist or {})), self._timestamp_nodelist, self._lrms_joblist, self._timestamp_joblist)
 
     def _update_disabled_nodes(self):
         _update_enable_status_for_nodes(self._lrms_nodelist, self._db_system.get_hosts())
@@ -234,27 +400,72 @@ class CluesDaemon:
     def request(self, request):
         hooks.HOOKS.request(request)
         self._db_system.store_request_info(request)
-        self._requests_queue.append(request)
+        with self._lock:
+            self._requests_queue.append(request)
+            self._publish_snapshot()
         _LOGGER.debug("new request: %s" % request)
         # cpyutils.eventloop.get_eventloop().add_event(schedulers.config_scheduling.PERIOD_SCHEDULE, "CONTROL EVENT - the request will be scheduled", stealth = True)
         return request.id
     
+    def request_many(self, requests):
+        # Queues a batch of requests: the hook is invoked once for each group of equal requests, and they are stored in the
+        #   database in a single write
+        hooks.HOOKS.requests(requests)
+        for request in requests:
+            self._db_system.store_request_info(request)
+        with self._lock:
+            for request in requests:
+                self._requests_queue.append(request)
+            self._publish_snapshot()
+        _LOGGER.debug("%d new requests: %s" % (len(requests), ", ".join([ str(r.id) for r in requests ])))
+        return [ r.id for r in requests ]
+
     def get_requests_list(self):
-        return self._requests_queue
+        # The list is created from the last snapshot, because the iteration over a RequestList cannot be shared between threads
+        return RequestList(list(self.get_snapshot().requests.values()))
     
     def get_job_list(self):
-        return self._lrms_joblist
+        return JobList(list(self.get_snapshot().jobs.values()))
     
     def request_in_queue(self, r_id):
-        req = self._requests_queue.get_by_id(r_id)
+        req = self.get_snapshot().get_request(r_id)
         if req is None:
             return False
-        if req.state in [ Request.SERVED, Request.NOT_SERVED, Request.DISSAPEARED ]:
+        if req.state in Request.FINAL_STATES:
             return False
         return True
 
+    def request_wait(self, r_id, timeout = None):
+        # Waits until the request is not in the queue anymore (see request_in_queue), or the timeout expires; returns True if the
+        #   request is not in the queue (the copies of the requests in the snapshots are woken up as the original requests)
+        req = self.get_snapshot().get_request(r_id)
+        if req is None:
+            return True
+        return req.wait_finished(timeout)
+
+    def request_wait_many(self, r_ids, timeout = None):
+        # Waits until all the requests are not in the queue anymore, or the timeout expires (for the whole set of requests);
+        #   returns whether each request is not in the queue
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        result = []
+        for r_id in r_ids:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.time())
+            result.append(self.request_wait(r_id, remaining))
+        return result
+
     def _monitor_lrms_nodes(self):
-        lrms_nodelist = self._platform.get_nodeinfolist()
+        # The information is obtained from the platform out of the lock, so that the other threads are not blocked by the LRMS
+        with metrics.LOOP_SECONDS.time(("monitor_nodes", )):
+            lrms_nodelist = self._platform.get_nodeinfolist()
+            with self._lock:
+                self._update_lrms_nodes(lrms_nodelist)
+                self._publish_snapshot()
+
+    def _update_lrms_nodes(self, lrms_nodelist):
         now = cpyutils.eventloop.now()
         
         if lrms_nodelist is None:
@@ -330,7 +541,13 @@ class CluesDaemon:
             self._db_system.store_node_info(self._lrms_nodelist[n_id])
                         
     def _monitor_lrms_jobs(self):
-        lrms_jobinfolist = self._platform.get_jobinfolist()
+        with metrics.LOOP_SECONDS.time(("monitor_jobs", )):
+            lrms_jobinfolist = self._platform.get_jobinfolist()
+            with self._lock:
+                self._update_lrms_jobs(lrms_jobinfolist)
+                self._publish_snapshot()
+
+    def _update_lrms_jobs(self, lrms_jobinfolist):
         now = cpyutils.eventloop.now()
         
         if lrms_jobinfolist is None:
@@ -433,97 +650,235 @@ class CluesDaemon:
                 
     def enable_host(self, n_id, enable = True):
         # TODO: currently we do not allow to enable or disable a host that has not been monitored, but if one node dissapears, it will be enabled (or disabled) forever in the DB
-        if n_id in self._lrms_nodelist:
-            self._db_system.enable_host(n_id, enable)
-            self._update_disabled_nodes()
-            return True, ""
-        else:
-            return False, "Node %s does not exist" % n_id
+        with self._lock:
+            if n_id in self._lrms_nodelist:
+                self._db_system.enable_host(n_id, enable)
+                self._update_disabled_nodes()
+                self._publish_snapshot()
+                return True, ""
+            else:
+                return False, "Node %s does not exist" % n_id
 
     def reset_node_state(self, n_id):
-        if n_id in self._lrms_nodelist:
-            node = self._lrms_nodelist[n_id]
+        with self._lock:
+            if n_id in self._lrms_nodelist:
+                node = self._lrms_nodelist[n_id]
 
-            _LOGGER.debug("Resetting the state of the node %s to %s" % (n_id, node.state2str[node.IDLE]))
+                _LOGGER.debug("Resetting the state of the node %s to %s" % (n_id, node.state2str[node.IDLE]))
 
-            node.set_state(Node.IDLE, True)
+                node.set_state(Node.IDLE, True)
+                self._db_system.store_node_info(node)
+                self._publish_snapshot()
+                return True, "Node %s reset to %s" % (n_id, node.state2str[node.state])
+            else:
+                return False, "Node is not managed by CLUES"
+
+    def _check_power_off(self, n_id, force = False):
+        # Checks whether the node can be powered off. Returns None if it can be powered off or the result of power_off otherwise
+        if n_id not in self._lrms_nodelist:
+            return False, ""
+
+        node = self._lrms_nodelist[n_id]
+        if (not node.enabled) and (not force):
+            _LOGGER.warning("node %s cannot be powered off because is disabled" % n_id)
+            return False, ""
+
+        if node.state in [ Node.OFF, Node.POW_OFF, Node.OFF_ERR ]:
+            _LOGGER.warning("the node is already OFF or it is being powered off")
+            return True, n_id
+
+        return None
+
+    def _run_power_off(self, n_id):
+        # Runs the power off operation in the platform (it does not modify the information about the node, so it can be run out of the event loop)
+        hooks.HOOKS.pre_poweroff(n_id)
+        return self._platform.power_off(n_id)
+
+    def _apply_power_off(self, n_id, success, nname):
+        # Updates the state of the node according to the result of the power off operation
+        node = self._lrms_nodelist[n_id]
+        if success:
+            if nname != n_id:
+                _LOGGER.warning("tried to power off %s but LRMS powered off %s" % (n_id, nname))
+                n_id = nname
+                node = self._lrms_nodelist[n_id]
+
+            node.set_state(Node.POW_OFF)
             self._db_system.store_node_info(node)
-            return True, "Node %s reset to %s" % (n_id, node.state2str[node.state])
+            hooks.HOOKS.post_poweroff(n_id, 1, nname)
+
+            return True, n_id
         else:
-            return False, "Node is not managed by CLUES"
+            _LOGGER.warning("could not power off node %s. It will be considered ON, but with errors" % n_id)
+            node.set_state(Node.POW_OFF)
+            hooks.HOOKS.post_poweroff(n_id, 0, nname)
+
+            node.set_state(Node.ON_ERR)
+            self._db_system.store_node_info(node)
+            return False, ""
 
     def power_off(self, n_id, force = False):
-        if n_id in self._lrms_nodelist:
-            node = self._lrms_nodelist[n_id]
-            
-            if (not node.enabled) and (not force):
-                _LOGGER.warning("node %s cannot be powered off because is disabled" % n_id)
-                return False, ""
-            
-            if node.state in [ Node.OFF, Node.POW_OFF, Node.OFF_ERR ]:
-                _LOGGER.warning("the node is already OFF or it is being powered off")
-                return True, n_id
-
-            hooks.HOOKS.pre_poweroff(n_id)
-            success, nname = self._platform.power_off(n_id)
-            if success:
-                if nname != n_id:
-                    _LOGGER.warning("tried to power off %s but LRMS powered off %s" % (n_id, nname))
-                    n_id = nname
-                    node = self._lrms_nodelist[n_id]
-
-                node.set_state(Node.POW_OFF)
-                self._db_system.store_node_info(node)
-                hooks.HOOKS.post_poweroff(n_id, 1, nname)
+        # The command is run out of the lock (if it is called from out of the event loop)
+        with self._lock:
+            result = self._check_power_off(n_id, force)
+        if result is not None:
+            return result
+
+        success, nname = self._run_power_off(n_id)
+        with self._lock:
+            result = self._apply_power_off(n_id, success, nname)
+            self._publish_snapshot()
+            return result
+
+    def _check_power_on(self, n_id, force = False):
+        # Checks whether the node can be powered on. Returns None if it can be powered on or the result of power_on otherwise
+        if n_id not in self._lrms_nodelist:
+            return False, ""
 
-                return True, n_id
-            else:
-                _LOGGER.warning("could not power off node %s. It will be considered ON, but with errors" % n_id)
-                node.set_state(Node.POW_OFF)
-                hooks.HOOKS.post_poweroff(n_id, 0, nname)
+        node = self._lrms_nodelist[n_id]
+        if (not node.enabled) and (not force):
+            _LOGGER.warning("node %s cannot be powered on because is disabled" % n_id)
+            return False, ""
 
-                node.set_state(Node.ON_ERR)
-                self._db_system.store_node_info(node)
-                return False, ""
+        if node.state in [ Node.IDLE, Node.USED, Node.POW_ON, Node.ON_ERR ]:
+            _LOGGER.warning("the node is already ON or it is being powered on")
+            return True, n_id
+
+        return None
+
+    def _run_power_on(self, n_id):
+        # Runs the power on operation in the platform (it does not modify the information about the node, so it can be run out of the event loop)
+        hooks.HOOKS.pre_poweron(n_id)
+        return self._platform.power_on(n_id)
+
+    def _apply_power_on(self, n_id, success, nname):
+        # Updates the state of the node according to the result of the power on operation
+        node = self._lrms_nodelist[n_id]
+        if success:
+            if nname != n_id:
+                _LOGGER.warning("tried to power on %s but LRMS powered on %s" % (n_id, nname))
+                n_id = nname
+                node = self._lrms_nodelist[n_id]                
+
+            node.set_state(Node.POW_ON)
+            self._db_system.store_node_info(node)
+            hooks.HOOKS.post_poweron(n_id, 1, nname)
+            return True, n_id
         else:
+            _LOGGER.warning("could not power on node %s. It will be considered OFF, but with errors" % n_id)
+            node.set_state(Node.POW_ON)
+            hooks.HOOKS.post_poweron(n_id, 0, nname)
+
+            node.set_state(Node.OFF_ERR)
+            self._db_system.store_node_info(node)
             return False, ""
 
     def power_on(self, n_id, force = False):
-        if n_id in self._lrms_nodelist:
-            node = self._lrms_nodelist[n_id]
+        # The command is run out of the lock (if it is called from out of the event loop)
+        with self._lock:
+            result = self._check_power_on(n_id, force)
+        if result is not None:
+            return result
+
+        success, nname = self._run_power_on(n_id)
+        with self._lock:
+            result = self._apply_power_on(n_id, success, nname)
+            self._publish_snapshot()
+            return result
+
+    def _dispatch_power_operation(self, n_id, operation):
+        # Powers on or off the node; if there is a pool of workers for the power operations, the operation is run in the
+        #   pool and its result will be applied once it finishes (in _apply_power_operations)
+        if self._power_executor is None:
+            if operation == "power_on":
+                self.power_on(n_id)
+            else:
+                self.power_off(n_id)
+            return
 
-            if (not node.enabled) and (not force):
-                _LOGGER.warning("node %s cannot be powered on because is disabled" % n_id)
-                return False, ""
+        pending = self._power_executor.pending(n_id)
+        if (len(pending) > 0) and (pending[-1] == operation):
+            # The node is already being powered on (or off), so the state of the node is not updated yet
+            return
 
-            if node.state in [ Node.IDLE, Node.USED, Node.POW_ON, Node.ON_ERR ]:
-                _LOGGER.warning("the node is already ON or it is being powered on")
-                return True, n_id
-            
-            hooks.HOOKS.pre_poweron(n_id)
-            success, nname = self._platform.power_on(n_id)
-            if success:
-                if nname != n_id:
-                    _LOGGER.warning("tried to power on %s but LRMS powered on %s" % (n_id, nname))
-                    n_id = nname
-                    node = self._lrms_nodelist[n_id]                
-                
-                node.set_state(Node.POW_ON)
-                self._db_system.store_node_info(node)
-                hooks.HOOKS.post_poweron(n_id, 1, nname)
-                return True, n_id
+        if len(pending) == 0:
+            if operation == "power_on":
+                result = self._check_power_on(n_id)
             else:
-                _LOGGER.warning("could not power on node %s. It will be considered OFF, but with errors" % n_id)
-                node.set_state(Node.POW_ON)
-                hooks.HOOKS.post_poweron(n_id, 0, nname)
+                result = self._check_power_off(n_id)
+            if result is not None:
+                return
 
-                node.set_state(Node.OFF_ERR)
-                self._db_system.store_node_info(node)
-                return False, ""
+        if operation == "power_on":
+            function = self._run_power_on
         else:
-            return False, ""
+            function = self._run_power_off
+        power_operation = poweroperations.PowerOperation(n_id, operation, self._platform.get_power_manager_id(), function, [ n_id ])
+        node = self._lrms_nodelist[n_id]
+        power_operation.previous_state = (node.state, node.timestamp_state)
+        if self._power_executor.submit(power_operation):
+            # The node is set in the transitional state when the operation is submitted (as in the sequential mode), so that the
+            #   schedulers do not use a node that is being powered off, nor count as missing a node that is being powered on
+            self._set_transitional_state(node, operation)
+
+    def _set_transitional_state(self, node, operation):
+        if operation == "power_on":
+            node.set_state(Node.POW_ON)
+        else:
+            node.set_state(Node.POW_OFF)
+
+    def _apply_power_operations(self):
+        # Updates the nodes according to the results of the power operations that have finished (it is called from the event loop)
+        if self._power_executor is None:
+            return
+
+        for operation in self._power_executor.get_finished():
+            if operation.n_id not in self._lrms_nodelist:
+                _LOGGER.warning("node %s is not monitored anymore, so the result of the operation %s is ignored" % (operation.n_id, operation.operation))
+                continue
+
+            success, nname = False, operation.n_id
+            if operation.result is not None:
+                success, nname = operation.result
+
+            if operation.operation == "power_on":
+                self._apply_power_on(operation.n_id, success, nname)
+            else:
+                self._apply_power_off(operation.n_id, success, nname)
+
+            node = self._lrms_nodelist[operation.n_id]
+            if success and (nname != operation.n_id) and (operation.previous_state is not None):
+                # The plugin powered on (or off) other node, so this node gets back the state that it had when the operation
+                #   was submitted
+                node.state, node.timestamp_state = operation.previous_state
+
+            # If there are more operations for the node, it keeps the transitional state of the last one
+            pending = self._power_executor.pending(operation.n_id)
+            if len(pending) > 0:
+                self._set_transitional_state(node, pending[-1])
+
+    def _compact_db(self):
+        # Rolls up the monitoring information that is older than the retention time. As it runs in the event loop, only a few
+        #   chunks are rolled up each time, and the rest are rolled up in the next lifecycles
+        if _CONFIGURATION_CLUES.DB_CONNECTION_STRING.strip() == "":
+            return
+        self._db_system.flush()
+        try:
+            summary = reports.compact(_CONFIGURATION_CLUES.DB_CONNECTION_STRING, _CONFIGURATION_CLUES.DB_RETENTION_DAYS * 86400.0, _CONFIGURATION_CLUES.DB_ROLLUP_INTERVAL, cpyutils.eventloop.now(), max(1, _CONFIGURATION_CLUES.DB_COMPACT_CHUNKS))
+            if summary["intervals"] > 0:
+                _LOGGER.info("compacted %d intervals of monitoring information (%d rows for hosts, %d rows for requests)" % (summary["intervals"], summary["host_rows"], summary["requests_rows"]))
+            if summary["pending"] and not self._compact_pending:
+                self._compact_pending = True
+                cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event(_CONFIGURATION_MONITORING.PERIOD_LIFECYCLE, description = "compacting the database (pending)", callback = self._compact_db_pending, parameters = [], mute = True))
+        except Exception as e:
+            _LOGGER.error("failed to compact the database: %s" % str(e))
+
+    def _compact_db_pending(self):
+        self._compact_pending = False
+        self._compact_db()
 
     def _schedulers_pipeline(self):
+        self._apply_power_operations()
         self._purge_served_requests()
         now = cpyutils.eventloop.now()
         
@@ -544,7 +899,9 @@ class CluesDaemon:
         monitoring_info = MonitoringInfo(nodelist, self._timestamp_nodelist, self._lrms_joblist, self._timestamp_joblist)
         for scheduler in self._schedulers:
             existing_requests = [x for x in self._requests_queue.get_list() ]
-            if not scheduler.schedule(self._requests_queue, monitoring_info, candidates_on, candidates_off):
+            with metrics.SCHEDULE_SECONDS.time((scheduler.__class__.__name__, )):
+                scheduled = scheduler.schedule(self._requests_queue, monitoring_info, candidates_on, candidates_off)
+            if not scheduled:
                 _LOGGER.error("failed to schedule with scheduler %s" % str(scheduler))
             new_requests = [ x for x in self._requests_queue.get_list() if x not in existing_requests ]
             for r in new_requests:
@@ -553,11 +910,11 @@ class CluesDaemon:
         if len(candidates_off) > 0:
             _LOGGER.info("nodes %s are considered to be powered off" % str(candidates_off))            
             for n_id in candidates_off:
-                self.power_off(n_id)                    
+                self._dispatch_power_operation(n_id, "power_off")
         if len(candidates_on) > 0:
             _LOGGER.info("nodes %s are considered to be powered on" % str(list(candidates_on.keys())))
             for n_id in candidates_on:
-                self.power_on(n_id)
+                self._dispatch_power_operation(n_id, "power_on")
 
     def __str__(self):
         retval = ""
@@ -587,6 +944,17 @@ class CluesDaemon:
         if len(recoverable_nodes) > 0:
             _LOGGER.debug("have tried to recover nodes %s" % recoverable_nodes)
 
+    def _locked(self, callback, task):
+        # Returns a function that calls the callback holding the lock, and publishes the new state (it is used for the events of the
+        #   loop); the time spent is recorded in the metrics for the task
+        def _callback(*args):
+            with metrics.LOOP_SECONDS.time((task, )):
+                with self._lock:
+                    result = callback(*args)
+                    self._publish_snapshot()
+                    return result
+        return _callback
+
     def loop(self, real_time_mode = True):
         should_monitor_nodes = True
         if _CONFIGURATION_MONITORING.PERIOD_MONITORING_JOBS > 0:
@@ -602,8 +970,15 @@ class CluesDaemon:
         if should_monitor_nodes:
             cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event_Periodical(0, _CONFIGURATION_MONITORING.PERIOD_MONITORING_NODES, description = "monitoring nodes", callback = self._monitor_lrms_nodes, parameters = [], mute = True))
 
-        cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event_Periodical(0, schedulers.config_scheduling.PERIOD_SCHEDULE, description = "scheduling", callback = self._schedulers_pipeline, parameters = [], mute = True))
+        cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event_Periodical(0, schedulers.config_scheduling.PERIOD_SCHEDULE, description = "scheduling", callback = self._locked(self._schedulers_pipeline, "schedulers_pipeline"), parameters = [], mute = True))
         cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event_Periodical(0, _CONFIGURATION_MONITORING.PERIOD_LIFECYCLE, description = "lifecycle", callback = self._platform.lifecycle, parameters = [], mute = True))
-        cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event_Periodical(0, schedulers.config_scheduling.PERIOD_RECOVERY_NODES, description = "recovery of nodes", callback = self._auto_recover_nodes, parameters = [], mute = True))
+        cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event_Periodical(0, schedulers.config_scheduling.PERIOD_RECOVERY_NODES, description = "recovery of nodes", callback = self._locked(self._auto_recover_nodes, "recover_nodes"), parameters = [], mute = True))
+        if self._power_executor is not None:
+            cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event_Periodical(0, schedulers.config_scheduling.PERIOD_POWER_OPERATIONS_RESULTS, description = "results of the power operations", callback = self._locked(self._apply_power_operations, "power_operations_results"), parameters = [], mute = True))
+
+        cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event_Periodical(0, _CONFIGURATION_CLUES.DB_WRITE_BUFFER_PERIOD, description = "flushing the database buffer", callback = self._db_system.flush, parameters = [], mute = True))
+        if _CONFIGURATION_CLUES.DB_RETENTION_DAYS > 0:
+            cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event_Periodical(0, _CONFIGURATION_CLUES.PERIOD_DB_COMPACT, description = "compacting the database", callback = self._compact_db, parameters = [], mute = True))
 
         cpyutils.eventloop.get_eventloop().loop()
+        self._db_system.flush()
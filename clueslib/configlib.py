@@ -24,6 +24,12 @@ except:
         {
             "LOGGER_MARK": 1800.0,
             "DB_CONNECTION_STRING": "sqlite:///var/lib/clues2/clues.db",
+            "DB_WRITE_BUFFER_SIZE": 500,
+            "DB_WRITE_BUFFER_PERIOD": 5.0,
+            "DB_RETENTION_DAYS": 0,
+            "DB_ROLLUP_INTERVAL": 3600,
+            "PERIOD_DB_COMPACT": 3600.0,
+            "DB_COMPACT_CHUNKS": 2,
             "DISABLED_HOSTS": "",
         })
 
@@ -69,6 +75,7 @@ except:
             # "COOLDOWN_DISSAPEARED_JOBS": 120,
             "COOLDOWN_SERVED_JOBS": 120.0,
             "COOLDOWN_SERVED_REQUESTS": 120.0,
+            "EXPRESSION_CACHE_SIZE": 1024,
         })
 
 class ConfigGeneral(cpyutils.config.Configuration):
@@ -103,7 +110,13 @@ except:
             "LOG_LEVEL":"debug",
             "LRMS_CLASS": "",
             "POWERMANAGER_CLASS":"",
-            "PATH_REPORTS_WEB": ""
+            "PATH_REPORTS_WEB": "",
+            "REPORTS_CACHE_SIZE": 8,
+            "RPC_WORKERS": 8,
+            "RPC_QUEUE_SIZE": 64,
+            "RPC_TIMEOUTS": "",
+            "RPC_MAX_WAITING": 256,
+            "METRICS_ENABLED": False
         },
         callback = ConfigGeneral.parseconfig
     )
@@ -20,6 +20,7 @@ import subprocess
 import string
 import random
 import cpyutils.evaluate
+import cpyutils.db
 import sys
 import types
 try:
@@ -101,6 +102,20 @@ class CommentlessFile(file):
             return ''
 '''
 
+def raw_connection(db):
+    # Opens a new connection to the database of a cpyutils.db object using the driver of the database (sqlite3 or MySQLdb), for
+    #   the things that cpyutils.db does not support (e.g. parameterized queries or server side cursors). It returns the
+    #   connection (that must be closed by the caller) and the placeholder of the parameters in the driver, or (None, None) if
+    #   the type of database is not supported. cpyutils.db does not expose the parameters of the connection, so this is the
+    #   only function that depends on its internals.
+    if isinstance(db, cpyutils.db.DB_sqlite):
+        import sqlite3
+        return sqlite3.connect(db._path), "?"
+    if isinstance(db, cpyutils.db.DB_mysql):
+        import MySQLdb
+        return MySQLdb.connect(host = db._host, port = db._port, user = db._user, passwd = db._passwd, db = db._dbname), "%s"
+    return None, None
+
 def get_server_proxy_from_cmdline(config_general):
     XMLRPC_SERVER = 'http://%s:%s/RPC2' %(config_general.CLUES_REMOTE_SERVER_HOST, config_general.CLUES_REMOTE_SERVER_PORT)
     
@@ -18,7 +18,9 @@
 import cpyutils.log
 import cpyutils.runcommand
 import os.path
+import collections
 from .configlib import _CONFIGURATION_HOOKS
+from . import metrics
 
 # cpyutils.log.Log.setup()
 
@@ -45,12 +47,14 @@ class HookSystem:
 
             _LOGGER.debug("hook %s is being invoked with parameters %s" % (command, parameters))
 
+            hook_name = os.path.basename(command)
             command = [ command ] + parameters
             timeout = _CONFIGURATION_HOOKS.TIMEOUT_COMMAND
-            if timeout is not None and timeout > 0:
-                result, output = cpyutils.runcommand.runcommand(command, timeout = timeout, cwd = workingfolder, shell = False)
-            else:
-                result, output = cpyutils.runcommand.runcommand(command, cwd = workingfolder, shell = False)
+            with metrics.HOOK_SECONDS.time((hook_name, )):
+                if timeout is not None and timeout > 0:
+                    result, output = cpyutils.runcommand.runcommand(command, timeout = timeout, cwd = workingfolder, shell = False)
+                else:
+                    result, output = cpyutils.runcommand.runcommand(command, cwd = workingfolder, shell = False)
 
             if result:
                 _LOGGER.debug("ouput of command %s:\n%s" % (command, output))
@@ -106,6 +110,22 @@ class HookSystem:
         requests_string = ';'.join(request.resources.resources.requests)
         parameters = (request.resources.resources.slots, request.resources.resources.memory, request.resources.taskcount, request.resources.maxtaskspernode, requests_string)
         return self._run_hook(_CONFIGURATION_HOOKS.REQUEST, str(request.id), *parameters)
+
+    def requests(self, requests):
+        # The hook is invoked once for each group of requests that need the same resources (e.g. the tasks of a job array),
+        #   and the ids of the requests in the group are passed as a comma separated list
+        groups = collections.OrderedDict()
+        for request in requests:
+            parameters = (request.resources.resources.slots, request.resources.resources.memory, request.resources.taskcount, request.resources.maxtaskspernode, ';'.join(request.resources.resources.requests))
+            if parameters not in groups:
+                groups[parameters] = []
+            groups[parameters].append(str(request.id))
+
+        result = True
+        for parameters, ids in groups.items():
+            if not self._run_hook(_CONFIGURATION_HOOKS.REQUEST, ",".join(ids), *parameters):
+                result = False
+        return result
 try:
     HOOKS
 except:
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import bisect
+import threading
+import time
+
+import cpyutils.log
+_LOGGER = cpyutils.log.Log("METRICS")
+
+# The metrics are exposed in the text format of Prometheus (that is also understood by the OpenMetrics scrapers). When the metrics
+#   are disabled (which is the default) nothing is recorded: the timers and the counters only check a flag, so the cost in the
+#   event loop is negligible.
+DEFAULT_BUCKETS = ( 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0 )
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+def _format_labels(names, values, extra = None):
+    pairs = [ "%s=\"%s\"" % (n, _escape(v)) for (n, v) in zip(names, values) ]
+    if extra is not None:
+        pairs.append("%s=\"%s\"" % extra)
+    if len(pairs) == 0:
+        return ""
+    return "{%s}" % ",".join(pairs)
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class _Metric(object):
+    _TYPE = None
+    def __init__(self, registry, name, documentation, labels = ()):
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _header(self):
+        return [ "# HELP %s %s" % (self.name, self.documentation), "# TYPE %s %s" % (self.name, self._TYPE) ]
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            lines.append("%s%s %s" % (self.name, _format_labels(self.labels, labelvalues), _format_value(value)))
+        return lines
+
+class Counter(_Metric):
+    _TYPE = "counter"
+    def inc(self, labelvalues = (), amount = 1):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+class Gauge(_Metric):
+    # The value of a gauge can be set, or it can be obtained when the metrics are rendered (if the gauge has a callback that returns
+    #   a dictionary { labelvalues: value }), so that the value does not need to be updated in the event loop
+    _TYPE = "gauge"
+    def __init__(self, registry, name, documentation, labels = (), callback = None):
+        _Metric.__init__(self, registry, name, documentation, labels)
+        self._callback = callback
+
+    def set(self, value, labelvalues = ()):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def render(self):
+        if self._callback is not None:
+            try:
+                values = self._callback()
+            except Exception as e:
+                _LOGGER.error("failed to get the value of metric %s (%s)" % (self.name, str(e)))
+                values = {}
+            with self._lock:
+                self._values = dict(values)
+        return _Metric.render(self)
+
+class Histogram(_Metric):
+    _TYPE = "histogram"
+    def __init__(self, registry, name, documentation, labels = (), buckets = DEFAULT_BUCKETS):
+        _Metric.__init__(self, registry, name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labelvalues = ()):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            # The counts are not cumulative while they are recorded (they are accumulated when rendered)
+            counts = self._values.get(labelvalues, None)
+            if counts is None:
+                counts = [ 0 ] * (len(self.buckets) + 1) + [ 0.0 ]
+                self._values[labelvalues] = counts
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def time(self, labelvalues = ()):
+        # Returns a context manager that observes the time spent in the block
+        return _Timer(self, labelvalues)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            values = sorted((k, list(v)) for (k, v) in self._values.items())
+        for labelvalues, counts in values:
+            accumulated = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                accumulated += count
+                lines.append("%s_bucket%s %d" % (self.name, _format_labels(self.labels, labelvalues, ("le", _format_value(float(bound)))), accumulated))
+            lines.append("%s_sum%s %s" % (self.name, _format_labels(self.labels, labelvalues), _format_value(counts[-1])))
+            lines.append("%s_count%s %d" % (self.name, _format_labels(self.labels, labelvalues), accumulated))
+        return lines
+
+class _Timer(object):
+    def __init__(self, histogram, labelvalues):
+        self._histogram = histogram
+        self._labelvalues = labelvalues
+        self._start = None
+
+    def __enter__(self):
+        if self._histogram._registry.enabled:
+            self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._start is not None:
+            self._histogram.observe(time.time() - self._start, self._labelvalues)
+        return False
+
+class Registry(object):
+    def __init__(self, enabled = False):
+        self.enabled = enabled
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels = ()):
+        return self._register(Counter(self, name, documentation, labels))
+
+    def gauge(self, name, documentation, labels = (), callback = None):
+        return self._register(Gauge(self, name, documentation, labels, callback))
+
+    def histogram(self, name, documentation, labels = (), buckets = DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labels, buckets))
+
+    def unregister(self, metric):
+        with self._lock:
+            if metric in self._metrics:
+                self._metrics.remove(metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+try:
+    REGISTRY
+except:
+    REGISTRY = Registry()
+
+# The metrics of the daemon
+LOOP_SECONDS = REGISTRY.histogram("clues_loop_task_seconds", "Time spent in the tasks of the event loop", [ "task" ])
+SCHEDULE_SECONDS = REGISTRY.histogram("clues_scheduler_seconds", "Time spent by each scheduler to schedule the requests", [ "scheduler" ])
+PLUGIN_SECONDS = REGISTRY.histogram("clues_plugin_call_seconds", "Time spent in the calls to the LRMS and power manager plugins", [ "plugin", "call" ])
+PLUGIN_ERRORS = REGISTRY.counter("clues_plugin_call_failures_total", "Number of calls to the plugins that have failed", [ "plugin", "call" ])
+POWER_OPERATIONS = REGISTRY.counter("clues_power_operations_total", "Number of power operations by result", [ "operation", "result" ])
+HOOK_SECONDS = REGISTRY.histogram("clues_hook_seconds", "Time spent running the hooks", [ "hook" ])
@@ -26,6 +26,7 @@ import sys
 from . import helpers
 import cpyutils.eventloop
 import collections
+import bisect
 from . import hooks
 
 import cpyutils.log
@@ -39,6 +40,67 @@ except:
     # but we are able to include new variables easily, to evaluate the expressions
     _annie = cpyutils.evaluate.Analyzer(autodefinevars=False)
 
+class _Expression():
+    # The result is stored for each node, only for the latest version of its keywords (so the results take as many entries as
+    #   nodes, and they are not evicted on large clusters)
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        self.trivial = (self.expression == "")
+        self._results = {}
+
+    def evaluate(self):
+        # Evaluates the expression using the variables that are currently set in the analyzer
+        if self.trivial:
+            return True
+        try:
+            res_check = _annie.check(self.expression)
+            if res_check.type == cpyutils.evaluate.TypedClass.BOOLEAN:
+                return res_check.get()
+        except:
+            pass
+        return False
+
+    def get_result(self, name, kw_version):
+        # Returns the result previously obtained for the node with the version of its keywords (or None if it has not been
+        #   evaluated yet)
+        version, result = self._results.get(name, (None, None))
+        if version != kw_version:
+            return None
+        return result
+
+    def set_result(self, name, kw_version, result):
+        self._results[name] = (kw_version, result)
+
+class _ExpressionCache():
+    # LRU cache that keeps the evaluators of the expressions, keyed by the expression string, so that the expressions
+    #   used by the requests do not need to be prepared again and the results for each node can be reused
+    def __init__(self):
+        self._expressions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, expression):
+        max_size = _CONFIGURATION_MONITORING.EXPRESSION_CACHE_SIZE
+        if max_size <= 0:
+            return _Expression(expression)
+
+        with self._lock:
+            evaluator = self._expressions.pop(expression, None)
+            if evaluator is None:
+                evaluator = _Expression(expression)
+            self._expressions[expression] = evaluator
+            while len(self._expressions) > max_size:
+                self._expressions.popitem(last = False)
+        return evaluator
+
+    def clear(self):
+        with self._lock:
+            self._expressions.clear()
+
+try:
+    _expression_cache
+except:
+    _expression_cache = _ExpressionCache()
+
 class NodeInfo():
     ERROR=-2
     UNKNOWN=-1
@@ -46,12 +108,33 @@ class NodeInfo():
     USED=1
     OFF=2
     
-    state2str = { UNKNOWN:'unk', IDLE:'idle', USED:'used', OFF:'off' }
+    state2str = { ERROR:'error', UNKNOWN:'unk', IDLE:'idle', USED:'used', OFF:'off' }
+
+    _KW_VERSION = 0
+
+    @staticmethod
+    def _get_kw_version():
+        NodeInfo._KW_VERSION = NodeInfo._KW_VERSION + 1
+        return NodeInfo._KW_VERSION
+
+    def get_keywords_version(self):
+        # Gets a number that identifies the set of keywords of the node; it changes whenever the keywords are replaced,
+        #   and it is shared by the copies of the node (as they have the same keywords)
+        if self._versioned_keywords is not self.keywords:
+            self._versioned_keywords = self.keywords
+            self._kw_version = NodeInfo._get_kw_version()
+        return self._kw_version
+
+    def _share_keywords_version(self, other):
+        # The keywords of other are a copy of the keywords of this object, so they have the same version
+        other._versioned_keywords = other.keywords
+        other._kw_version = self.get_keywords_version()
 
     def copy(self):
         # Creates a copy of this object
         new = NodeInfo(self.name, self.slots_count, self.slots_free, self.memory_total, self.memory_free, self.keywords)
         new.state = self.state
+        self._share_keywords_version(new)
         return new
 
     def get_nodeinfo(self):
@@ -67,6 +150,8 @@ class NodeInfo():
         self.memory_free_original = memory_free
         self.state = NodeInfo.IDLE
         self.keywords = keywords.copy()
+        self._versioned_keywords = None
+        self._kw_version = None
 
     def __str__(self):
         retval = "[NODE \"%s\"] state: %s, %d/%d (free slots), %d/%d (mem)" % (self.name, self.state2str[self.state], self.slots_free, self.slots_count, self.memory_free, self.memory_total)
@@ -80,13 +165,14 @@ class Node(NodeInfo, helpers.SerializableXML):
     ON_ERR=5        # The node was tried to power off, but it is still reported to be powered on after a period of time
     OFF_ERR=6       # The node was tried to power on, but it is still reported to be powered off after a period of time
 
-    state2str = { NodeInfo.UNKNOWN:'unk', NodeInfo.IDLE:'idle', NodeInfo.USED:'used', NodeInfo.OFF:'off', POW_ON:'powon', POW_OFF:'powoff', ON_ERR:'on (err)', OFF_ERR:'off (err)' }
+    state2str = { NodeInfo.ERROR:'error', NodeInfo.UNKNOWN:'unk', NodeInfo.IDLE:'idle', NodeInfo.USED:'used', NodeInfo.OFF:'off', POW_ON:'powon', POW_OFF:'powoff', ON_ERR:'on (err)', OFF_ERR:'off (err)' }
 
     @staticmethod
     def create_from_nodeinfo(ni):
         # Enables somehow upgrade the NodeInfo to a Node object
         new = Node(ni.name, ni.slots_count, ni.slots_free, ni.memory_total, ni.memory_free, ni.keywords)
         new.state = ni.state
+        ni._share_keywords_version(new)
         return new
     
     @staticmethod
@@ -159,23 +245,25 @@ class Node(NodeInfo, helpers.SerializableXML):
             if (resources.memory is not None) and (resources.memory > self.memory_free): return False
 
         if len(resources.requests) > 0:
-            _annie.add_vars(self.keywords, True)
+            kw_version = self.get_keywords_version()
+            vars_set = False
 
             # _LOGGER.debug("%s" % self.keywords)
             # _LOGGER.debug("evaluating resource: %s" % resources.requests)
             for expr in resources.requests:
-                result = False
-                try:
-                    expr = expr.strip()
-                    if expr == "":
-                        result = True
-                    else:
-                        res_check = _annie.check(expr)
-                        if res_check.type == cpyutils.evaluate.TypedClass.BOOLEAN:
-                            result = res_check.get()
-                except:
-                    result = False
-                    
+                evaluator = _expression_cache.get(expr)
+                if evaluator.trivial:
+                    continue
+
+                # The result only depends on the keywords, so we reuse it if the node has not changed them
+                result = evaluator.get_result(self.name, kw_version)
+                if result is None:
+                    if not vars_set:
+                        _annie.add_vars(self.keywords, True)
+                        vars_set = True
+                    result = evaluator.evaluate()
+                    evaluator.set_result(self.name, kw_version, result)
+
                 if not result:
                     return False
         return True
@@ -184,11 +272,13 @@ class Node(NodeInfo, helpers.SerializableXML):
         # Gets the nodeinfo structure that will represent this object (it is more simple)
         new = NodeInfo(self.name, self.slots_count, self.slots_free, self.memory_total, self.memory_free, self.keywords)
         new.state = self.state
+        self._share_keywords_version(new)
         return new
 
     def copy(self):
         # Creates a copy of this object
         new = Node(self.name, self.slots_count, self.slots_free, self.memory_total, self.memory_free, self.keywords)
+        self._share_keywords_version(new)
         new.id = self.id
         new.state = self.state
         new.timestamp_info = self.timestamp_info
@@ -409,25 +499,45 @@ class Node(NodeInfo, helpers.SerializableXML):
     
 class NodeList():
     # This class will allow to filter node lists
+    #
+    # The Node objects are shared with the dictionary (or NodeList) from which the list is created, and they are only
+    #   copied when they are modified through the list (i.e. using allocate or deallocate). So creating or duplicating
+    #   a NodeList does not copy the nodes, and the nodes obtained from the list (get_node, get_list, iterating, etc.)
+    #   MUST be considered as read-only objects.
+    #
+    # The list also keeps indexes of the nodes (grouped by state and enabled flag, and sorted by free slots and free
+    #   memory) to find the nodes that can host a set of resources without checking the whole list (see get_nodes_meeting).
+    #   The indexes are built the first time that they are needed and they are updated when the resources are allocated
+    #   or deallocated through the list. The duplicates build their own indexes (if they need them).
     def __init__(self, nodelist):
-        self._nodeinfo = collections.OrderedDict()
+        self._base = collections.OrderedDict()
+        self._delta = {}
+        self._owned = set()
+        self._positions = None
+        self._state_index = None
+        self._resources_index = None
         self._filtered_nodeinfo = None
         self._current_node = -1
         self._nodenames = []
 
         if nodelist is not None:
-            for n_id, node in list(nodelist.items()):
-                self._nodeinfo[n_id] = node.copy()
+            if isinstance(nodelist, NodeList):
+                # The modified nodes are now shared by both lists, so none of them can modify them anymore
+                self._base = nodelist._base
+                self._delta = nodelist._delta.copy()
+                nodelist._owned = set()
+            else:
+                self._base = collections.OrderedDict(nodelist)
 
     # These next functions are used to create an iterator to be used in a "for" construction, for example
     def begin_iterating(self):
         self._current_node = -1
-        self._nodenames = list(self._nodeinfo.keys())
+        self._nodenames = list(self._base.keys())
 
     def next(self):
         if self._current_node >= len(self._nodenames)-1: raise StopIteration
         self._current_node += 1
-        node = self._nodeinfo[self._nodenames[self._current_node]]
+        node = self.get_node(self._nodenames[self._current_node])
         return node
 
     def __iter__(self):
@@ -437,28 +547,164 @@ class NodeList():
     def __next__(self):
         return self.next()
 
-    # Duplicates the list
+    # Duplicates the list (the nodes are not copied until they are modified in one of the lists)
     def duplicate(self):
-        return NodeList(self._nodeinfo)
+        return NodeList(self)
 
-    # Gets the node object from its name
+    # Gets the node object from its name (the object must not be modified; use allocate or deallocate instead)
     def get_node(self, n_id):
-        if n_id not in self._nodeinfo:
+        if n_id in self._delta:
+            return self._delta[n_id]
+        if n_id not in self._base:
             return None
-        return self._nodeinfo[n_id]
+        return self._base[n_id]
+
+    # Gets a copy of the node that is owned by this list, so it can be modified
+    def _get_node_for_update(self, n_id):
+        if n_id in self._owned:
+            return self._delta[n_id]
+        node = self.get_node(n_id)
+        if node is None:
+            return None
+        node = node.copy()
+        self._delta[n_id] = node
+        self._owned.add(n_id)
+        return node
+
+    # Allocates the resources in the node of this list (the other lists that share the node are not affected)
+    def allocate(self, n_id, resources):
+        node = self._get_node_for_update(n_id)
+        if node is None:
+            return False
+        self._unindex_resources(n_id, node)
+        retval = node.allocate(resources)
+        self._index_resources(n_id, node)
+        return retval
+
+    # Deallocates the resources in the node of this list (the other lists that share the node are not affected)
+    def deallocate(self, n_id, resources):
+        node = self._get_node_for_update(n_id)
+        if node is None:
+            return False
+        self._unindex_resources(n_id, node)
+        retval = node.deallocate(resources)
+        self._index_resources(n_id, node)
+        return retval
+
+    @staticmethod
+    def _index_keys(node):
+        # The keys used to sort the nodes in the resources indexes; the nodes that report negative values may have infinite resources
+        slots_free = node.slots_free
+        if (node.slots_count < 0) and (_CONFIGURATION_MONITORING.NEGATIVE_RESOURCES_MEANS_INFINITE):
+            slots_free = float("inf")
+        memory_free = node.memory_free
+        if (node.memory_total < 0) and (_CONFIGURATION_MONITORING.NEGATIVE_RESOURCES_MEANS_INFINITE):
+            memory_free = float("inf")
+        return slots_free, memory_free
+
+    def _build_indexes(self):
+        self._positions = {}
+        self._state_index = {}
+        self._resources_index = {}
+        for position, n_id in enumerate(self._base):
+            node = self.get_node(n_id)
+            self._positions[n_id] = position
+            group = (node.state, node.enabled)
+            if group not in self._state_index:
+                self._state_index[group] = []
+                self._resources_index[group] = ([], [])
+            self._state_index[group].append(n_id)
+            slots_free, memory_free = NodeList._index_keys(node)
+            by_slots, by_memory = self._resources_index[group]
+            by_slots.append((slots_free, position, n_id))
+            by_memory.append((memory_free, position, n_id))
+
+        for by_slots, by_memory in self._resources_index.values():
+            by_slots.sort()
+            by_memory.sort()
+
+    @staticmethod
+    def _remove_entry(entries, entry):
+        i = bisect.bisect_left(entries, entry)
+        if (i < len(entries)) and (entries[i] == entry):
+            del entries[i]
+            return True
+        return False
+
+    def _unindex_resources(self, n_id, node):
+        if self._resources_index is None:
+            return
+        position = self._positions[n_id]
+        slots_free, memory_free = NodeList._index_keys(node)
+        group = (node.state, node.enabled)
+        if group in self._resources_index:
+            by_slots, by_memory = self._resources_index[group]
+            if NodeList._remove_entry(by_slots, (slots_free, position, n_id)) and NodeList._remove_entry(by_memory, (memory_free, position, n_id)):
+                return
+
+        # The node has been modified out of the list (e.g. its state has changed), so the indexes are not valid anymore
+        _LOGGER.debug("the indexes of the list are outdated for node %s; they will be built again" % n_id)
+        self._positions = None
+        self._state_index = None
+        self._resources_index = None
+
+    def _index_resources(self, n_id, node):
+        if self._resources_index is None:
+            return
+        position = self._positions[n_id]
+        slots_free, memory_free = NodeList._index_keys(node)
+        by_slots, by_memory = self._resources_index[(node.state, node.enabled)]
+        bisect.insort(by_slots, (slots_free, position, n_id))
+        bisect.insort(by_memory, (memory_free, position, n_id))
+
+    # Gets the ids of the nodes that are in any of the states (and have the enabled flag, if provided) and that meet the
+    #   resources (if provided), in the same order than in the list. It is equivalent to FILTER_reset + FILTER_basic, but it
+    #   uses the indexes so that only the nodes that have enough free slots and memory are checked.
+    def get_nodes_meeting(self, resources = None, enabled = None, states = None):
+        if self._state_index is None:
+            self._build_indexes()
+
+        candidates = []
+        for group in self._state_index:
+            state, node_enabled = group
+            if (enabled is not None) and (node_enabled != enabled): continue
+            if (states is not None) and (state not in states): continue
+
+            if resources is None:
+                candidates += [ (self._positions[n_id], n_id) for n_id in self._state_index[group] ]
+                continue
+
+            # We get the nodes that have enough slots and the nodes that have enough memory, and we take the shortest set
+            by_slots, by_memory = self._resources_index[group]
+            entries = by_slots
+            if resources.slots is not None:
+                entries = by_slots[bisect.bisect_left(by_slots, (resources.slots,)):]
+            if resources.memory is not None:
+                first = bisect.bisect_left(by_memory, (resources.memory,))
+                if len(by_memory) - first < len(entries):
+                    entries = by_memory[first:]
+
+            for _, position, n_id in entries:
+                if self.get_node(n_id).meets_resources(resources):
+                    candidates.append((position, n_id))
+
+        candidates.sort()
+        return [ n_id for _, n_id in candidates ]
 
     # Gets the inner dictionary contruction
     def get_list(self):
-        return self._nodeinfo
+        if len(self._delta) == 0:
+            return collections.OrderedDict(self._base)
+        return collections.OrderedDict([ (n_id, self._delta.get(n_id, node)) for n_id, node in self._base.items() ])
     
     # Returns the number of nodes
     def count(self):
-        return len(self._nodeinfo)
+        return len(self._base)
     
     # Returns the string representation of the objects contained in lines
     def __str__(self):
         retval = ""
-        for n_id, node in list(self._nodeinfo.items()):
+        for n_id, node in list(self.get_list().items()):
             retval = "%s%s\n" % (retval, str(node))
         return retval
     
@@ -470,14 +716,12 @@ class NodeList():
         return len(self._filtered_nodeinfo)
 
     def FILTER_reset(self):
-        self._filtered_nodeinfo = collections.OrderedDict()
-        for n_id, node in list(self._nodeinfo.items()):
-            self._filtered_nodeinfo[n_id] = node
+        self._filtered_nodeinfo = self.get_list()
         
     def FILTER_basic(self, resources = None, enabled = None, states = None):
         filtered_nodeinfo = self._filtered_nodeinfo
         if filtered_nodeinfo is None:
-            filtered_nodeinfo = self._nodeinfo
+            filtered_nodeinfo = self.get_list()
             
         self._filtered_nodeinfo = collections.OrderedDict()
         for n_id, node in list(filtered_nodeinfo.items()):
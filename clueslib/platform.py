@@ -21,6 +21,7 @@ from . import node
 from . import helpers
 import cpyutils.runcommand
 from . import configlib
+from . import metrics
 import collections
 
 import cpyutils.log
@@ -41,13 +42,23 @@ class Platform(object):
         if self._pow_mgr is not None:
             self._pow_mgr._attach_clues_system(clues_daemon)
         
+    # Calls a method of a plugin, recording the time spent (and whether it failed) in the metrics
+    @staticmethod
+    def _call_plugin(plugin, call, failed, *parameters):
+        labels = (plugin.__class__.__module__, call)
+        with metrics.PLUGIN_SECONDS.time(labels):
+            result = getattr(plugin, call)(*parameters)
+        if failed(result):
+            metrics.PLUGIN_ERRORS.inc(labels)
+        return result
+
     # Gets the list of nodes in the platform (mainly for monitoring purposes)
     def get_nodeinfolist(self):
-        return self._lrms.get_nodeinfolist()
+        return self._call_plugin(self._lrms, "get_nodeinfolist", lambda r: r is None)
 
     # Gets the list of jobs in the platform (mainly for monitoring purposes)
     def get_jobinfolist(self):
-        return self._lrms.get_jobinfolist()
+        return self._call_plugin(self._lrms, "get_jobinfolist", lambda r: r is None)
     
     # Powers off a node in an ordered mode (calls the poweroff of the lrms and the poweroff of the powermanager)
     def power_off(self, nname):
@@ -57,9 +68,10 @@ class Platform(object):
             # self._pow_off_msg = True
             return False, nname
         
-        result, real_nname = self._pow_mgr.power_off(nname)
+        result, real_nname = self._call_plugin(self._pow_mgr, "power_off", lambda r: not r[0], nname)
         if result:
-            result = self._lrms.power_off(real_nname)
+            result = self._call_plugin(self._lrms, "power_off", lambda r: not r, real_nname)
+        metrics.POWER_OPERATIONS.inc(("power_off", "success" if result else "failure"))
         return result, real_nname
     
     # Powers on a node in an ordered mode (calls the poweron of the lrms and the poweron of the powermanager)
@@ -70,11 +82,18 @@ class Platform(object):
             # self._pow_on_msg = True
             return False, nname
 
-        result, real_nname = self._pow_mgr.power_on(nname)
+        result, real_nname = self._call_plugin(self._pow_mgr, "power_on", lambda r: not r[0], nname)
         if result:
-            result = self._lrms.power_on(real_nname)
+            result = self._call_plugin(self._lrms, "power_on", lambda r: not r, real_nname)
+        metrics.POWER_OPERATIONS.inc(("power_on", "success" if result else "failure"))
         return result, real_nname
     
+    # Gets the identifier of the plugin that carries out the power operations (used to limit the concurrent operations per plugin)
+    def get_power_manager_id(self):
+        if self._pow_mgr is None:
+            return None
+        return self._pow_mgr.__class__.__module__
+
     # Carries out the lifecycle of the platform (in case that it has any). The default implementation calls the lifecycles of the lrms and the powermanager
     # e.g. the lifecycle for the lrms will be useful in a simulator that should assign jobs, etc. or in the powermanager of VMs to detect stalled vms
     def lifecycle(self):
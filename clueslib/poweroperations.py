@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import threading
+import collections
+
+import cpyutils.log
+_LOGGER = cpyutils.log.Log("POWEROPS")
+
+def parse_plugin_concurrency(plugin_concurrency):
+    # Parses a string in the form "plugin1=N1,plugin2=N2" to a dictionary { "plugin1": N1, "plugin2": N2 }
+    limits = {}
+    for entry in plugin_concurrency.split(","):
+        entry = entry.strip()
+        if entry == "":
+            continue
+        try:
+            plugin_id, limit = entry.split("=", 1)
+            limits[plugin_id.strip()] = int(limit)
+        except:
+            _LOGGER.error("ignoring invalid concurrency limit '%s' for the power operations" % entry)
+    return limits
+
+class PowerOperation():
+    def __init__(self, n_id, operation, plugin_id, function, parameters = []):
+        self.n_id = n_id
+        self.operation = operation
+        self.plugin_id = plugin_id
+        self.function = function
+        self.parameters = parameters
+        self.result = None
+        # The state of the node (and its timestamp) when the operation was submitted
+        self.previous_state = None
+
+    def __str__(self):
+        return "%s %s (%s)" % (self.operation, self.n_id, self.plugin_id)
+
+class PowerOperationsExecutor():
+    # This class runs the power operations (i.e. power on or power off a node) using a pool of workers, so that the
+    #   event loop is not blocked by the commands of the plugins. The operations are run according to these rules:
+    #   - the operations for one node are executed one after the other, in the same order in which they were submitted
+    #   - there are up to max_workers operations running at the same time, and up to the limit set for each plugin
+    #     (if the plugin has not a limit, it is max_workers)
+    #
+    # The workers do not call the callbacks; the finished operations are stored and they are returned by get_finished
+    #   (that is expected to be called from the event loop), so that the results are applied from the thread of the loop.
+    def __init__(self, max_workers, plugin_concurrency = {}):
+        self._max_workers = max_workers
+        self._plugin_concurrency = plugin_concurrency
+        self._cond = threading.Condition()
+        self._ready = collections.deque()
+        self._queued_by_node = {}
+        self._running_by_plugin = {}
+        self._finished = collections.deque()
+        self._workers = []
+
+    def _start_workers(self):
+        while len(self._workers) < self._max_workers:
+            th = threading.Thread(target = self._work, name = "power-operations-%d" % len(self._workers))
+            th.daemon = True
+            th.start()
+            self._workers.append(th)
+
+    def submit(self, operation):
+        # Enqueues the operation. If the last operation queued for the node is the same operation, it is not
+        #   enqueued again (and the method returns False)
+        with self._cond:
+            if operation.n_id in self._queued_by_node:
+                queued = self._queued_by_node[operation.n_id]
+                if queued[-1].operation == operation.operation:
+                    return False
+                queued.append(operation)
+            else:
+                self._queued_by_node[operation.n_id] = collections.deque([ operation ])
+                self._ready.append(operation)
+            self._start_workers()
+            self._cond.notify_all()
+        return True
+
+    def pending(self, n_id):
+        # Returns the operations that are queued or running for the node
+        with self._cond:
+            if n_id not in self._queued_by_node:
+                return []
+            return [ op.operation for op in self._queued_by_node[n_id] ]
+
+    def get_finished(self):
+        # Returns the operations that have finished since the last call (in the order in which they have finished)
+        finished = []
+        with self._cond:
+            while len(self._finished) > 0:
+                finished.append(self._finished.popleft())
+        return finished
+
+    def _plugin_limit(self, plugin_id):
+        limit = self._plugin_concurrency.get(plugin_id, 0)
+        if limit <= 0:
+            return self._max_workers
+        return limit
+
+    def _next_operation(self):
+        # Gets the first operation that is ready and whose plugin has not reached the limit of concurrent operations
+        for operation in self._ready:
+            if self._running_by_plugin.get(operation.plugin_id, 0) < self._plugin_limit(operation.plugin_id):
+                self._ready.remove(operation)
+                return operation
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                operation = self._next_operation()
+                while operation is None:
+                    self._cond.wait()
+                    operation = self._next_operation()
+                self._running_by_plugin[operation.plugin_id] = self._running_by_plugin.get(operation.plugin_id, 0) + 1
+
+            try:
+                operation.result = operation.function(*operation.parameters)
+            except Exception as e:
+                _LOGGER.error("failed to %s" % (str(operation)))
+                _LOGGER.error(str(e))
+                operation.result = None
+
+            with self._cond:
+                self._running_by_plugin[operation.plugin_id] -= 1
+                queued = self._queued_by_node[operation.n_id]
+                queued.popleft()
+                if len(queued) > 0:
+                    self._ready.append(queued[0])
+                else:
+                    del self._queued_by_node[operation.n_id]
+                self._finished.append(operation)
+                self._cond.notify_all()
@@ -16,6 +16,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import cpyutils.db
+import cpyutils.eventloop
+from .node import Node
+from .request import Request
+from . import helpers
+import collections
+import threading
+import sys
+import os
 class Stats(object):
 	def __init__(self, slots, slots_free, memory, memory_free, state, timestamp):
 		self._slots = float(slots)
@@ -71,9 +79,233 @@ class Stats(object):
 		else:
 			return Stats(self._slots, self._slots_free, self._memory, self._memory_free, self.state, t)
 
-def get_requests_data(connection_string, FROM, TO):
+# The columns of the rollup table in which the time spent in each state is accumulated (the states are the ones defined in clueslib.node)
+ROLLUP_STATE_COLUMNS = [ "time_idle", "time_used", "time_off", "time_powon", "time_powoff", "time_err", "time_unknown" ]
+_STATE_2_ROLLUP_COLUMN = { Node.IDLE: "time_idle", Node.USED: "time_used", Node.OFF: "time_off", Node.POW_ON: "time_powon", Node.POW_OFF: "time_powoff",
+		Node.ON_ERR: "time_err", Node.OFF_ERR: "time_err", Node.UNKNOWN: "time_unknown", Node.ERROR: "time_unknown" }
+# The state of the host in the intervals that have been rolled up (the state in which it spent more time)
+_ROLLUP_COLUMN_2_STATE = { "time_idle": Node.IDLE, "time_used": Node.USED, "time_off": Node.OFF, "time_powon": Node.POW_ON, "time_powoff": Node.POW_OFF,
+		"time_err": Node.ON_ERR, "time_unknown": Node.UNKNOWN }
+
+# The number of intervals that are rolled up from each query to the database (to bound the memory used)
+ROLLUP_INTERVALS_PER_CHUNK = 24
+
+def _create_rollup_tables(db):
+	result1, _, _ = db.sql_query("CREATE TABLE IF NOT EXISTS host_monitoring_rollup(name varchar(128), interval_start INTEGER, interval_length INTEGER, slots_count REAL, slots_free REAL, memory_total REAL, memory_free REAL, state INTEGER, slots_used_min REAL, slots_used_avg REAL, slots_used_max REAL, memory_used_avg REAL, %s, power_ons INTEGER, power_offs INTEGER, PRIMARY KEY(name, interval_start))" % ", ".join([ "%s REAL" % c for c in ROLLUP_STATE_COLUMNS ]), True)
+	result2, _, _ = db.sql_query("CREATE TABLE IF NOT EXISTS requests_rollup(interval_start INTEGER, interval_length INTEGER, requests INTEGER, served INTEGER, not_served INTEGER, discarded INTEGER, slots REAL, memory REAL, wait_served REAL)", True)
+	result3, _, _ = db.sql_query("CREATE TABLE IF NOT EXISTS rollup_progress(name varchar(128) PRIMARY KEY, timestamp INTEGER)", True)
+	return result1 and result2 and result3
+
+def _write_chunk(db, host_rows, requests_rows, chunk_end):
+	# Writes the rollups of a chunk, deletes the raw rows that have been rolled up and updates the progress in a single
+	#   transaction, so that if the process dies in the middle the chunk is rolled up again from the beginning
+	connection, placeholder = helpers.raw_connection(db)
+	if connection is None:
+		raise Exception("the type of database does not support compacting")
+	try:
+		cursor = connection.cursor()
+		if len(host_rows) > 0:
+			cursor.executemany("INSERT INTO host_monitoring_rollup VALUES (%s)" % ", ".join([ placeholder ] * len(host_rows[0])), host_rows)
+		if len(requests_rows) > 0:
+			cursor.executemany("INSERT INTO requests_rollup VALUES (%s)" % ", ".join([ placeholder ] * len(requests_rows[0])), requests_rows)
+		cursor.execute("DELETE FROM host_monitoring WHERE timestamp < %d" % chunk_end)
+		cursor.execute("DELETE FROM requests WHERE timestamp_created < %d" % chunk_end)
+		cursor.execute("DELETE FROM rollup_progress WHERE name = 'host_monitoring'")
+		cursor.execute("INSERT INTO rollup_progress VALUES ('host_monitoring', %d)" % chunk_end)
+		connection.commit()
+	except:
+		connection.rollback()
+		raise
+	finally:
+		connection.close()
+
+class _Sample(object):
+	def __init__(self, t, slots_count, slots_free, memory_total, memory_free, state):
+		self.t = t
+		self.slots_count = float(slots_count)
+		self.slots_free = float(slots_free)
+		self.memory_total = float(memory_total)
+		self.memory_free = float(memory_free)
+		self.state = state
+
+class _HostRollup(object):
+	# Accumulates the monitoring information of one host during one interval
+	def __init__(self, name, interval_start, interval_length):
+		self.name = name
+		self.interval_start = interval_start
+		self.interval_length = interval_length
+		self.covered = 0.0
+		self.slots_used_min = None
+		self.slots_used_max = None
+		self.slots_used_sum = 0.0
+		self.memory_used_sum = 0.0
+		self.times = dict([ (c, 0.0) for c in ROLLUP_STATE_COLUMNS ])
+		self.power_ons = 0
+		self.power_offs = 0
+
+	def add(self, sample, duration):
+		if (sample is None) or (duration <= 0):
+			return
+		slots_used = sample.slots_count - sample.slots_free
+		self.covered += duration
+		self.slots_used_sum += slots_used * duration
+		self.memory_used_sum += (sample.memory_total - sample.memory_free) * duration
+		if (self.slots_used_min is None) or (slots_used < self.slots_used_min): self.slots_used_min = slots_used
+		if (self.slots_used_max is None) or (slots_used > self.slots_used_max): self.slots_used_max = slots_used
+		self.times[_STATE_2_ROLLUP_COLUMN.get(sample.state, "time_unknown")] += duration
+
+	def transition(self, previous, sample):
+		previous_state = None if previous is None else previous.state
+		if (sample.state == Node.POW_ON) and (previous_state != Node.POW_ON): self.power_ons += 1
+		if (sample.state == Node.POW_OFF) and (previous_state != Node.POW_OFF): self.power_offs += 1
+
+	def get_row(self, last):
+		return [ self.name, self.interval_start, self.interval_length, last.slots_count, last.slots_free, last.memory_total, last.memory_free, last.state,
+				self.slots_used_min, self.slots_used_sum / self.covered, self.slots_used_max, self.memory_used_sum / self.covered ] + \
+				[ self.times[c] for c in ROLLUP_STATE_COLUMNS ] + [ self.power_ons, self.power_offs ]
+
+def _rollup_host(name, current, samples, interval):
+	# Rolls up the samples of one host (sorted by time), starting from the current sample (the state of the host before the
+	#   first sample, or None if it is not known). Only the intervals in which there are samples are rolled up: in the rest
+	#   of intervals the host remains in the state of the end of the previous rolled up interval (as in host_monitoring).
+	#   Returns the rows for the rollup table and the last sample
+	rows = []
+	i = 0
+	while i < len(samples):
+		interval_start = int(samples[i].t // interval) * interval
+		interval_end = interval_start + interval
+		rollup = _HostRollup(name, interval_start, interval)
+		t = interval_start
+		while (i < len(samples)) and (samples[i].t < interval_end):
+			rollup.add(current, samples[i].t - t)
+			rollup.transition(current, samples[i])
+			current = samples[i]
+			t = max(t, samples[i].t)
+			i += 1
+		rollup.add(current, interval_end - t)
+		if rollup.covered > 0:
+			rows.append(rollup.get_row(current))
+	return rows, current
+
+def _rollup_requests(rows, interval):
+	# Aggregates the requests by the interval in which they were created
+	intervals = {}
+	for (timestamp_created, timestamp_state, state, slots, memory, taskcount) in rows:
+		interval_start = int(timestamp_created // interval) * interval
+		if interval_start not in intervals:
+			intervals[interval_start] = [ interval_start, interval, 0, 0, 0, 0, 0.0, 0.0, 0.0 ]
+		r = intervals[interval_start]
+		r[2] += 1
+		if state == Request.SERVED:
+			r[3] += 1
+			r[8] += timestamp_state - timestamp_created
+		elif state == Request.NOT_SERVED:
+			r[4] += 1
+		elif state == Request.DISCARDED:
+			r[5] += 1
+		r[6] += float(slots) * taskcount
+		r[7] += float(memory) * taskcount
+	return [ intervals[k] for k in sorted(intervals.keys()) ]
+
+def compact(connection_string, retention, interval, now = None, max_chunks = None):
+	# Rolls up the monitoring information (host_monitoring and requests) that is older than retention seconds into
+	#   intervals of the given length, and deletes the raw rows that have been rolled up. It is incremental: it starts
+	#   from the last interval that was rolled up, so it can be called periodically. If max_chunks is set, at most that
+	#   number of chunks (of ROLLUP_INTERVALS_PER_CHUNK intervals) are rolled up, and "pending" is True in the summary if
+	#   there is more information to roll up.
+	import time
 	db = cpyutils.db.DB.create_from_string(connection_string)
+	if not _create_rollup_tables(db):
+		raise Exception("failed to create the rollup tables")
+
+	if now is None:
+		now = time.time()
+	interval = int(interval)
+	cutoff = int((now - retention) // interval) * interval
+
+	summary = { "cutoff": cutoff, "intervals": 0, "host_rows": 0, "requests_rows": 0, "pending": False }
+
+	# The state of each host before the information that is going to be rolled up is the state at the end of its last rolled up interval
+	current = {}
+	result, _, rows = db.sql_query("select r.name, r.slots_count, r.slots_free, r.memory_total, r.memory_free, r.state, r.interval_start from host_monitoring_rollup as r join (select name, max(interval_start) as latest from host_monitoring_rollup group by name) as l on r.name = l.name and r.interval_start = l.latest")
+	if result:
+		for (name, slots_count, slots_free, memory_total, memory_free, state, interval_start) in rows:
+			current[name] = _Sample(interval_start, slots_count, slots_free, memory_total, memory_free, state)
+
+	result, _, rows = db.sql_query("select timestamp from rollup_progress where name = 'host_monitoring'")
+	if result and (len(rows) > 0):
+		start = int(rows[0][0])
+	else:
+		result, _, rows = db.sql_query("select min(timestamp) from host_monitoring")
+		if (not result) or (rows[0][0] is None):
+			start = cutoff
+		else:
+			start = int(rows[0][0] // interval) * interval
+
+	requests_from = None
+	chunk_start = start
+	chunks = 0
+	while chunk_start < cutoff:
+		if (max_chunks is not None) and (chunks >= max_chunks):
+			summary["pending"] = True
+			break
+		chunks += 1
 
+		# The intervals in which there is no monitoring information are skipped
+		result, _, rows = db.sql_query("select min(timestamp) from host_monitoring where timestamp >= %d" % chunk_start)
+		if result and (rows[0][0] is not None):
+			chunk_start = min(max(chunk_start, int(rows[0][0] // interval) * interval), cutoff)
+		else:
+			chunk_start = cutoff
+		chunk_end = min(chunk_start + interval * ROLLUP_INTERVALS_PER_CHUNK, cutoff)
+
+		result, _, rows = db.sql_query("select name, timestamp, slots_count, slots_free, memory_total, memory_free, state from host_monitoring where timestamp >= %d and timestamp < %d order by name, timestamp" % (chunk_start, chunk_end))
+		if not result:
+			raise Exception("failed to read from the database")
+
+		samples = collections.OrderedDict()
+		for (name, timestamp, slots_count, slots_free, memory_total, memory_free, state) in rows:
+			if name not in samples:
+				samples[name] = []
+			samples[name].append(_Sample(timestamp, slots_count, slots_free, memory_total, memory_free, state))
+		rows = None
+
+		host_rows = []
+		for name, h_samples in samples.items():
+			h_rows, current[name] = _rollup_host(name, current.get(name, None), h_samples, interval)
+			host_rows += h_rows
+		samples = None
+
+		# The requests created before the monitoring information are rolled up in the first chunk
+		if requests_from is None:
+			result, _, rows = db.sql_query("select timestamp_created, timestamp_state, state, slots, memory, taskcount from requests where timestamp_created < %d" % chunk_end)
+		else:
+			result, _, rows = db.sql_query("select timestamp_created, timestamp_state, state, slots, memory, taskcount from requests where timestamp_created >= %d and timestamp_created < %d" % (requests_from, chunk_end))
+		if not result:
+			raise Exception("failed to read from the database")
+		requests_rows = _rollup_requests(rows, interval)
+		requests_from = chunk_end
+
+		_write_chunk(db, host_rows, requests_rows, chunk_end)
+
+		summary["host_rows"] += len(host_rows)
+		summary["requests_rows"] += len(requests_rows)
+		chunk_start = chunk_end
+
+	if chunk_start > start:
+		summary["intervals"] = (chunk_start - start) // interval
+	return summary
+
+def _get_rollup_limits(db):
+	# Gets the minimum and maximum time covered by the rollups (or None if there are no rollups); the minimum is obtained in a
+	#   subquery, because MySQL (with ONLY_FULL_GROUP_BY) does not accept an aggregate mixed with a column that is not aggregated
+	result, _, rows = db.sql_query("select (select min(interval_start) from host_monitoring_rollup), timestamp from rollup_progress where name = 'host_monitoring'")
+	if (not result) or (len(rows) == 0) or (rows[0][0] is None):
+		return None, None
+	return rows[0][0], rows[0][1]
+
+def _get_requests_window(db, FROM, TO):
+	# Gets the window of time for the requests, according to the information in the database
 	# We'll get the max and min timestamp, and so check whether we have access to the db or not
 	max_timestamp = 0
 	min_timestamp = 0
@@ -106,37 +338,41 @@ def get_requests_data(connection_string, FROM, TO):
 	if TO is None:
 		TO = 0
 
-	# Finally get the data from the database
-	result, row_count, rows = db.sql_query("select * from requests where timestamp_created >= %d and timestamp_created <= %d order by timestamp_created" % (FROM, TO) )
+	return FROM, TO, min_timestamp, max_timestamp
 
-	requests = []
-	if result:
-		# Read the data from the database and create the data structure (Stats)
-		for (reqid, timestamp_created, timestamp_state, state, slots, memory, expressions, taskcount, maxtaskspernode, jobid, nodes, x) in rows:
-			requests.append(\
-			{
-				"id": reqid,\
-				"t_created": timestamp_created,\
-				"state": state,\
-				"t_state": timestamp_state,\
-				"slots": slots,\
-				"memory": memory,\
-				"requirements": expressions,\
-				"taskcount": taskcount,\
-				"maxtaskspernode": maxtaskspernode,\
-				"jobid": jobid,\
-				"nodes": nodes\
-			}\
-			)
-		return requests, min_timestamp, max_timestamp
-	else:
-		return None, None, None
+def _query_iterator(db, sql, chunk_size = 10000, check = None):
+	# Iterates over the rows of a query, fetching them in chunks from a server side cursor so that the whole result
+	#   is not in memory (if the database is neither sqlite nor MySQL, cpyutils.db is used and the rows are read at once).
+	#   If check is not None, it is called before each chunk and it may raise an exception to stop reading (e.g. the server
+	#   passes rpcserver.check_deadline, so that the reports stop when the time for the call expires)
+	connection, _ = helpers.raw_connection(db)
+	if isinstance(db, cpyutils.db.DB_mysql):
+		import MySQLdb.cursors
+		cursor = connection.cursor(MySQLdb.cursors.SSCursor)
+	elif connection is not None:
+		cursor = connection.cursor()
 
-def get_reports_data(connection_string, FROM, TO):
-	db = cpyutils.db.DB.create_from_string(connection_string)
+	if connection is not None:
+		try:
+			cursor.execute(sql)
+			rows = cursor.fetchmany(chunk_size)
+			while len(rows) > 0:
+				if check is not None:
+					check()
+				for row in rows:
+					yield row
+				rows = cursor.fetchmany(chunk_size)
+		finally:
+			connection.close()
+	else:
+		result, row_count, rows = db.sql_query(sql)
+		if not result:
+			raise Exception("failed to read from the database")
+		for row in rows:
+			yield row
 
-	# We'll get the max and min timestamp, and so check whether we have access to the db or not
-	max_timestamp = 0
+def _get_reports_window(db, FROM, TO):
+	# Gets the window of time for the reports, according to the information in the database
 	result, row_count, rows = db.sql_query("select max(timestamp),min(timestamp) from host_monitoring")
 
 	if result:
@@ -145,6 +381,13 @@ def get_reports_data(connection_string, FROM, TO):
 	else:
 		raise Exception("failed to read from the database")
 
+	# The information that is older than the raw information has been rolled up (see compact)
+	rollup_min, rollup_max = _get_rollup_limits(db)
+	raw_min_timestamp = min_timestamp
+	if rollup_min is not None:
+		if (min_timestamp is None) or (rollup_min < min_timestamp): min_timestamp = rollup_min
+		if (max_timestamp is None) or (rollup_max > max_timestamp): max_timestamp = rollup_max
+
 	# Now correct the values of TO and FROM
 	if TO == 0:
 		TO = max_timestamp
@@ -162,51 +405,396 @@ def get_reports_data(connection_string, FROM, TO):
 	if TO is None:
 		TO = 0
 
-	# Finally get the data from the database
-	result, row_count, rows = db.sql_query("select * from host_monitoring where timestamp_state >= %d and timestamp_state <= %d order by timestamp_state" % (FROM, TO) )
-	timeline={}
-	hostnames = []
+	# The part of the window that is older than the raw information is read from the rollups
+	rollup_to = None
+	if (rollup_min is not None) and ((raw_min_timestamp is None) or (FROM < raw_min_timestamp)):
+		rollup_to = TO
+		if raw_min_timestamp is not None:
+			rollup_to = min(TO, raw_min_timestamp - 1)
 
-	if result:
-		# Read the data from the database and create the data structure (Stats)
-		for (name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp, x) in rows:
-			timestamp_state = int(timestamp)
-			s = Stats(slots_count, slots_free, memory_total, memory_free, state, timestamp)
-			if timestamp_state not in list(timeline.keys()):
-				timeline[timestamp_state] = {}
-			if name not in list(timeline[timestamp_state].keys()):
-				timeline[timestamp_state][name] = s
-			if name not in hostnames:
-				hostnames.append(name)
-
-		# Get the timestamp sorted
-		timesteps = list(timeline.keys())
-		timesteps.sort()
-
-		# Now we are filling the data blanks for each host (to get data for every host at each timestamp)
-		fill_the_blanks = True
-		if fill_the_blanks:
-			current_values = {}
-			for nname in hostnames:
-				current_values[nname] = Stats(0, 0, 0, 0, 2, 0)
-
-			for t in timesteps:
-				for nname in hostnames:
-					if nname not in list(timeline[t].keys()):
-						timeline[t][nname] = current_values[nname].clone(t)
-					current_values[nname] = timeline[t][nname]
-
-		# Now we are re-organizing the data, indexing by host
-		hostdata = {}
-		for hostname in hostnames:
-			hostdata[hostname] = []
-
-		for t in timesteps:
-			for hostname in hostnames:
-				if hostname in timeline[t]:
-					t_s = "%d" % t
-					hostdata[hostname].append(timeline[t][hostname].toJSONobj())
-
-		return hostdata, min_timestamp, max_timestamp
-	else:
-		return None, None, None
\ No newline at end of file
+	return FROM, TO, min_timestamp, max_timestamp, rollup_to
+
+def _host_rows(db, FROM, TO, rollup_to, check = None):
+	# Gets the monitoring information of the hosts, ordered by host and time: (name, source, t, slots, slots_used, memory, memory_used, state).
+	#   The rolled up information (source 0) goes before the raw information (source 1) of each host; the state of each rolled up
+	#   interval is the state in which the host has spent more time
+	import heapq
+	raw = _query_iterator(db, "select name, 1, timestamp, slots_count, slots_count - slots_free, memory_total, memory_total - memory_free, state from host_monitoring where timestamp >= %d and timestamp <= %d order by name, timestamp" % (FROM, TO), check = check)
+	if rollup_to is None:
+		return raw
+
+	def rollup():
+		for row in _query_iterator(db, "select name, 0, interval_start, slots_count, slots_used_avg, memory_total, memory_used_avg, %s from host_monitoring_rollup where interval_start >= %d and interval_start <= %d order by name, interval_start" % (", ".join(ROLLUP_STATE_COLUMNS), FROM, rollup_to), check = check):
+			times = row[7:]
+			yield row[0:7] + (_ROLLUP_COLUMN_2_STATE[ROLLUP_STATE_COLUMNS[times.index(max(times))]],)
+	return heapq.merge(rollup(), raw)
+
+class _HostEvents(object):
+	# Generates the events of one host from its monitoring information (that must be added in order of time): an event is only generated
+	#   when the information changes. The time is split in intervals of step seconds (1 second if step is 0) and only the first information
+	#   of each interval is considered; if step is greater than 1, the events are aligned to the beginning of the intervals
+	def __init__(self, step = 0):
+		self._step = max(1, int(step))
+		self._interval = None
+		self._values = None
+
+	def add(self, t, slots, slots_used, memory, memory_used, state):
+		interval = int(t) - int(t) % self._step
+		if (self._interval is not None) and (interval <= self._interval):
+			return None
+		self._interval = interval
+		values = (float(slots), float(slots_used), float(memory), float(memory_used), state)
+		if values == self._values:
+			return None
+		self._values = values
+		if self._step > 1:
+			t = interval
+		return (t,) + values
+
+def _event_dict(event):
+	(t, slots, slots_used, memory, memory_used, state) = event
+	return { "slots": slots, "slots_used": slots_used, "memory": memory, "memory_used": memory_used, "state": state, "t": t }
+
+def _host_events(db, FROM, TO, rollup_to, step, check = None):
+	# Gets the events of the hosts as pairs (hostname, (t, slots, slots_used, memory, memory_used, state)), ordered by host and time
+	previous_name = None
+	for row in _host_rows(db, FROM, TO, rollup_to, check):
+		name = row[0]
+		if name != previous_name:
+			host_events = _HostEvents(step)
+			previous_name = name
+		event = host_events.add(*row[2:])
+		if event is not None:
+			yield name, event
+
+def iterate_host_events(connection_string, FROM, TO, step = 0):
+	# Gets the events of the hosts in the window [FROM, TO], ordered by host and time, as pairs (hostname, event). The events are
+	#   only generated when the information of the host changes (the reports fill the gaps between events), and they are
+	#   read from the database while they are consumed. It returns the iterator and the min and max timestamps available.
+	db = cpyutils.db.DB.create_from_string(connection_string)
+	FROM, TO, min_timestamp, max_timestamp, rollup_to = _get_reports_window(db, FROM, TO)
+
+	def events():
+		for name, event in _host_events(db, FROM, TO, rollup_to, step):
+			yield name, _event_dict(event)
+
+	return events(), min_timestamp, max_timestamp
+
+def _requests_rows(db, FROM, TO, condition = "1", check = None):
+	for (reqid, timestamp_created, timestamp_state, state, slots, memory, expressions, taskcount, maxtaskspernode, jobid, nodes, x) in _query_iterator(db, "select * from requests where timestamp_created >= %d and timestamp_created <= %d and (%s) order by timestamp_created" % (FROM, TO, condition), check = check):
+		yield {
+			"id": reqid,\
+			"t_created": timestamp_created,\
+			"state": state,\
+			"t_state": timestamp_state,\
+			"slots": slots,\
+			"memory": memory,\
+			"requirements": expressions,\
+			"taskcount": taskcount,\
+			"maxtaskspernode": maxtaskspernode,\
+			"jobid": jobid,\
+			"nodes": nodes\
+		}
+
+def get_requests_data(connection_string, FROM, TO):
+	db = cpyutils.db.DB.create_from_string(connection_string)
+	FROM, TO, min_timestamp, max_timestamp = _get_requests_window(db, FROM, TO)
+	return list(_requests_rows(db, FROM, TO)), min_timestamp, max_timestamp
+
+def get_reports_data(connection_string, FROM, TO, step = 0):
+	events, min_timestamp, max_timestamp = iterate_host_events(connection_string, FROM, TO, step)
+	hostdata = {}
+	for name, event in events:
+		if name not in hostdata:
+			hostdata[name] = []
+		hostdata[name].append(event)
+	return hostdata, min_timestamp, max_timestamp
+
+def write_reports_json(connection_string, FROM, TO, out, step = 0):
+	# Writes the data for the reports (the same structure than get_reports_data and get_requests_data) in JSON format to the
+	#   file-like object out, while it is read from the database (so the data is never in memory)
+	import json
+	events, min_timestamp, max_timestamp = iterate_host_events(connection_string, FROM, TO, step)
+
+	out.write('{"hostevents": {')
+	current_name = None
+	for name, event in events:
+		if name != current_name:
+			if current_name is not None:
+				out.write('], ')
+			out.write('%s: [' % json.dumps(name))
+			current_name = name
+		else:
+			out.write(', ')
+		out.write(json.dumps(event))
+	if current_name is not None:
+		out.write(']')
+
+	out.write('}, "requests": [')
+	db = cpyutils.db.DB.create_from_string(connection_string)
+	FROM, TO, _, _ = _get_requests_window(db, FROM, TO)
+	first = True
+	for request in _requests_rows(db, FROM, TO):
+		if not first:
+			out.write(', ')
+		out.write(json.dumps(request))
+		first = False
+	out.write('], "mintime_avail": %s, "maxtime_avail": %s}' % (json.dumps(min_timestamp), json.dumps(max_timestamp)))
+
+# The names of the constants of the states of the hosts and the requests (in clueslib.node and clueslib.request), that are
+#   exported with their values so that the columns can be interpreted
+_HOST_STATE_NAMES = [ "ERROR", "UNKNOWN", "IDLE", "USED", "OFF", "POW_ON", "POW_OFF", "ON_ERR", "OFF_ERR" ]
+_REQUEST_STATE_NAMES = [ "UNKNOWN", "DISCARDED", "NOT_SERVED", "DISSAPEARED", "PENDING", "ATTENDED", "SERVED", "BLOCKED" ]
+
+# The states of the requests and the hosts fit in one byte, and the timestamps are stored as the difference with the previous one
+#   (in seconds); each column is written to a raw file in little endian, so it can be memory-mapped (e.g. numpy.memmap)
+_COLUMN_TYPES = { "<i1": "b", "<i4": "i", "<u4": "I", "<i8": "q", "<u8": "Q", "<f4": "f", "<f8": "d" }
+
+class _ColumnWriter(object):
+	def __init__(self, folder, name, dtype, encoding = None, buffer_size = 65536):
+		import array
+		self.name = name
+		self.dtype = dtype
+		self.encoding = encoding
+		self.filename = "%s.bin" % name
+		self.length = 0
+		self._buffer = array.array(_COLUMN_TYPES[dtype])
+		if self._buffer.itemsize != int(dtype[2:]):
+			raise Exception("the size of the array type for %s does not match the size of %s" % (name, dtype))
+		self._buffer_size = buffer_size
+		self._file = open(os.path.join(folder, self.filename), "wb")
+
+	def append(self, value):
+		self._buffer.append(value)
+		self.length += 1
+		if len(self._buffer) >= self._buffer_size:
+			self._write()
+
+	def _write(self):
+		if sys.byteorder != "little":
+			self._buffer.byteswap()
+		self._file.write(self._buffer.tostring() if sys.version_info[0] < 3 else self._buffer.tobytes())
+		del self._buffer[:]
+
+	def close(self):
+		self._write()
+		self._file.close()
+
+	def description(self):
+		description = { "file": self.filename, "dtype": self.dtype, "length": self.length }
+		if self.encoding is not None:
+			description["encoding"] = self.encoding
+		return description
+
+def export_columns(connection_string, FROM, TO, folder, step = 0):
+	# Exports the data for the reports to the folder, as a set of columns (one file for each one) and a file columns.json that
+	#   describes them. The data is written while it is read from the database. The events of each host are stored from
+	#   hosts.offsets[i] to hosts.offsets[i+1] in the columns of host_events (the names are in the "hosts" entry of columns.json).
+	import json
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+
+	db = cpyutils.db.DB.create_from_string(connection_string)
+	FROM_h, TO_h, min_timestamp, max_timestamp, rollup_to = _get_reports_window(db, FROM, TO)
+
+	hosts = []
+	host_columns = [ _ColumnWriter(folder, "host_events.t", "<i8", "delta"), _ColumnWriter(folder, "host_events.slots", "<f4"), _ColumnWriter(folder, "host_events.slots_used", "<f4"),
+		_ColumnWriter(folder, "host_events.memory", "<f8"), _ColumnWriter(folder, "host_events.memory_used", "<f8"), _ColumnWriter(folder, "host_events.state", "<i1") ]
+	offsets = _ColumnWriter(folder, "hosts.offsets", "<u8")
+	t_column = host_columns[0]
+	previous_t = 0
+	for name, event in _host_events(db, FROM_h, TO_h, rollup_to, step):
+		if (len(hosts) == 0) or (name != hosts[-1]):
+			hosts.append(name)
+			offsets.append(t_column.length)
+			previous_t = 0
+		t = int(event[0])
+		t_column.append(t - previous_t)
+		previous_t = t
+		for column, value in zip(host_columns[1:], event[1:]):
+			column.append(value)
+	offsets.append(t_column.length)
+
+	FROM_r, TO_r, _, _ = _get_requests_window(db, FROM, TO)
+	request_columns = [ _ColumnWriter(folder, "requests.t_created", "<i8", "delta"), _ColumnWriter(folder, "requests.t_state", "<i8", "delta:requests.t_created"), _ColumnWriter(folder, "requests.state", "<i1"),
+		_ColumnWriter(folder, "requests.slots", "<f4"), _ColumnWriter(folder, "requests.memory", "<f8"), _ColumnWriter(folder, "requests.taskcount", "<i4"), _ColumnWriter(folder, "requests.maxtaskspernode", "<i4") ]
+	previous_t = 0
+	with open(os.path.join(folder, "requests.id.txt"), "w") as ids:
+		for (reqid, timestamp_created, timestamp_state, state, slots, memory, expressions, taskcount, maxtaskspernode, jobid, nodes, x) in _query_iterator(db, "select * from requests where timestamp_created >= %d and timestamp_created <= %d order by timestamp_created" % (FROM_r, TO_r)):
+			t = int(timestamp_created)
+			values = [ t - previous_t, int(timestamp_state) - t, state, slots, memory, taskcount, maxtaskspernode ]
+			previous_t = t
+			for column, value in zip(request_columns, values):
+				column.append(value)
+			ids.write("%s\n" % reqid)
+
+	columns = {}
+	for column in host_columns + request_columns + [ offsets ]:
+		column.close()
+		columns[column.name] = column.description()
+	columns["requests.id"] = { "file": "requests.id.txt", "encoding": "lines", "length": request_columns[0].length }
+
+	description = { "version": 1, "byteorder": "little", "hosts": hosts, "columns": columns, "mintime_avail": min_timestamp, "maxtime_avail": max_timestamp, "step": step,
+		"states": { "hosts": dict((name, getattr(Node, name)) for name in _HOST_STATE_NAMES),
+			"requests": dict((name, getattr(Request, name)) for name in _REQUEST_STATE_NAMES) } }
+	with open(os.path.join(folder, "columns.json"), "w") as f:
+		json.dump(description, f, indent = 1, sort_keys = True)
+	return description
+
+def export_npz(connection_string, FROM, TO, filename, step = 0):
+	# Exports the columns to a numpy .npz file (numpy is needed); the timestamps are kept delta encoded
+	try:
+		import numpy
+	except ImportError:
+		raise Exception("numpy is needed to export the data to a .npz file")
+	import tempfile
+	import shutil
+	import json
+	folder = tempfile.mkdtemp()
+	try:
+		description = export_columns(connection_string, FROM, TO, folder, step)
+		arrays = {}
+		for name, column in description["columns"].items():
+			if "dtype" in column:
+				arrays[name] = numpy.fromfile(os.path.join(folder, column["file"]), dtype = column["dtype"])
+			else:
+				with open(os.path.join(folder, column["file"])) as f:
+					arrays[name] = numpy.array(f.read().splitlines())
+		arrays["hosts"] = numpy.array(description["hosts"])
+		arrays["columns.json"] = numpy.array(json.dumps(description))
+		numpy.savez_compressed(filename, **arrays)
+	finally:
+		shutil.rmtree(folder)
+	return description
+
+def _get_data_versions(db):
+	# Gets the values that change when there is new information in the database: the last row of host_monitoring and requests, the
+	#   last change of state of the requests (they are updated in place) and the progress of the rollups (they delete raw information)
+	versions = []
+	for sql in [ "select max(x) from host_monitoring", "select max(x), max(timestamp_state) from requests", "select timestamp from rollup_progress where name = 'host_monitoring'" ]:
+		result, _, rows = db.sql_query(sql)
+		if result and len(rows) > 0:
+			versions += [ v if v is not None else 0 for v in rows[0] ]
+		else:
+			versions += [ 0 ] * (sql.count(",") + 1)
+	return tuple(versions)
+
+class _ReportsCacheEntry(object):
+	def __init__(self, FROM, TO, step):
+		self.FROM = FROM
+		self.TO = TO
+		self.step = step
+		self.versions = None
+		self.hostevents = {}
+		self.requests = collections.OrderedDict()
+		self.min_timestamp = None
+		self.max_timestamp = None
+		self.t = 0
+		self._hosts = {}
+		self._window = None
+		self._requests_window = None
+		self._responses = {}
+
+	def _add_host_event(self, name, row):
+		if name not in self._hosts:
+			self._hosts[name] = _HostEvents(self.step)
+			self.hostevents[name] = []
+		event = self._hosts[name].add(*row)
+		if event is not None:
+			self.hostevents[name].append(_event_dict(event))
+
+	def build(self, db, versions, check = None):
+		# The versions are obtained before reading the information, so the rows that are read now and after (in extend) are
+		#   discarded by _HostEvents and replaced in the requests
+		self.versions = versions
+		FROM, TO, self.min_timestamp, self.max_timestamp, rollup_to = _get_reports_window(db, self.FROM, self.TO)
+		self._window = (FROM, TO)
+		for row in _host_rows(db, FROM, TO, rollup_to, check):
+			self._add_host_event(row[0], row[2:])
+
+		FROM, TO, _, _ = _get_requests_window(db, self.FROM, self.TO)
+		self._requests_window = (FROM, TO)
+		for request in _requests_rows(db, FROM, TO, check = check):
+			self.requests[request["id"]] = request
+		self.t = cpyutils.eventloop.now()
+		self._responses = {}
+
+	def can_extend(self, versions):
+		# The entries can be extended with the new information if nothing has been rolled up and the window does not depend on the
+		#   end of the information (except for the "up to the end" case, that is extended to the new information)
+		return (self.versions is not None) and (versions[3] == self.versions[3]) and (self.FROM >= 0) and (self.TO >= 0)
+
+	def extend(self, db, versions, check = None):
+		FROM, TO = self._window
+		if self.TO == 0:
+			TO = sys.maxsize
+		for row in _query_iterator(db, "select name, timestamp, slots_count, slots_count - slots_free, memory_total, memory_total - memory_free, state from host_monitoring where x > %d and timestamp >= %d and timestamp <= %d order by name, timestamp" % (self.versions[0], FROM, TO), check = check):
+			self._add_host_event(row[0], row[1:])
+			if (self.max_timestamp is None) or (row[1] > self.max_timestamp): self.max_timestamp = row[1]
+			if self.min_timestamp is None: self.min_timestamp = row[1]
+
+		FROM, TO = self._requests_window
+		if self.TO == 0:
+			TO = sys.maxsize
+		for request in _requests_rows(db, FROM, TO, "x > %d or timestamp_state >= %d" % (self.versions[1], self.versions[2]), check):
+			self.requests[request["id"]] = request
+
+		self.versions = versions
+		self.t = cpyutils.eventloop.now()
+		self._responses = {}
+
+	# The entries are modified by extend, so etag and response must be called holding the lock of the cache (see ReportsCache.get)
+	def etag(self):
+		import hashlib
+		return '"%s"' % hashlib.md5(repr((self.FROM, self.TO, self.step, self.versions)).encode("utf-8")).hexdigest()
+
+	def response(self, prepare_js = False, gzipped = False):
+		# Gets the serialized information (it is serialized only once for each version of the information)
+		key = (prepare_js, gzipped)
+		if key not in self._responses:
+			if gzipped:
+				import gzip
+				import io
+				data = io.BytesIO()
+				f = gzip.GzipFile(fileobj = data, mode = "wb", mtime = 0)
+				f.write(self.response(prepare_js, False).encode("utf-8"))
+				f.close()
+				self._responses[key] = data.getvalue()
+			else:
+				import json
+				result = json.dumps({ "hostevents": self.hostevents, "requests": list(self.requests.values()), "mintime_avail": self.min_timestamp, "maxtime_avail": self.max_timestamp, "t": self.t })
+				if prepare_js:
+					result = "var cluesdata=%s;" % result
+				self._responses[key] = result
+		return self._responses[key]
+
+class ReportsCache(object):
+	# Keeps the information for the reports of the most recently used windows of time (i.e. (FROM, TO, step)), so that it is
+	#   not read from the database on each request. When there is new information in the database, the entries are extended
+	#   with the new rows instead of being read again (except if the information has been rolled up). The entries are only
+	#   accessed holding the lock, and the callers get the serialized information (that is immutable)
+	def __init__(self, connection_string, size = 8):
+		self._connection_string = connection_string
+		self._size = size
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, FROM, TO, step = 0, prepare_js = False, gzipped = False, check = None):
+		# Returns the tuple (etag, body) with the information for the window (check is called while the information is read, see
+		#   _query_iterator)
+		key = (FROM, TO, step)
+		with self._lock:
+			db = cpyutils.db.DB.create_from_string(self._connection_string)
+			versions = _get_data_versions(db)
+
+			entry = self._entries.pop(key, None)
+			if entry is None or not (entry.versions == versions or entry.can_extend(versions)):
+				entry = _ReportsCacheEntry(FROM, TO, step)
+				entry.build(db, versions, check)
+			elif entry.versions != versions:
+				entry.extend(db, versions, check)
+
+			self._entries[key] = entry
+			while len(self._entries) > max(1, self._size):
+				self._entries.popitem(last = False)
+			return entry.etag(), entry.response(prepare_js, gzipped)
@@ -18,6 +18,7 @@
 import cpyutils.eventloop
 import logging
 import time
+import threading
 
 import cpyutils.log
 _LOGGER = cpyutils.log.Log("REQ")
@@ -61,7 +62,10 @@ class _Request():
     DISCARDED = -3       # The request has been discarded by the server, probably because it has been attended too many times without success
     UNKNOWN = -4
 
-    STATE2STR = { PENDING: 'pending', ATTENDED: 'attended', SERVED: 'served', BLOCKED: 'blocked', DISSAPEARED: 'dissapeared', NOT_SERVED: 'not-served', UNKNOWN: 'unknown' }
+    STATE2STR = { PENDING: 'pending', ATTENDED: 'attended', SERVED: 'served', BLOCKED: 'blocked', DISSAPEARED: 'dissapeared', NOT_SERVED: 'not-served', DISCARDED: 'discarded', UNKNOWN: 'unknown' }
+
+    # The states in which the request is not waiting for resources anymore
+    FINAL_STATES = [ SERVED, NOT_SERVED, DISSAPEARED ]
     
     def __init__(self, resources, job_id = None, job_nodes = [], req_id = None):
         self.id = req_id
@@ -73,6 +77,13 @@ class _Request():
         self.state = Request.PENDING
         self.job_id = job_id
         self.job_nodes_ids = job_nodes
+        self._finished = threading.Event()
+
+    def _update_finished(self):
+        if self.state in self.FINAL_STATES:
+            self._finished.set()
+        else:
+            self._finished.clear()
 
     def set_state(self, state):
         if self.state != state:
@@ -81,9 +92,15 @@ class _Request():
             if state == Request.ATTENDED:
                 self.timestamp_attended = self.timestamp_state
                 self.attended_retries += 1
+            self._update_finished()
             return True
         return False
 
+    def wait_finished(self, timeout = None):
+        # Blocks until the request reaches a final state (or the timeout, in seconds, expires) and returns whether it has finished
+        #   or not; the waiters are woken up by set_state, so there is no need to poll the state of the request
+        return self._finished.wait(timeout)
+
     def update(self, req):
         self.resources = req.resources
         self.set_state(req.state)
@@ -105,6 +122,7 @@ class _Request():
         new.id = self.id
         new.job_id = self.job_id
         new.job_nodes_ids = self.job_nodes_ids
+        new._update_finished()
         return new
 
     def copy(self):
@@ -117,10 +135,13 @@ class _Request():
 
 class Request(_Request):
     _ID = 0
+    _ID_LOCK = threading.Lock()
     @staticmethod
     def _get_id():
-        Request._ID = Request._ID + 1
-        return Request._ID
+        # The requests may be created from the threads of the server
+        with Request._ID_LOCK:
+            Request._ID = Request._ID + 1
+            return Request._ID
 
     def __init__(self, resources, job_id = None, job_nodes = []):
         _Request.__init__(self, resources, job_id, job_nodes, Request._get_id())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import socket
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import cpyutils.log
+_LOGGER = cpyutils.log.Log("RPCSERVER")
+
+def parse_endpoint_timeouts(endpoint_timeouts):
+    # Parses a string in the form "endpoint1=T1,endpoint2=T2" to a dictionary { "endpoint1": T1, "endpoint2": T2 }
+    timeouts = {}
+    for entry in endpoint_timeouts.split(","):
+        entry = entry.strip()
+        if entry == "":
+            continue
+        try:
+            endpoint, timeout = entry.split("=", 1)
+            timeouts[endpoint.strip()] = float(timeout)
+        except:
+            _LOGGER.error("ignoring invalid timeout '%s' for the endpoints of the server" % entry)
+    return timeouts
+
+class CallTimeout(Exception):
+    pass
+
+# The time limit of the call that is being attended by each thread (see deadline)
+_CALL = threading.local()
+
+class deadline(object):
+    # Sets the time limit (timeout seconds from now) for the call attended by the current thread within the block; if timeout is
+    #   None there is no limit, and the nested blocks cannot extend the limit of the outer ones. The threads cannot be interrupted,
+    #   so the calls that can block must apply the limit themselves, either limiting their waits (remaining_time) or checking it
+    #   from time to time (check_deadline).
+    def __init__(self, timeout):
+        self._timeout = timeout
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getattr(_CALL, "deadline", None)
+        if self._timeout is not None:
+            limit = time.time() + max(0, self._timeout)
+            if (self._previous is None) or (limit < self._previous):
+                _CALL.deadline = limit
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        _CALL.deadline = self._previous
+        return False
+
+def remaining_time(timeout = None):
+    # Returns the time that a call can wait: timeout limited to the time until the deadline of the current call (None means
+    #   that there is no limit)
+    limit = getattr(_CALL, "deadline", None)
+    if limit is None:
+        return timeout
+    remaining = max(0, limit - time.time())
+    if timeout is None:
+        return remaining
+    return min(timeout, remaining)
+
+def check_deadline():
+    # Raises CallTimeout if the deadline of the current call has expired
+    limit = getattr(_CALL, "deadline", None)
+    if (limit is not None) and (time.time() > limit):
+        raise CallTimeout("the call did not finish in the time set for it")
+
+_RESPONSE_BUSY = b"HTTP/1.0 503 Service Unavailable\r\nContent-Type: text/plain\r\nContent-Length: 11\r\nConnection: close\r\n\r\nserver busy"
+# The max time (for the whole connection) and amount of data that are read from a rejected connection before closing it
+_REJECT_DRAIN_TIMEOUT = 1
+_REJECT_DRAIN_SIZE = 1048576
+
+class ThreadPoolMixIn:
+    # Mix-in class for the socketserver servers that attends the connections using a fixed pool of workers instead of the thread
+    #   that runs serve_forever. The accepted connections wait in a queue of up to rpc_queue_size connections until a worker is
+    #   free; if the queue is full, the connection is answered with "503 Service Unavailable" and closed, so that the clients
+    #   do not wait forever when the server is overloaded.
+    #
+    # The calls that wait for something (e.g. request_wait) must be run using call_waiting, so that they do not take the workers
+    #   from the rest of calls.
+    #
+    # The mix-in must be set before the server class (e.g. class server(ThreadPoolMixIn, SimpleXMLRPCServer)), and
+    #   setup_pool must be called before serving.
+    rpc_workers = 8
+    rpc_queue_size = 64
+    rpc_timeouts = {}
+    rpc_max_waiting = 256
+
+    def setup_pool(self, workers = None, queue_size = None, timeouts = None, max_waiting = None):
+        if workers is not None:
+            self.rpc_workers = max(1, workers)
+        if queue_size is not None:
+            self.rpc_queue_size = queue_size
+        if timeouts is not None:
+            self.rpc_timeouts = timeouts
+        if max_waiting is not None:
+            self.rpc_max_waiting = max(0, max_waiting)
+        # A non-positive size means that the queue is not bounded
+        self._rpc_queue = queue.Queue(max(0, self.rpc_queue_size))
+        self._rpc_lock = threading.Lock()
+        self._rpc_threads = 0
+        self._rpc_waiting = 0
+        with self._rpc_lock:
+            while self._rpc_threads < self.rpc_workers:
+                self._start_worker()
+
+    def _start_worker(self):
+        # Must be called with the lock acquired
+        th = threading.Thread(target = self._rpc_work, name = "rpc-worker-%d" % self._rpc_threads)
+        th.daemon = True
+        self._rpc_threads += 1
+        th.start()
+
+    def endpoint_timeout(self, endpoint):
+        # The time limit for the calls to the endpoint (None if it has no limit); see deadline
+        timeout = self.rpc_timeouts.get(endpoint, None)
+        if (timeout is None) or (timeout <= 0):
+            return None
+        return timeout
+
+    def waiting_calls(self):
+        return self._rpc_waiting
+
+    def call_waiting(self, function, parameters):
+        # Calls a function that waits for something (e.g. request_wait). The call is attended by the current worker, but another
+        #   worker is started while it waits (and one of them ends afterwards), so the pool always has rpc_workers workers for
+        #   the rest of calls. If there are already rpc_max_waiting calls waiting, the function is called with a deadline of 0
+        #   seconds, so that it returns at once (the clients are expected to call again).
+        with self._rpc_lock:
+            parked = self._rpc_waiting < self.rpc_max_waiting
+            if parked:
+                self._rpc_waiting += 1
+                self._start_worker()
+
+        if not parked:
+            _LOGGER.warning("there are %d calls waiting, so a new call will not wait" % self.rpc_max_waiting)
+            with deadline(0):
+                return function(*parameters)
+
+        try:
+            return function(*parameters)
+        finally:
+            with self._rpc_lock:
+                self._rpc_waiting -= 1
+
+    def queued_requests(self):
+        return self._rpc_queue.qsize()
+
+    def process_request(self, request, client_address):
+        try:
+            self._rpc_queue.put_nowait((request, client_address))
+        except queue.Full:
+            _LOGGER.warning("rejecting a connection from %s because there are %d connections waiting to be attended" % (client_address[0], self._rpc_queue.qsize()))
+            # The rejected connections are attended in the thread that accepts the connections, so a client that sends its
+            #   request slowly must not block it for longer than the deadline
+            deadline = time.time() + _REJECT_DRAIN_TIMEOUT
+            try:
+                request.settimeout(_REJECT_DRAIN_TIMEOUT)
+                request.sendall(_RESPONSE_BUSY)
+                # The request of the client is read (up to a limit) before closing the connection; otherwise the connection may
+                #   be reset while the client is still sending it, and the client gets an error instead of the response
+                request.shutdown(socket.SHUT_WR)
+                drained = 0
+                remaining = deadline - time.time()
+                while (drained < _REJECT_DRAIN_SIZE) and (remaining > 0):
+                    request.settimeout(remaining)
+                    data = request.recv(65536)
+                    if len(data) == 0:
+                        break
+                    drained += len(data)
+                    remaining = deadline - time.time()
+            except:
+                pass
+            self.shutdown_request(request)
+
+    def _rpc_work(self):
+        while True:
+            request, client_address = self._rpc_queue.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            try:
+                self.shutdown_request(request)
+            except Exception:
+                pass
+
+            # The workers that were started while other calls were waiting end once those calls have finished
+            with self._rpc_lock:
+                if self._rpc_threads > self.rpc_workers + self._rpc_waiting:
+                    self._rpc_threads -= 1
+                    return
@@ -34,7 +34,10 @@ except:
             "SCHEDULER_CLASSES": "",
             "RETRIES_POWER_ON": 3,
             "RETRIES_POWER_OFF": 3,
-            "PERIOD_RECOVERY_NODES": 30
+            "PERIOD_RECOVERY_NODES": 30,
+            "POWER_OPERATIONS_WORKERS": 0,
+            "POWER_OPERATIONS_PLUGIN_CONCURRENCY": "",
+            "PERIOD_POWER_OPERATIONS_RESULTS": 1
         })
 
 import cpyutils.log
@@ -46,7 +49,7 @@ def _allocate_nodes(resources, nodelist, node_ids, count):
     n_allocations = min(n_nodes, count)
     allocated_nodes = []
     for i in range(0, n_allocations):
-        nodelist.get_node(node_ids[i]).allocate(resources)
+        nodelist.allocate(node_ids[i], resources)
         allocated_nodes.append(node_ids[i])
         count -= 1
     return count, allocated_nodes
@@ -54,17 +57,18 @@ def _allocate_nodes(resources, nodelist, node_ids, count):
 
 def _nodes_meet_resources(resources, _nodelist, node_ids):
     
-    # First we duplicate the list to check whether we can meet the resources or not
+    # First we duplicate the list to check whether we can meet the resources or not (the nodes are only copied if they are allocated)
     nodelist = _nodelist.duplicate()
     
     taskcount = resources.taskcount
     nodes_allocated = []
     
     for n_id in node_ids:
-        node = nodelist.get_node(n_id)
+        if taskcount == 0:
+            break
         taskspernode = resources.maxtaskspernode
-        while node.meets_resources(resources.resources) and taskcount > 0 and taskspernode > 0:
-            node.allocate(resources.resources)
+        while nodelist.get_node(n_id).meets_resources(resources.resources) and taskcount > 0 and taskspernode > 0:
+            nodelist.allocate(n_id, resources.resources)
             nodes_allocated.append(n_id)
             taskspernode -= 1
             taskcount -= 1
@@ -77,8 +81,7 @@ def _nodes_meet_resources(resources, _nodelist, node_ids):
 def _allocate_nodes0(resources, nodelist, node_ids):
     taskcount = resources.taskcount
     for n_id in node_ids:
-        node = nodelist.get_node(n_id)
-        node.allocate(resources.resources)
+        nodelist.allocate(n_id, resources.resources)
         taskcount -= 1
     return taskcount
 
@@ -229,8 +232,7 @@ class BookingSystem:
                 if still_waiting or (current_request.timestamp_state > monitoring_info.timestamp_nodelist):
                     # _LOGGER.debug("request %s will be pending of its resources" % r_id)
                     for n_id in book_info.node_ids:
-                        node = monitoring_info.nodelist.get_node(n_id)
-                        node.allocate(current_request.resources.resources)
+                        monitoring_info.nodelist.allocate(n_id, current_request.resources.resources)
                 else:
                     _LOGGER.debug("request %s now has all the nodes that it was waiting for in a state in which the request should be reconsidered" % r_id)
                     r_ids_to_cleanup.append(r_id)
@@ -240,8 +242,7 @@ class BookingSystem:
                 # Once the request is served, the LRMS monitoring system will not take into account immdiately, so we'll allocate the resources for a while to take them into account
                 if (monitoring_info.timestamp_nodelist - current_request.timestamp_state < self._COOLDOWN_SERVED_REQUESTS):
                     for n_id in book_info.node_ids:
-                        node = monitoring_info.nodelist.get_node(n_id)
-                        node.allocate(current_request.resources.resources)
+                        monitoring_info.nodelist.allocate(n_id, current_request.resources.resources)
                 else:
                     _LOGGER.debug("deallocating resources for request %s, as it was served some time ago" % r_id)
                     r_ids_to_cleanup.append(r_id)
@@ -332,7 +333,7 @@ class CLUES_Scheduler_PowOn_Requests(CLUES_Scheduler):
         self._booking_system.make_books(monitoring_info, requests_queue)
         # self._preprocess_requests_and_allocations(monitoring_info, requests_queue)
         nodelist = monitoring_info.nodelist
-        nodes_powering_on = [ x.name for x in nodelist if x.state in [Node.POW_ON] ]
+        nodes_powering_on = nodelist.get_nodes_meeting(states = [Node.POW_ON])
         # _LOGGER.debug("nodes powering on: %s" % nodes_powering_on)
         # _LOGGER.debug("scheduling @%d" % self._sched_time)
         # _LOGGER.debug("%s" % nodelist)
@@ -387,10 +388,8 @@ class CLUES_Scheduler_PowOn_Requests(CLUES_Scheduler):
 
                 request_held = True
 
-                nodelist.FILTER_reset()
-                nodelist.FILTER_basic(current_req.resources.resources, states = [Node.IDLE, Node.USED, Node.ON_ERR])
-                node_count_on = nodelist.FILTER_count()
-                nodes_on = list(nodelist.get_nodelist_filtered().keys())
+                nodes_on = nodelist.get_nodes_meeting(current_req.resources.resources, states = [Node.IDLE, Node.USED, Node.ON_ERR])
+                node_count_on = len(nodes_on)
                 
                 # Case 1: are there enough resources with those that are ON?
                 node_pool = nodes_on
@@ -416,10 +415,8 @@ class CLUES_Scheduler_PowOn_Requests(CLUES_Scheduler):
 
                 # Case 2: (if not served) are there enough resources with those that are being powered on?
                 if request_held:
-                    nodelist.FILTER_reset()
-                    nodelist.FILTER_basic(current_req.resources.resources, states = [Node.POW_ON])
-                    node_count_powon = nodelist.FILTER_count()
-                    nodes_powon = list(nodelist.get_nodelist_filtered().keys())
+                    nodes_powon = nodelist.get_nodes_meeting(current_req.resources.resources, states = [Node.POW_ON])
+                    node_count_powon = len(nodes_powon)
     
                     node_pool = node_pool + nodes_powon # The nodes that are powering on are likely to be used to serve the request
                     resources_met, nodes_meeting_resources = _nodes_meet_resources(current_req.resources, nodelist, node_pool)
@@ -441,10 +438,8 @@ class CLUES_Scheduler_PowOn_Requests(CLUES_Scheduler):
                 #      *** remember that we serve multiple requests in one pass, so there are nodes that we will call for power on when we finish scheduling, but they are not being powered on for the monitor, yet.
                 # TODO: it is possible to include a system to recover OFF_ERR nodes and re-try powering on nodes
                 if request_held:
-                    nodelist.FILTER_reset()
-                    nodelist.FILTER_basic(current_req.resources.resources, enabled = True, states = [Node.OFF])
-                    node_count_off = nodelist.FILTER_count()
-                    nodes_off = list(nodelist.get_nodelist_filtered().keys())
+                    nodes_off = nodelist.get_nodes_meeting(current_req.resources.resources, enabled = True, states = [Node.OFF])
+                    node_count_off = len(nodes_off)
     
                     nodes_off_but_powon = [ n_id for n_id in nodes_off if n_id in local_candidates_on ]
                     node_count_off_but_powon = len(nodes_off_but_powon)
@@ -474,10 +469,8 @@ class CLUES_Scheduler_PowOn_Requests(CLUES_Scheduler):
 
                 # Case 5: (if not served) will be enough resources with those that are being powered off?
                 if request_held:
-                    nodelist.FILTER_reset()
-                    nodelist.FILTER_basic(current_req.resources.resources, enabled = True, states = [Node.POW_OFF])
-                    node_count_powoff = nodelist.FILTER_count()
-                    nodes_powoff = list(nodelist.get_nodelist_filtered().keys())
+                    nodes_powoff = nodelist.get_nodes_meeting(current_req.resources.resources, enabled = True, states = [Node.POW_OFF])
+                    node_count_powoff = len(nodes_powoff)
     
                     
                     node_pool = node_pool + nodes_powoff    # The nodes that are being powered off are likely to be used to serve the request
@@ -527,7 +520,8 @@ class CLUES_Scheduler_PowOn_Requests(CLUES_Scheduler):
                 if still_needed > 0:
                     self.debug(current_req, "%d allocated nodes, but still need %d more nodes to serve the request" % (len(nodes_meeting_resources), still_needed))
 
-                nodes_off = [ x for x in nodes_meeting_resources if (x in nodes_off) or (x in nodes_powoff) ]
+                nodes_to_power_on = set(nodes_off + nodes_powoff)
+                nodes_off = [ x for x in nodes_meeting_resources if x in nodes_to_power_on ]
                 for n_id in nodes_off:
                     if n_id not in candidates_on:
                         local_candidates_on[n_id] = []
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import collections
+import copy
+
+from .node import NodeList
+
+class StateSnapshot(object):
+    # The state of the daemon (nodes, requests and jobs) at some moment. The snapshots are published by the event loop and they
+    #   are never modified afterwards, so they can be read from any thread without locks; the objects that they contain MUST
+    #   be considered as read-only.
+    #
+    # Each snapshot has a version, that is increased each time that the state changes, and the version in which each node,
+    #   request and job changed for the last time (e.g. to get the items that have changed since a version). The membership
+    #   versions are the versions in which any node, request or job was added or removed for the last time.
+    def __init__(self, version = 0, timestamp = 0, nodes = None, node_versions = None, requests = None, request_versions = None, jobs = None, job_versions = None, timestamp_nodelist = -1, timestamp_joblist = -1, membership_versions = (0, 0, 0)):
+        self.version = version
+        self.timestamp = timestamp
+        self.nodes = nodes if nodes is not None else collections.OrderedDict()
+        self.node_versions = node_versions if node_versions is not None else {}
+        self.requests = requests if requests is not None else collections.OrderedDict()
+        self.request_versions = request_versions if request_versions is not None else {}
+        self.jobs = jobs if jobs is not None else collections.OrderedDict()
+        self.job_versions = job_versions if job_versions is not None else {}
+        self.timestamp_nodelist = timestamp_nodelist
+        self.timestamp_joblist = timestamp_joblist
+        self.membership_versions = membership_versions
+
+    def get_node(self, nname):
+        return self.nodes.get(nname, None)
+
+    def get_request(self, r_id):
+        return self.requests.get(r_id, None)
+
+    def get_nodelist(self):
+        # The NodeList shares the nodes of the snapshot (it only copies them if they are allocated through the list)
+        return NodeList(self.nodes)
+
+def _node_signature(node):
+    # The values of the node that are shown to the readers (the timestamp of the monitoring information is not included, because
+    #   it changes each time that the node is monitored)
+    return (node.state, node.enabled, node.slots_count, node.slots_free, node.memory_total, node.memory_free, node.timestamp_state, node.get_keywords_version(), node.timestamp_poweredon, node.timestamp_poweredoff, node.power_on_operation_failed, node.power_off_operation_failed)
+
+def _request_signature(request):
+    # The resources are not included, because the monitoring of the jobs creates new objects each time, although they do not change
+    return (request.state, request.timestamp_state, request.timestamp_attended, request.job_id, request.job_nodes_ids)
+
+class SnapshotPublisher(object):
+    # Publishes the snapshots of the state of the daemon. The objects that have not changed since the previous snapshot are shared
+    #   with it, so publishing a snapshot only copies the nodes, requests and jobs that have changed; if nothing has changed, the
+    #   previous snapshot is kept.
+    #
+    # publish must be called from a single thread (or holding a lock), while get can be called from any thread.
+    def __init__(self):
+        self._snapshot = StateSnapshot()
+        # The signature and the copy of each item of the last snapshot
+        self._nodes = {}
+        self._requests = {}
+        self._jobs = {}
+
+    def get(self):
+        return self._snapshot
+
+    @staticmethod
+    def _update(previous, previous_versions, items, signature, version):
+        # Returns the copies of the items, the version in which each one changed, whether any of them has changed and whether any
+        #   of them has been added or removed
+        current = collections.OrderedDict()
+        versions = {}
+        membership_changed = len(items) != len(previous)
+        changed = membership_changed
+        for key, item in items:
+            sig = signature(item)
+            old = previous.get(key, None)
+            if (old is not None) and (old[0] == sig):
+                current[key] = old
+                versions[key] = previous_versions[key]
+            else:
+                if old is None:
+                    membership_changed = True
+                current[key] = (sig, copy.copy(item))
+                versions[key] = version
+                changed = True
+        return current, versions, changed, membership_changed
+
+    def publish(self, nodes, requests, jobs, timestamp_nodelist, timestamp_joblist, now):
+        # nodes is a dictionary of nodes (or None), and requests and jobs are iterables of requests (or None)
+        previous = self._snapshot
+        version = previous.version + 1
+
+        node_items = list(nodes.items()) if nodes is not None else []
+        request_items = [ (r.id, r) for r in requests ] if requests is not None else []
+        job_items = [ (j.id, j) for j in jobs ] if jobs is not None else []
+
+        nodes_c, node_versions, nodes_changed, nodes_membership = self._update(self._nodes, previous.node_versions, node_items, _node_signature, version)
+        requests_c, request_versions, requests_changed, requests_membership = self._update(self._requests, previous.request_versions, request_items, _request_signature, version)
+        jobs_c, job_versions, jobs_changed, jobs_membership = self._update(self._jobs, previous.job_versions, job_items, _request_signature, version)
+
+        if not (nodes_changed or requests_changed or jobs_changed) and (timestamp_nodelist == previous.timestamp_nodelist) and (timestamp_joblist == previous.timestamp_joblist):
+            return previous
+
+        if not (nodes_changed or requests_changed or jobs_changed):
+            # Only the timestamps of the monitoring have changed, so the version is kept
+            version = previous.version
+
+        membership_versions = [ version if m else v for (m, v) in zip([ nodes_membership, requests_membership, jobs_membership ], previous.membership_versions) ]
+
+        self._nodes, self._requests, self._jobs = nodes_c, requests_c, jobs_c
+        self._snapshot = StateSnapshot(version, now,
+            collections.OrderedDict((k, v[1]) for (k, v) in nodes_c.items()), node_versions,
+            collections.OrderedDict((k, v[1]) for (k, v) in requests_c.items()), request_versions,
+            collections.OrderedDict((k, v[1]) for (k, v) in jobs_c.items()), job_versions,
+            timestamp_nodelist, timestamp_joblist, tuple(membership_versions))
+        return self._snapshot
+
+# The values of the nodes and the requests (and jobs) in the compact representation of the status
+STATUS_NODE_FIELDS = [ "state", "enabled", "slots_count", "slots_free", "memory_total", "memory_free", "timestamp_state" ]
+STATUS_REQUEST_FIELDS = [ "state", "timestamp_created", "timestamp_state", "slots", "memory", "taskcount", "job_id" ]
+
+def _status_node(node):
+    return [ node.state2str.get(node.state, str(node.state)), node.enabled, node.slots_count, node.slots_free, node.memory_total, node.memory_free, node.timestamp_state ]
+
+def _status_request(request):
+    return [ request.STATE2STR.get(request.state, str(request.state)), request.timestamp_created, request.timestamp_state, request.resources.resources.slots, request.resources.resources.memory, request.resources.taskcount, request.job_id ]
+
+def get_status(snapshot, since = 0):
+    # Gets a compact representation of the snapshot (a dictionary that can be serialized to JSON): each node, request and job is
+    #   a list with the values in STATUS_*_FIELDS. If since is the version of a previous snapshot, only the items that have changed
+    #   since that version are included, and the ids of all the items are included only if any item has been added or removed
+    #   (so that the clients can delete the items that are not in the list); otherwise (or if the version is not valid, e.g.
+    #   because the daemon has been restarted) the whole status is included ("full" is set to True).
+    full = (since <= 0) or (since > snapshot.version)
+    result = {
+        "version": snapshot.version,
+        "timestamp": snapshot.timestamp,
+        "full": full,
+        "fields": { "nodes": STATUS_NODE_FIELDS, "requests": STATUS_REQUEST_FIELDS, "jobs": STATUS_REQUEST_FIELDS }
+    }
+    for (key, items, versions, to_values, membership_version) in [
+            ("nodes", snapshot.nodes, snapshot.node_versions, _status_node, snapshot.membership_versions[0]),
+            ("requests", snapshot.requests, snapshot.request_versions, _status_request, snapshot.membership_versions[1]),
+            ("jobs", snapshot.jobs, snapshot.job_versions, _status_request, snapshot.membership_versions[2]) ]:
+        if full:
+            result[key] = collections.OrderedDict((str(k), to_values(v)) for (k, v) in items.items())
+        else:
+            result[key] = collections.OrderedDict((str(k), to_values(v)) for (k, v) in items.items() if versions[k] > since)
+            if membership_version > since:
+                result["%s_ids" % key] = [ str(k) for k in items.keys() ]
+    return result
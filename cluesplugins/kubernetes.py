@@ -20,7 +20,10 @@ import collections
 import requests
 import base64
 import json
+import threading
+import time
 import cpyutils.config
+import cpyutils.eventloop
 import clueslib.helpers as Helpers
 
 from cpyutils.evaluate import TypedNumber, TypedClass, TypedList
@@ -29,13 +32,161 @@ from clueslib.node import NodeInfo
 from clueslib.platform import LRMS
 from clueslib.request import Request, ResourcesNeeded, JobInfo
 
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
 
 _LOGGER = Log("PLUGIN-KUBERNETES")
 
 
+class ResourceCache(object):
+    """
+    In-memory copy of a list of Kubernetes resources (i.e. nodes or pods) that is kept
+    updated using the list+watch mechanism of the API server: the list is obtained once
+    (in chunks, using limit/continue) and then the changes are applied following the
+    watch stream from the resourceVersion of the list.
+    """
+
+    # Time to wait before retrying when the API server cannot be contacted
+    RETRY_TIME = 5.0
+
+    def __init__(self, kube_lrms, url_path, chunk_size=500, watch_timeout=300):
+        self._lrms = kube_lrms
+        self._url_path = url_path
+        self._chunk_size = chunk_size
+        self._watch_timeout = watch_timeout
+        self._items = collections.OrderedDict()
+        self._resource_version = None
+        self._synced = False
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = False
+
+    @staticmethod
+    def _get_key(item):
+        return "%s/%s" % (item["metadata"].get("namespace", ""), item["metadata"]["name"])
+
+    def _list(self):
+        """
+        Get the full list of resources (in chunks of chunk_size items) and replace the cache.
+        """
+        items = collections.OrderedDict()
+        continue_token = None
+        while True:
+            url = "%s?limit=%d" % (self._url_path, self._chunk_size)
+            if continue_token:
+                url += "&continue=%s" % quote(continue_token)
+            data = self._lrms._create_request('GET', url, self._lrms.auth_data)
+            if data is None:
+                return False
+            for item in data["items"]:
+                items[self._get_key(item)] = item
+            continue_token = data.get("metadata", {}).get("continue")
+            if not continue_token:
+                break
+
+        with self._lock:
+            self._items = items
+            self._resource_version = data.get("metadata", {}).get("resourceVersion")
+            self._synced = True
+        return True
+
+    def _process_event(self, event):
+        """
+        Apply one event of the watch stream to the cache. Returns False if the cache
+        must be listed again (e.g. the resourceVersion is too old).
+        """
+        event_type = event.get("type")
+        obj = event.get("object", {})
+
+        if event_type == "ERROR":
+            _LOGGER.warning("Error watching %s (%s). The list will be obtained again." % (self._url_path,
+                                                                                      obj.get("message")))
+            with self._lock:
+                self._synced = False
+            return False
+
+        with self._lock:
+            if event_type in ["ADDED", "MODIFIED"]:
+                self._items[self._get_key(obj)] = obj
+            elif event_type == "DELETED":
+                self._items.pop(self._get_key(obj), None)
+            resource_version = obj.get("metadata", {}).get("resourceVersion")
+            if resource_version:
+                self._resource_version = resource_version
+        return True
+
+    def _watch(self):
+        """
+        Follow the watch stream from the current resourceVersion until the server closes it.
+        """
+        url = "%s?watch=true&allowWatchBookmarks=true&timeoutSeconds=%d&resourceVersion=%s" % \
+            (self._url_path, self._watch_timeout, quote(str(self._resource_version or "")))
+        resp = self._lrms._create_stream_request('GET', url, self._lrms.auth_data)
+        if resp is None:
+            return False
+
+        try:
+            for line in resp.iter_lines():
+                if self._stop:
+                    break
+                if line:
+                    if not self._process_event(json.loads(line)):
+                        return False
+        except Exception as ex:
+            _LOGGER.error("Error watching %s: %s" % (self._url_path, str(ex)))
+            return False
+        finally:
+            resp.close()
+        return True
+
+    def sync(self):
+        """
+        Run one step of the list+watch loop: list (if needed) and follow the watch stream.
+        """
+        if not self._synced:
+            if not self._list():
+                return False
+        return self._watch()
+
+    def _loop(self):
+        while not self._stop:
+            if not self.sync():
+                time.sleep(self.RETRY_TIME)
+
+    def start(self):
+        """
+        Get the initial list (synchronously) and start following the changes in a thread.
+        """
+        if self._thread is None:
+            self._stop = False
+            if not self._synced:
+                self._list()
+            self._thread = threading.Thread(target=self._loop)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop = True
+        self._thread = None
+
+    def get_data(self):
+        """
+        Get the cached list in the same format of the API server (or None if it is not available).
+        """
+        with self._lock:
+            if not self._synced:
+                return None
+            return {"items": list(self._items.values()), "metadata": {"resourceVersion": self._resource_version}}
+
+
 class lrms(LRMS):
 
     VNODE_FILE = '/etc/clues2/kubernetes_vnodes.info'
+    # Max. time (in seconds) that the pod list obtained when monitoring the nodes is reused to monitor the jobs
+    PODS_DATA_MAX_AGE = 1.0
 
     def _get_auth_header(self, auth):
         """
@@ -72,9 +223,30 @@ class lrms(LRMS):
             _LOGGER.error("Error contacting Kubernetes API: %s" % str(ex))
             return None
 
+    def _create_stream_request(self, method, url, auth_data, headers=None):
+        try:
+            if headers is None:
+                headers = {}
+            auth_header = self._get_auth_header(auth_data)
+            if auth_header:
+                headers.update(auth_header)
+
+            url = "%s%s" % (self._server_url, url)
+            resp = requests.request(method, url, verify=False, headers=headers, stream=True)
+            if resp.status_code == 200:
+                return resp
+            else:
+                _LOGGER.error("Error contacting Kubernetes API: %s - %s" % (resp.status_code, resp.text))
+                resp.close()
+                return None
+        except Exception as ex:
+            _LOGGER.error("Error contacting Kubernetes API: %s" % str(ex))
+            return None
+
     def __init__(self, KUBERNETES_SERVER=None, KUBERNETES_PODS_API_URL_PATH=None,
                  KUBERNETES_NODES_API_URL_PATH=None, KUBERNETES_TOKEN=None, KUBERNETES_NODE_MEMORY=None,
-                 KUBERNETES_NODE_SLOTS=None, KUBERNETES_NODE_PODS=None):
+                 KUBERNETES_NODE_SLOTS=None, KUBERNETES_NODE_PODS=None, KUBERNETES_WATCH=None,
+                 KUBERNETES_LIST_CHUNK_SIZE=None, KUBERNETES_WATCH_TIMEOUT=None):
 
         config_kube = cpyutils.config.Configuration(
             "KUBERNETES",
@@ -86,6 +258,9 @@ class lrms(LRMS):
                 "KUBERNETES_NODE_MEMORY": "1 GB",
                 "KUBERNETES_NODE_SLOTS": 1,
                 "KUBERNETES_NODE_PODS": 110,
+                "KUBERNETES_WATCH": False,
+                "KUBERNETES_LIST_CHUNK_SIZE": 500,
+                "KUBERNETES_WATCH_TIMEOUT": 300,
             }
         )
 
@@ -100,6 +275,18 @@ class lrms(LRMS):
         self._node_slots = Helpers.val_default(KUBERNETES_NODE_SLOTS, config_kube.KUBERNETES_NODE_SLOTS)
         self._node_pods = Helpers.val_default(KUBERNETES_NODE_PODS, config_kube.KUBERNETES_NODE_PODS)
 
+        self._pods_data = None
+        self._pods_data_timestamp = 0
+
+        self._watch_mode = Helpers.val_default(KUBERNETES_WATCH, config_kube.KUBERNETES_WATCH)
+        chunk_size = Helpers.val_default(KUBERNETES_LIST_CHUNK_SIZE, config_kube.KUBERNETES_LIST_CHUNK_SIZE)
+        watch_timeout = Helpers.val_default(KUBERNETES_WATCH_TIMEOUT, config_kube.KUBERNETES_WATCH_TIMEOUT)
+        self._nodes_cache = None
+        self._pods_cache = None
+        if self._watch_mode:
+            self._nodes_cache = ResourceCache(self, self._nodes_api_url_path, chunk_size, watch_timeout)
+            self._pods_cache = ResourceCache(self, self._pods_api_url_path, chunk_size, watch_timeout)
+
         if token:
             self.auth_data = {"token": token}
         else:
@@ -132,42 +319,76 @@ class lrms(LRMS):
             memory *= 1024 * 1024 * 1024 * 1024
         return memory
 
-    def _get_node_used_resources(self, nodename, pods_data):
-        used_mem = 0
-        used_cpus = 0.0
-        used_pods = 0
-        system_pods = 0
-        used_agpus = 0
-        used_ngpus = 0
-        used_sgx = 0
+    def _get_nodes_used_resources(self, pods_data):
+        """
+        Get the resources used in each node, walking the list of pods only once.
+        Returns a dict indexed by the node name.
+        """
+        nodes_used_resources = {}
         if pods_data:
             for pod in pods_data["items"]:
-                if "nodeName" in pod["spec"] and nodename == pod["spec"]["nodeName"]:
-                    # do not count the number of pods in case finished jobs
-                    if pod["status"]["phase"] not in ["Succeeded", "Failed"]:
-                        # do not count the number of pods in case of system ones
-                        # nor in case of DaemonSets
-                        if (pod["metadata"]["namespace"] in ["kube-system", "kube-flannel"] or
-                                "ownerReferences" in pod["metadata"] and pod["metadata"]["ownerReferences"] and pod["metadata"]["ownerReferences"][0]["kind"] == "DaemonSet"):
-                            system_pods += 1
-                        used_pods += 1
-                        cpus, memory, ngpus, agpus, sgx = self._get_pod_cpus_and_memory(pod)
-                        used_mem += memory
-                        used_cpus += cpus
-                        used_agpus += agpus
-                        used_ngpus += ngpus
-                        used_sgx += sgx
-
-        return used_mem, used_cpus, used_agpus, used_ngpus, used_sgx, used_pods, system_pods
+                nodename = pod["spec"].get("nodeName")
+                # do not count the number of pods in case finished jobs
+                if nodename and pod["status"]["phase"] not in ["Succeeded", "Failed"]:
+                    if nodename not in nodes_used_resources:
+                        nodes_used_resources[nodename] = [0, 0.0, 0, 0, 0, 0, 0]
+                    used = nodes_used_resources[nodename]
+                    # do not count the number of pods in case of system ones
+                    # nor in case of DaemonSets
+                    if (pod["metadata"]["namespace"] in ["kube-system", "kube-flannel"] or
+                            "ownerReferences" in pod["metadata"] and pod["metadata"]["ownerReferences"] and pod["metadata"]["ownerReferences"][0]["kind"] == "DaemonSet"):
+                        used[6] += 1
+                    used[5] += 1
+                    cpus, memory, ngpus, agpus, sgx = self._get_pod_cpus_and_memory(pod)
+                    used[0] += memory
+                    used[1] += cpus
+                    used[2] += agpus
+                    used[3] += ngpus
+                    used[4] += sgx
+
+        return nodes_used_resources
+
+    def _get_pods_data(self, reuse=False):
+        """
+        Get the list of pods from the API server. If reuse is set, the list obtained in the
+        current monitoring tick (i.e. by get_nodeinfolist) is used instead of making a new request.
+        """
+        if self._watch_mode:
+            self._pods_cache.start()
+            return self._pods_cache.get_data()
+
+        now = cpyutils.eventloop.now()
+        if reuse and self._pods_data is not None and (now - self._pods_data_timestamp) <= self.PODS_DATA_MAX_AGE:
+            pods_data = self._pods_data
+        else:
+            pods_data = self._create_request('GET', self._pods_api_url_path, self.auth_data)
+            self._pods_data_timestamp = now
+
+        # the list is only reused once (the next tick must get a fresh list)
+        if reuse:
+            self._pods_data = None
+        else:
+            self._pods_data = pods_data
+        return pods_data
+
+    def _get_nodes_data(self):
+        """
+        Get the list of nodes from the API server (or from the cache in watch mode).
+        """
+        if self._watch_mode:
+            self._nodes_cache.start()
+            return self._nodes_cache.get_data()
+        return self._create_request('GET', self._nodes_api_url_path, self.auth_data)
 
     def get_nodeinfolist(self):
         nodeinfolist = collections.OrderedDict()
 
-        nodes_data = self._create_request('GET', self._nodes_api_url_path, self.auth_data)
+        nodes_data = self._get_nodes_data()
         if nodes_data:
-            pods_data = self._create_request('GET', self._pods_api_url_path, self.auth_data)
+            pods_data = self._get_pods_data()
             if not pods_data:
                 _LOGGER.error("Error getting Kubernetes pod list. Node usage will not be obtained.")
+            nodes_used_resources = self._get_nodes_used_resources(pods_data)
 
             for node in nodes_data["items"]:
                 name = node["metadata"]["name"]
@@ -192,7 +413,7 @@ class lrms(LRMS):
                     _LOGGER.debug("Node %s seems to be master node, skiping." % name)
                 else:
                     used_mem, used_cpus, used_agpus, used_ngpus, used_sgx, used_pods, system_pods = \
-                        self._get_node_used_resources(name, pods_data)
+                        nodes_used_resources.get(name, (0, 0.0, 0, 0, 0, 0, 0))
 
                     memory_free = memory_total - used_mem
                     slots_free = slots_total - used_cpus
@@ -326,7 +547,7 @@ class lrms(LRMS):
         '''
         jobinfolist = []
 
-        pods_data = self._create_request('GET', self._pods_api_url_path, self.auth_data)
+        pods_data = self._get_pods_data(reuse=True)
         if pods_data:
             for pod in pods_data["items"]:
                 if pod["metadata"]["namespace"] not in ["kube-system", "kube-flannel"]:
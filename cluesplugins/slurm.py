@@ -87,6 +87,64 @@ def parse_scontrol(out):
     return r
 
 
+# This function splits a SLURM hostlist by the commas that are not enclosed in brackets
+#   e.g. "wn[0-4,7],gpu01" -> ["wn[0-4,7]", "gpu01"]
+def _split_hostlist(hostlist):
+    items = []
+    depth = 0
+    current = ""
+    for c in hostlist:
+        if c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+        if c == "," and depth == 0:
+            items.append(current)
+            current = ""
+        else:
+            current += c
+    items.append(current)
+    return [ x.strip() for x in items if x.strip() != "" ]
+
+# This function expands the content of a bracket group in a SLURM hostlist, keeping the zero padding
+#   e.g. "0-2,7,09-10" -> ["0", "1", "2", "7", "09", "10"]
+def _expand_range(ranges):
+    values = []
+    for r in ranges.split(","):
+        r = r.strip()
+        if r == "":
+            continue
+        if "-" in r:
+            start, end = r.split("-", 1)
+            width = len(start)
+            for i in range(int(start), int(end) + 1):
+                values.append(str(i).zfill(width))
+        else:
+            values.append(r)
+    return values
+
+# This function expands a SLURM hostlist expression into the list of node names
+#   e.g. "wn[0-2,7],rack[1-2]-n[01-02]" -> ["wn0", "wn1", "wn2", "wn7", "rack1-n01", "rack1-n02", "rack2-n01", "rack2-n02"]
+def expand_hostlist(hostlist):
+    if hostlist in [ "", "(null)" ]:
+        return []
+
+    nodenames = []
+    for item in _split_hostlist(hostlist):
+        expanded = [ "" ]
+        while item:
+            pos1 = item.find("[")
+            pos2 = item.find("]", pos1)
+            if pos1 < 0 or pos2 < 0:
+                expanded = [ x + item for x in expanded ]
+                break
+            prefix = item[:pos1]
+            values = _expand_range(item[pos1+1:pos2])
+            expanded = [ x + prefix + v for x in expanded for v in values ]
+            item = item[pos2+1:]
+        nodenames.extend(expanded)
+    return nodenames
+
 # TODO: consider states in the second line of slurm
 # Function that translates the slurm node state into a valid clues2 node state
 def infer_clues_node_state(state):
@@ -143,9 +201,9 @@ class lrms(LRMS):
         self._jobs = clueslib.helpers.val_default(SLURM_JOBS_COMMAND, config_slurm.SLURM_JOBS_COMMAND)
         clueslib.platform.LRMS.__init__(self, "SLURM_%s" % self._server_ip)
 
-    # Function that recovers the partitions of a node
+    # Function that recovers the partitions of every node with a single call to scontrol
     # A node can be in several queues: SLURM has supported configuring nodes in more than one partition since version 0.7.0
-    def _get_partition(self, node_name):
+    def _get_partitions_index(self):
 
         '''Exit example of scontrol show partitions: 
         PartitionName=wn
@@ -157,8 +215,7 @@ class lrms(LRMS):
         Priority=1 RootOnly=NO ReqResv=NO Shared=NO PreemptMode=OFF
         State=UP TotalCPUs=5 TotalNodes=5 SelectTypeParameters=N/A
         DefMemPerNode=UNLIMITED MaxMemPerNode=UNLIMITED'''
-        
-        res_queue = []
+
         exit = ""
 
         try:
@@ -171,30 +228,30 @@ class lrms(LRMS):
         except Exception as ex:
             _LOGGER.error("could not obtain information about SLURM partitions %s (%s)" % (self._server_ip, exit))
             return None
-        
-        if exit:
-            for key in exit:
-                nodes = str(key["Nodes"])
-                if nodes == node_name:
-                    #nodes is like wn1
-                    res_queue.append(key["PartitionName"])
-                else:
-                    #nodes is like wnone-[0-1]
-                    pos1 = nodes.find("[")
-                    pos2 = nodes.find("]")
-                    pos3 = nodes.find("-", pos1)
-                    if pos1 > -1 and pos2 > -1 and pos3 > -1:
-                        num1 = int(nodes[pos1+1:pos3])
-                        num2 = int(nodes[pos3+1:pos2])
-                        name = nodes[:pos1]
-                        while num1 <= num2:
-                            nodename = name + str(num1)
-                            if nodename == node_name:
-                                res_queue.append(key["PartitionName"])
-                                break;
-                            num1 = num1 + 1
-
-        return res_queue
+
+        # The index contains the list of partitions (in the order that scontrol reports them) for each node
+        partitions_index = {}
+        for key in exit:
+            if "Nodes" not in key or "PartitionName" not in key:
+                continue
+            for nodename in expand_hostlist(str(key["Nodes"])):
+                if nodename not in partitions_index:
+                    partitions_index[nodename] = []
+                if key["PartitionName"] not in partitions_index[nodename]:
+                    partitions_index[nodename].append(key["PartitionName"])
+
+        return partitions_index
+
+    # Function that recovers the partitions of a node
+    def _get_partition(self, node_name, partitions_index = None):
+        if partitions_index is None:
+            partitions_index = self._get_partitions_index()
+            if partitions_index is None:
+                return None
+
+        if node_name in partitions_index:
+            return partitions_index[node_name][:]
+        return []
 
     def get_nodeinfolist(self):      
         nodeinfolist = collections.OrderedDict()
@@ -223,6 +280,9 @@ class lrms(LRMS):
             return None
 
         if exit:
+            # The partitions are obtained only once for the whole list of nodes
+            partitions_index = self._get_partitions_index()
+
             for key in exit:
                 try:
                     name = str(key["NodeName"])
@@ -233,7 +293,9 @@ class lrms(LRMS):
                     memory_free = _translate_mem_value(key["RealMemory"] + ".GB") - _translate_mem_value(key["AllocMem"] + ".GB")
                     state = infer_clues_node_state(str(key["State"]))
                     keywords = {}
-                    queues = self._get_partition(name)
+                    queues = None
+                    if partitions_index is not None:
+                        queues = self._get_partition(name, partitions_index)
                     keywords['hostname'] = TypedClass.auto(name)
                     if queues:
                         keywords['queues'] = TypedList([TypedClass.auto(q) for q in queues])
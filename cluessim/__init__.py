@@ -1,4 +1,6 @@
 from .powermanager import PowerManager_dummy
 from .job import Job
 from .node import Node, NodePool
-from .lrms import LRMS_FIFO
\ No newline at end of file
+from .powermodel import PowerModel, Fixed, Uniform, Empirical
+from .lrms import LRMS_FIFO
+from .simulation import Simulation, EventLoop_Heap
\ No newline at end of file
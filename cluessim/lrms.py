@@ -1,5 +1,7 @@
 import cpyutils.eventloop
 from clueslib.platform import LRMS
+import bisect
+import heapq
 import collections
 from clueslib.node import NodeInfo
 from .node import Node
@@ -8,12 +10,28 @@ from clueslib.request import ResourcesNeeded, JobInfo, Request
 
 _LOGGER = cpyutils.log.Log("DC-LRMS")
 
+def _slots(cores, memory, job):
+    # The number of nodes of the job that fit in the free resources of a node
+    slots = []
+    if job.cores > 0:
+        slots.append(int(cores // job.cores))
+    if job.memory > 0:
+        slots.append(int(memory // job.memory))
+    if len(slots) == 0:
+        return job.nodecount
+    return max(0, min(slots))
+
 class LRMS_FIFO(LRMS):
+    # The number of finished jobs that are kept for the summary (the rest of finished jobs are only counted in the statistics)
+    JOBS_ENDED_KEPT = 1000
+
     def get_jobinfolist(self):
+        # Only the jobs that are queued or running are reported; the state of the queue is not dumped to the log because it is
+        #   called each monitoring period
         _LOGGER.debug("called to JOBINFOLIST")
-        _LOGGER.debug("\n%s" % self.qstat())
         jobinfolist = []
-        for j_id, job in list(self.jobs.items()):
+        for j_id in list(self.jobs_running.keys()) + self.jobs_queue:
+            job = self.jobs[j_id]
             if job.state not in [Job.END, Job.ERR, Job.ABORT]:
                 resources = ResourcesNeeded(job.cores, job.memory, [], job.nodecount)
                 # resources, job_id, nodes_ids
@@ -23,7 +41,6 @@ class LRMS_FIFO(LRMS):
                 else:
                     ji.state = Request.SERVED
                 jobinfolist.append(ji)
-                _LOGGER.debug("job %s, resources: %s" % (j_id, resources))
         return jobinfolist
 
     def get_nodeinfolist(self):
@@ -41,17 +58,67 @@ class LRMS_FIFO(LRMS):
             elif node.state in [ Node.POW_ON, Node.POW_OFF ]:
                 n_info.state = NodeInfo.OFF
         return nodeinfolist
-    
-    def __init__(self, nodepool):
+
+    def __init__(self, nodepool, backfill = False):
+        # If backfill is True, the jobs that are behind the first job in the queue that cannot start may start if they fit in the
+        #   free resources and they are expected to finish before that job could start (EASY backfilling)
         LRMS.__init__(self, "LRMS-FIFO")
         self.nodepool = nodepool
+        self.backfill = backfill
         self.jobs = {}
         self.jobs_queue = []
-        self.jobs_running = []
+        self.jobs_running = collections.OrderedDict()
         self.job2nodes = {}
         self.sched_period = 1
         self.sched_last = 0 # cpyutils.eventloop.now()
-        self.jobs_ended = []
+        # The jobs are removed from self.jobs once they finish, so the memory does not grow with the length of the workload;
+        #   the statistics of the jobs are kept in counters
+        self.jobs_ended = collections.deque(maxlen = LRMS_FIFO.JOBS_ENDED_KEPT)
+        self.jobs_submitted = 0
+        self.jobs_started = 0
+        self.jobs_finished = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        # The index of the nodes that are on and have free resources: for each amount of free cores, a sorted list of (position of
+        #   the node in the pool, name). It is updated when the nodes change their state and when the jobs are assigned or purged
+        self._node_position = {}
+        self._node_free_cores = {}
+        self._free_nodes = {}
+        # The jobs that have been assigned to nodes and have not started yet, and the heap of (end time, sequence, job id) of the
+        #   jobs that are running
+        self._jobs_starting = []
+        self._jobs_ending = []
+        self._jobs_ending_seq = 0
+        # The jobs are only scheduled when a job is queued or the free resources change
+        self._sched_needed = True
+
+        for node in self.nodepool:
+            self._node_changed(node)
+        self.nodepool.add_listener(self._node_changed)
+
+    def _node_changed(self, node):
+        if node.name not in self._node_position:
+            self._node_position[node.name] = len(self._node_position)
+        self._update_free_nodes(node)
+        self._sched_needed = True
+
+    def _update_free_nodes(self, node):
+        key = (self._node_position[node.name], node.name)
+        free_cores = None
+        if (node.state == Node.ON) and ((node.cores > 0) or (node.memory > 0)):
+            free_cores = node.cores
+        indexed_cores = self._node_free_cores.get(node.name, None)
+        if free_cores == indexed_cores:
+            return
+        if indexed_cores is not None:
+            nodes = self._free_nodes[indexed_cores]
+            del nodes[bisect.bisect_left(nodes, key)]
+            if len(nodes) == 0:
+                del self._free_nodes[indexed_cores]
+        if free_cores is not None:
+            bisect.insort(self._free_nodes.setdefault(free_cores, []), key)
+        self._node_free_cores[node.name] = free_cores
 
     def qsub(self, job, info):
         if job.name in self.jobs:
@@ -59,110 +126,200 @@ class LRMS_FIFO(LRMS):
         job.queue()
         self.jobs[job.name] = job
         self.jobs_queue.append(job.name)
+        self.jobs_submitted += 1
+        self._sched_needed = True
         _LOGGER.debug("job %s submitted. %s" % (job.name, info))
         cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event(self.sched_period, description = "job %s to be scheduled" % job.name))
-        
+
     def __str__(self):
         return "%s\n%s\n%s\n%s" % ("Node Pool\n" + "-"*50, str(self.nodepool), "Queue\n" + "-"*50, self.qstat())
-    
+
     def qstat(self):
         retval = ""
-        
+
         jobs = sorted([self.jobs[x] for x in self.jobs], key = lambda x: x.timestamp_creation)
         for j in jobs:
             retval = "%s%s\n" % (retval, self.job2str(j))
-        
+
         return retval
-    
+
     def start_jobs(self):
         ''' this function checks whether the jobs have start or not
             * this simmulates the 'stage in' and other phases.
         '''
         n_started = 0
-        for j_id, nodelist in list(self.job2nodes.items()):
-            j = self.jobs[j_id]
+        jobs_starting = self._jobs_starting
+        self._jobs_starting = []
+        for j in jobs_starting:
             if j.state == Job.INIT:
                 if j.can_start():
                     j.start()
                     _LOGGER.info("job %s started" % (j.name))
+                    heapq.heappush(self._jobs_ending, (j.timestamp_start + j.seconds, self._jobs_ending_seq, j.name))
+                    self._jobs_ending_seq += 1
+                    wait = j.timestamp_start - j.timestamp_creation
+                    self.jobs_started += 1
+                    self.wait_total += wait
+                    self.wait_max = max(self.wait_max, wait)
                     n_started += 1
+                    continue
+            self._jobs_starting.append(j)
         return n_started
-    
+
     def purge_jobs(self):
+        # The running jobs are checked in the order in which they are expected to end, so only the jobs that end are visited
         n_purged = 0
-        for j_id in list(self.job2nodes.keys()):
-            nodelist = self.job2nodes[j_id]
+        while len(self._jobs_ending) > 0:
+            j_id = self._jobs_ending[0][2]
             j = self.jobs[j_id]
-            if j.execution_finished():
-                j.finish()
-                # _LOGGER.info("job %s has finished its execution\n%s" % (j.name, j.summary()))
+            if not j.execution_finished():
+                break
+            heapq.heappop(self._jobs_ending)
+            j.finish()
+            # _LOGGER.info("job %s has finished its execution\n%s" % (j.name, j.summary()))
 
-                for n_id in nodelist:
-                    self.nodepool[n_id].disassign_job(j)
+            nodelist = self.job2nodes[j_id]
+            for n_id in nodelist:
+                self.nodepool[n_id].disassign_job(j)
+            for n_id in set(nodelist):
+                self._update_free_nodes(self.nodepool[n_id])
 
-                del self.job2nodes[j_id]
-                self.jobs_ended.append(j)
-                self.jobs_running.remove(j_id)
-                n_purged += 1
+            del self.job2nodes[j_id]
+            self.jobs_ended.append(j)
+            del self.jobs_running[j_id]
+            del self.jobs[j_id]
+            self.jobs_finished += 1
+            n_purged += 1
 
+        if n_purged > 0:
+            self._sched_needed = True
         return n_purged
-    
+
+    def _find_nodes(self, j):
+        # Finds the nodes for the job among the nodes that have free resources (first fit, in the order of the pool); a node can
+        #   host several of the nodes requested by the job, if it has enough free resources. Returns None if the job does not fit.
+        nodes_assigned = []
+        pending = j.nodecount
+        candidates = [ nodes for (cores, nodes) in self._free_nodes.items() if cores >= j.cores ]
+        for _, n_id in heapq.merge(*candidates):
+            if pending <= 0:
+                break
+            n = self.nodepool[n_id]
+            slots = min(pending, _slots(n.cores, n.memory, j))
+            nodes_assigned.extend([ n_id ] * slots)
+            pending -= slots
+        if pending > 0:
+            return None
+        return nodes_assigned
+
+    def _assign_job(self, j, nodes_assigned):
+        for n_id in nodes_assigned:
+            self.nodepool[n_id].assign_job(j)
+        for n_id in set(nodes_assigned):
+            self._update_free_nodes(self.nodepool[n_id])
+        self.job2nodes[j.name] = nodes_assigned
+        j.assign(nodes_assigned)
+        _LOGGER.info("job %s assigned to nodes %s" % (j.name, nodes_assigned))
+        self.jobs_running[j.name] = j
+        self._jobs_starting.append(j)
+
+    def _shadow_time(self, j):
+        # The time in which the job j could start if the running jobs end when expected (None if it cannot start in the nodes that
+        #   are on). The free resources of the nodes are released in the order in which the jobs end, counting how many of the nodes
+        #   requested by j would fit in the platform.
+        now = cpyutils.eventloop.now()
+        capacity = {}
+        slots = 0
+        for n in self.nodepool:
+            if n.state == Node.ON:
+                capacity[n.name] = [ n.cores, n.memory ]
+                slots += _slots(n.cores, n.memory, j)
+
+        ending = []
+        for r_id, r in self.jobs_running.items():
+            start = r.timestamp_start
+            if start is None:
+                start = now
+            ending.append((start + r.seconds, r_id))
+        ending.sort()
+
+        for t, r_id in ending:
+            r = self.jobs[r_id]
+            for n_id in self.job2nodes[r_id]:
+                if n_id not in capacity:
+                    continue
+                cores, memory = capacity[n_id]
+                slots -= _slots(cores, memory, j)
+                cores, memory = cores + r.cores, memory + r.memory
+                capacity[n_id] = [ cores, memory ]
+                slots += _slots(cores, memory, j)
+            if slots >= j.nodecount:
+                return t
+        return None
+
     def sched(self):
         n_assigned = 0
-        for j_id in self.jobs_queue[:]:
+        now = cpyutils.eventloop.now()
+        queue = []
+        blocked = False
+        shadow = None
+        for i, j_id in enumerate(self.jobs_queue):
             j = self.jobs[j_id]
-            if j.state == Job.INIT:
-                j_clone = j.clone()
-                nodepool = self.nodepool.clone()
-                nodes_assigned = []
-                while j_clone.pending_nodecount() > 0:
-                    assigned = False
-                    for n in nodepool:
-                        # _LOGGER.debug('node: %s %s' % (n.meets_requirements(j_clone) , n))
-                        while n.meets_requirements(j_clone) and not assigned:
-                            n.assign_job(j_clone)
-                            j_clone.assign([n.name])
-                            nodes_assigned.append(n.name)
-                            assigned = True
-                            break
-                        if assigned: break
-                    if not assigned:
-                        # _LOGGER.debug("could not find enough nodes for job %s" % j_id)
-                        return n_assigned
-                        
-                if j_clone.pending_nodecount() == 0:
-                    for n_id in nodes_assigned:
-                        self.nodepool[n_id].assign_job(j)
-                    self.job2nodes[j_id] = nodes_assigned
-                    j.assign(nodes_assigned)
-    
-                    _LOGGER.info("job %s assigned to nodes %s" % (j_id, nodes_assigned))
-                    self.jobs_queue.remove(j_id)
-                    self.jobs_running.append(j_id)
-                    n_assigned += 1
-                else:
-                    # _LOGGER.debug("could not assign job %s to nodes" % (j_id))
-                    return n_assigned
-            
+            if j.state != Job.INIT:
+                queue.append(j_id)
+                continue
+
+            nodes_assigned = None
+            if not blocked:
+                nodes_assigned = self._find_nodes(j)
+            elif (shadow is None) or (now + j.seconds <= shadow):
+                # Backfilling: the job can start if it does not delay the first job in the queue (if that job cannot start in the
+                #   nodes that are on, any job that fits can start)
+                nodes_assigned = self._find_nodes(j)
+                if nodes_assigned is not None:
+                    _LOGGER.debug("job %s backfilled" % j_id)
+
+            if nodes_assigned is None:
+                if not self.backfill:
+                    # _LOGGER.debug("could not find enough nodes for job %s" % j_id)
+                    queue.extend(self.jobs_queue[i:])
+                    break
+                queue.append(j_id)
+                if not blocked:
+                    blocked = True
+                    shadow = self._shadow_time(j)
+                if len(self._free_nodes) == 0:
+                    queue.extend(self.jobs_queue[i + 1:])
+                    break
+                continue
+
+            self._assign_job(j, nodes_assigned)
+            n_assigned += 1
+
+        self.jobs_queue = queue
         return n_assigned
-    
+
+    def active_jobs(self):
+        # The number of jobs that are queued or running
+        return len(self.jobs_queue) + len(self.jobs_running)
+
     def lifecycle(self, force_sched = False):
         t = cpyutils.eventloop.now()
-        force_sched = True
-        if force_sched or ((t - self.sched_last) >= self.sched_period):
-            jobs_purged = self.purge_jobs()
-            if jobs_purged > 0:
-                _LOGGER.debug("%d jobs purged" % (jobs_purged))
+        jobs_purged = self.purge_jobs()
+        if jobs_purged > 0:
+            _LOGGER.debug("%d jobs purged" % (jobs_purged))
+        if force_sched or self._sched_needed:
+            self._sched_needed = False
             self.sched_last = t
             jobs_assigned = self.sched()
             if jobs_assigned > 0:
                 _LOGGER.debug("%d jobs assigned to nodes" % (jobs_assigned))
-            self.start_jobs()
-            #if jobs_started > 0 or jobs_purged > 0:
-            #    _LOGGER.debug("state of the LRMS:\n%s\nstate of the platform:\n%s" % (self.qstat(), str(self.nodepool)))
+        self.start_jobs()
+        #if jobs_started > 0 or jobs_purged > 0:
+        #    _LOGGER.debug("state of the LRMS:\n%s\nstate of the platform:\n%s" % (self.qstat(), str(self.nodepool)))
         return True
         # print self.qstat()
-        
+
     def job2str(self, j):
         j2s = {Job.CREATED: '-', Job.INIT:'Q', Job.RUNNING:'R', Job.ABORT: 'A', Job.END:'F', Job.ERR:'E'}
         retval = "%10s" % (j.name)
@@ -171,8 +328,9 @@ class LRMS_FIFO(LRMS):
         if j.name in self.job2nodes:
             retval = "%s : %s" % (retval, "".join(self.job2nodes[j.name]))
         return retval
-    
+
     def summary(self):
+        # The summary of the last jobs that have finished (see JOBS_ENDED_KEPT)
         retval = ""
         for j in self.jobs_ended:
             retval = "%s%s\n" % (retval, j.summary())
@@ -0,0 +1,109 @@
+import cpyutils.log
+
+_LOGGER = cpyutils.log.Log("DC-POWER")
+
+class Fixed:
+    # The transition always lasts the same time
+    def __init__(self, seconds):
+        self.seconds = float(seconds)
+
+    def sample(self, rng):
+        return self.seconds
+
+    def __str__(self):
+        return "fixed:%s" % self.seconds
+
+class Uniform:
+    # The time of the transition is uniformly distributed between minimum and maximum
+    def __init__(self, minimum, maximum):
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        if self.maximum < self.minimum:
+            raise Exception("invalid uniform distribution (%s > %s)" % (self.minimum, self.maximum))
+
+    def sample(self, rng):
+        return self.minimum + rng.random() * (self.maximum - self.minimum)
+
+    def __str__(self):
+        return "uniform:%s:%s" % (self.minimum, self.maximum)
+
+class Empirical:
+    # The time of the transition is one of the times that have been observed in the real platform (e.g. the times to boot the
+    #   nodes obtained from the logs of IPMI), chosen at random
+    def __init__(self, samples):
+        self.samples = [ float(x) for x in samples ]
+        if len(self.samples) == 0:
+            raise Exception("the empirical distribution needs at least one sample")
+
+    @staticmethod
+    def read(filename):
+        # Reads the samples from a file with one time (in seconds) per line; the lines that start with # are ignored, and so are
+        #   the values after the first one in each line (e.g. the name of the node)
+        samples = []
+        with open(filename) as sample_file:
+            for line in sample_file:
+                line = line.split("#")[0].replace(",", " ").split()
+                if len(line) == 0:
+                    continue
+                try:
+                    samples.append(float(line[0]))
+                except ValueError:
+                    _LOGGER.warning("ignoring invalid sample %s in file %s" % (line[0], filename))
+        return Empirical(samples)
+
+    def sample(self, rng):
+        return rng.choice(self.samples)
+
+    def __str__(self):
+        return "empirical(%d samples)" % len(self.samples)
+
+def parse_distribution(spec):
+    # Creates a distribution from its specification: a number or fixed:<seconds>, uniform:<min>:<max>, empirical:<file> or
+    #   empirical:<seconds>,<seconds>,...
+    spec = spec.strip()
+    kind, _, args = spec.partition(":")
+    try:
+        if args == "":
+            return Fixed(float(kind))
+        if kind == "fixed":
+            return Fixed(float(args))
+        if kind == "uniform":
+            minimum, maximum = args.split(":")
+            return Uniform(float(minimum), float(maximum))
+    except ValueError:
+        raise Exception("invalid distribution %s" % spec)
+    if kind == "empirical":
+        try:
+            return Empirical([ float(x) for x in args.split(",") ])
+        except ValueError:
+            return Empirical.read(args)
+    raise Exception("invalid distribution %s (the valid ones are fixed:<seconds>, uniform:<min>:<max> and empirical:<file>)" % spec)
+
+class PowerModel:
+    # The model of the power transitions of a class of nodes: the distributions of the time to power on and to power off the nodes,
+    #   and the probability of failing to power on (the node gets off) or to power off (the node keeps on). The default model is
+    #   the one that the simulator has always used.
+    def __init__(self, poweron = None, poweroff = None, poweron_failure = 0.05, poweroff_failure = 0.0):
+        if poweron is None:
+            poweron = Uniform(5, 10)
+        if poweroff is None:
+            poweroff = Uniform(5, 10)
+        self.poweron = poweron
+        self.poweroff = poweroff
+        self.poweron_failure = poweron_failure
+        self.poweroff_failure = poweroff_failure
+
+    def poweron_time(self, rng):
+        return self.poweron.sample(rng)
+
+    def poweroff_time(self, rng):
+        return self.poweroff.sample(rng)
+
+    def poweron_fails(self, rng):
+        return rng.random() > 1.0 - self.poweron_failure
+
+    def poweroff_fails(self, rng):
+        return (self.poweroff_failure > 0) and (rng.random() < self.poweroff_failure)
+
+    def __str__(self):
+        return "power on: %s, power off: %s, failures: %s/%s" % (self.poweron, self.poweroff, self.poweron_failure, self.poweroff_failure)
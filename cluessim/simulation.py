@@ -0,0 +1,244 @@
+import collections
+import heapq
+import cpyutils.eventloop
+import cpyutils.log
+import clueslib.helpers
+import clueslib.schedulers
+from clueslib.configlib import _CONFIGURATION_MONITORING
+from clueslib.platform import Platform
+from clueslib.request import Request, ResourcesNeeded
+from .node import Node
+
+_LOGGER = cpyutils.log.Log("DC-SIM")
+
+class EventLoop_Heap(cpyutils.eventloop._EventLoop):
+    # A simulated event loop (the time jumps to the next event) that keeps the events in a heap ordered by (time, priority), instead
+    #   of sorting all the events in each iteration (as cpyutils.eventloop._EventLoop does). The events that are cancelled or
+    #   reprogrammed are discarded lazily, when they get to the top of the heap.
+    def __init__(self):
+        cpyutils.eventloop._EventLoop.__init__(self)
+        self._heap = []
+        self._entries = {}
+        self._sequence = 0
+        self._stopped = False
+
+    def _push(self, event, now):
+        # Must be called holding the lock
+        t = event.next_sched(now)
+        if t is None:
+            self.events.pop(event.id, None)
+            self._entries.pop(event.id, None)
+            return
+        self._sequence += 1
+        self._entries[event.id] = self._sequence
+        heapq.heappush(self._heap, (t, event.priority, self._sequence, event))
+
+    def add_event(self, event):
+        with self._lock:
+            if event.id in self.events:
+                raise Exception("An event with id %s already exists" % event.id)
+            now = self.time()
+            event.reprogram(event.t + now)
+            self.events[event.id] = event
+            self._timestamp_last_new_event = now
+            self._push(event, now)
+        return event
+
+    def stop(self):
+        # Makes the loop finish after the event that is being executed
+        self._stopped = True
+
+    def _next_event(self, now):
+        # Returns the next event to execute (removing it from the heap) and the time in which it is programmed, or (None, None) if
+        #   there are no more events
+        with self._lock:
+            while len(self._heap) > 0:
+                t, _, sequence, event = self._heap[0]
+                if (event.id not in self.events) or (self._entries.get(event.id, None) != sequence):
+                    # The event has been cancelled or it is also in other position of the heap
+                    heapq.heappop(self._heap)
+                    continue
+                next_sched = event.next_sched(now)
+                if next_sched != t:
+                    # The event has been reprogrammed
+                    heapq.heappop(self._heap)
+                    self._push(event, now)
+                    continue
+                heapq.heappop(self._heap)
+                return event, t
+        return None, None
+
+    def loop(self):
+        self._stopped = False
+        while not self._stopped:
+            now = self.time()
+            if (self._walltime is not None) and (now > self._walltime):
+                _LOGGER.info("walltime %.2f achieved" % self._walltime)
+                break
+
+            if (not self._endless_loop) and (self._limit_new_events_time is not None) and (self._timestamp_last_new_event is not None):
+                if (now - self._timestamp_last_new_event) > self._limit_new_events_time:
+                    _LOGGER.info("limit of time without new events reached")
+                    break
+
+            event, t = self._next_event(now)
+            if event is None:
+                if self._endless_loop:
+                    self._progress_to_time(now + 1)
+                    continue
+                _LOGGER.info("no more events")
+                break
+
+            if t > now:
+                self._progress_to_time(t)
+                now = t
+            event.call(now)
+            with self._lock:
+                if event.id in self.events:
+                    self._push(event, now)
+
+class _Request_Sim(Request):
+    # A request that calls a function when it gets to a final state, so that the simulated jobs do not need to poll the state of
+    #   the requests (the function is called only once)
+    def __init__(self, resources, callback):
+        Request.__init__(self, resources)
+        self._callback = callback
+
+    def set_state(self, state):
+        changed = Request.set_state(self, state)
+        if changed and (state in Request.FINAL_STATES) and (self._callback is not None):
+            callback = self._callback
+            self._callback = None
+            callback(self)
+        return changed
+
+class Simulation:
+    # Runs CLUES and the simulated datacenter in the same process, using a simulated event loop: the daemon is created without
+    #   the RPC server, and the jobs make their requests by calling the daemon directly. The simulation ends when all the events
+    #   of the workload have happened, all the jobs have finished and some time has passed (tail), to let CLUES power off the nodes.
+    #
+    # The workload is an iterable of events, ordered by time, that have an attribute "t" (the time in which the event happens)
+    #   and a method "simulate(simulation)"; they are consumed one by one as the simulation goes forward, so that the workload
+    #   does not need to be in memory.
+    def __init__(self, nodepool, lrms, powermanager, scheduler_classes, timeout = 180, tail = 10):
+        self.nodepool = nodepool
+        self.lrms = lrms
+        self.powermanager = powermanager
+        self.timeout = timeout
+        self.tail = tail
+        self.eventloop = EventLoop_Heap()
+        cpyutils.eventloop.set_eventloop(self.eventloop)
+
+        # The daemon is created once the event loop is set, because the timestamps are taken from it
+        from clueslib.cluesd import CluesDaemon
+        self.schedulers = self._create_schedulers(scheduler_classes)
+        self.daemon = CluesDaemon(Platform(lrms, powermanager), self.schedulers)
+
+        self._workload = None
+        self._waiting = {}
+        self._workload_finished = False
+        self._end_check = None
+
+    @staticmethod
+    def _create_schedulers(scheduler_classes):
+        active_schedulers = []
+        for sclass in scheduler_classes.split(","):
+            sclass = sclass.strip()
+            if sclass == "":
+                continue
+            current_scheduler = clueslib.helpers.str_to_class(sclass)()
+            if not isinstance(current_scheduler, clueslib.schedulers.CLUES_Scheduler):
+                raise TypeError("\"%s\" is not a valid class to create the scheduler" % sclass)
+            active_schedulers.append(current_scheduler)
+        return active_schedulers
+
+    def submit(self, job, makerequest = True):
+        # Emulates the workflow of the jobs in CLUES: creating a request, waiting for it to be attended (or the timeout) and then
+        #   submitting the job to the LRMS (the waiting time of the job is measured from now)
+        job.timestamp_creation = self.eventloop.time()
+        if not makerequest:
+            self.lrms.qsub(job, "new job")
+            return
+        request = _Request_Sim(ResourcesNeeded(job.cores, job.memory, [ "" ], job.nodecount, job.nodecount), self._request_finished)
+        timeout_event = cpyutils.eventloop.Event(self.timeout, description = "timeout for request %s" % request.id, callback = self._request_timeout, parameters = [ request.id ], mute = True)
+        self._waiting[request.id] = (job, timeout_event)
+        self.eventloop.add_event(timeout_event)
+        self.daemon.request(request)
+
+    def _request_finished(self, request):
+        # It is called from the scheduler that changes the state of the request, so the job is submitted in a new event
+        job, timeout_event = self._waiting.get(request.id, (None, None))
+        if job is None:
+            return
+        self.eventloop.cancel_event(timeout_event.id)
+        self.eventloop.add_event(cpyutils.eventloop.Event(0, description = "submit job %s" % job.name, callback = self._qsub, parameters = [ request.id ], mute = True))
+
+    def _request_timeout(self, r_id):
+        self._qsub(r_id)
+
+    def _qsub(self, r_id):
+        job, _ = self._waiting.pop(r_id, (None, None))
+        if job is None:
+            return
+        self.lrms.qsub(job, "request id: %s" % r_id)
+        self._check_workload_finished()
+
+    def _next_workload_event(self):
+        try:
+            event = next(self._workload)
+        except StopIteration:
+            self._workload_finished = True
+            self._check_workload_finished()
+            return
+        self.eventloop.add_event(cpyutils.eventloop.Event(max(0, event.t - self.eventloop.time()), description = "workload event", callback = self._workload_event, parameters = [ event ], mute = True))
+
+    def _workload_event(self, event):
+        event.simulate(self)
+        self._next_workload_event()
+
+    def _check_workload_finished(self):
+        # When there are no more jobs to submit, the end of the simulation is checked each lifecycle of the LRMS
+        if self._workload_finished and (len(self._waiting) == 0) and (self._end_check is None):
+            self._end_check = cpyutils.eventloop.Event_Periodical(0, _CONFIGURATION_MONITORING.PERIOD_LIFECYCLE, description = "check the end of the simulation", callback = self._check_jobs_finished, mute = True)
+            self.eventloop.add_event(self._end_check)
+
+    def _check_jobs_finished(self):
+        if self.lrms.active_jobs() == 0:
+            self.eventloop.cancel_event(self._end_check.id)
+            _LOGGER.info("all the jobs have finished; the simulation will end in %s seconds" % self.tail)
+            self.eventloop.add_event(cpyutils.eventloop.Event(self.tail, description = "end of the simulation", callback = self.eventloop.stop))
+
+    def get_results(self, watts):
+        # Returns the results of the simulation: the jobs and the time that they have waited (from their submission to their start),
+        #   the energy (in kWh) consumed by the nodes (watts is the power of the nodes in each state, e.g. { "on": 150, "off": 5 }),
+        #   the time that the nodes have been on and the number of times that they have been powered on and off
+        # The statistics of the jobs are counted by the LRMS, because it does not keep the jobs that have finished
+        energy = 0.0
+        on_seconds = 0.0
+        power_ons = 0
+        power_offs = 0
+        for node in self.nodepool:
+            for state, seconds in node.get_state_seconds().items():
+                energy += seconds * watts.get(Node.STATE2STR[state], 0)
+                if state == Node.ON:
+                    on_seconds += seconds
+            power_ons += node.power_on_count
+            power_offs += node.power_off_count
+
+        return collections.OrderedDict([
+            ("simulated_time", self.eventloop.time()),
+            ("jobs", self.lrms.jobs_submitted),
+            ("jobs_started", self.lrms.jobs_started),
+            ("mean_wait", self.lrms.wait_total / self.lrms.jobs_started if self.lrms.jobs_started > 0 else 0),
+            ("max_wait", self.lrms.wait_max),
+            ("energy_kwh", energy / 3600000.0),
+            ("node_hours_on", on_seconds / 3600.0),
+            ("power_ons", power_ons),
+            ("power_offs", power_offs)
+        ])
+
+    def run(self, workload):
+        self._workload = iter(workload)
+        self._next_workload_event()
+        self.daemon.loop(False)
+        return self.eventloop.time()
@@ -0,0 +1,123 @@
+import collections
+import itertools
+import clueslib.helpers
+import clueslib.schedulers
+from clueslib.configlib import _CONFIGURATION_MONITORING
+
+# The sections of the configuration whose options can be explored in a parameter sweep
+SECTIONS = collections.OrderedDict([ ("scheduling", clueslib.schedulers.config_scheduling), ("monitoring", _CONFIGURATION_MONITORING) ])
+
+def _find_option(name, schedulers = []):
+    # The name of the option can include the section (e.g. scheduling.IDLE_TIME). The options of the schedulers are read from the
+    #   section scheduling when they are created, so they are searched in the schedulers. Returns the full name of the option and
+    #   its current value.
+    section = None
+    option = name
+    if "." in name:
+        section, option = name.split(".", 1)
+    for s_name, config in SECTIONS.items():
+        if section not in [ None, s_name ]:
+            continue
+        targets = [ config ]
+        if s_name == "scheduling":
+            targets = targets + list(schedulers)
+        for target in targets:
+            if hasattr(target, option):
+                return "%s.%s" % (s_name, option), getattr(target, option)
+    raise Exception("option %s does not exist in sections %s" % (name, ", ".join(SECTIONS.keys())))
+
+def _convert(current, value):
+    # Converts the value to the type of the current value of the option
+    if isinstance(current, bool):
+        return clueslib.helpers.str_to_bool(value)
+    if isinstance(current, int):
+        return int(value)
+    if isinstance(current, float):
+        return float(value)
+    return value
+
+class Parameter:
+    # A parameter of the sweep: an option of the configuration and either a list of values or a range of values (min, max) to
+    #   sample them in a random search. The format is NAME=value1,value2,... or NAME=min:max
+    def __init__(self, name, values = None, value_range = None):
+        self.name = name
+        self.values = values
+        self.value_range = value_range
+
+    @staticmethod
+    def parse(spec, schedulers = []):
+        # The schedulers are used to find the options that are specific for them
+        if "=" not in spec:
+            raise Exception("invalid parameter %s (the format is NAME=value1,value2,... or NAME=min:max)" % spec)
+        name, values = [ x.strip() for x in spec.split("=", 1) ]
+        name, current = _find_option(name, schedulers)
+        parameter = Parameter(name)
+        if ":" in values:
+            parameter.value_range = tuple([ _convert(current, x.strip()) for x in values.split(":", 1) ])
+        else:
+            parameter.values = [ _convert(current, x.strip()) for x in values.split(",") ]
+        return parameter
+
+    def sample(self, rng):
+        if self.values is not None:
+            return rng.choice(self.values)
+        minimum, maximum = self.value_range
+        if isinstance(minimum, int) and isinstance(maximum, int):
+            return rng.randint(minimum, maximum)
+        return rng.uniform(minimum, maximum)
+
+def grid_search(parameters):
+    # Yields all the combinations of the values of the parameters (as dictionaries { name: value })
+    for parameter in parameters:
+        if parameter.values is None:
+            raise Exception("parameter %s has a range of values, that can only be used in a random search" % parameter.name)
+    for values in itertools.product(*[ p.values for p in parameters ]):
+        yield collections.OrderedDict(zip([ p.name for p in parameters ], values))
+
+def random_search(parameters, count, rng):
+    # Yields count combinations of values of the parameters, sampled using the random number generator rng
+    for i in range(count):
+        yield collections.OrderedDict([ (p.name, p.sample(rng)) for p in parameters ])
+
+def set_parameters(values, schedulers = []):
+    # Sets the values of the options in the configuration objects of the current process (and in the schedulers that have them)
+    for name, value in values.items():
+        section, option = name.split(".", 1)
+        if hasattr(SECTIONS[section], option):
+            setattr(SECTIONS[section], option, value)
+        if section == "scheduling":
+            for scheduler in schedulers:
+                if hasattr(scheduler, option):
+                    setattr(scheduler, option, value)
+
+# The power of the nodes (in watts) in each state, to estimate the energy consumed in the simulations
+DEFAULT_WATTS = collections.OrderedDict([ ("on", 150.0), ("p-on", 150.0), ("p-off", 150.0), ("off", 5.0), ("err", 5.0) ])
+
+def parse_watts(spec):
+    # The format is state=watts,state=watts,... (the states that are not included keep the default power)
+    watts = collections.OrderedDict(DEFAULT_WATTS)
+    for item in spec.split(","):
+        if item.strip() == "":
+            continue
+        state, value = [ x.strip() for x in item.split("=", 1) ]
+        if state not in DEFAULT_WATTS:
+            raise Exception("invalid state %s (the valid states are %s)" % (state, ", ".join(DEFAULT_WATTS.keys())))
+        watts[state] = float(value)
+    return watts
+
+def _format_value(value):
+    if isinstance(value, float):
+        return "%.2f" % value
+    return str(value)
+
+def format_table(rows):
+    # Formats the results of the simulations (a list of dictionaries with the same keys) as a table
+    if len(rows) == 0:
+        return ""
+    columns = list(rows[0].keys())
+    values = [ [ _format_value(row[c]) for c in columns ] for row in rows ]
+    widths = [ max([ len(c) ] + [ len(v[i]) for v in values ]) for (i, c) in enumerate(columns) ]
+    lines = [ "  ".join([ c.rjust(w) for (c, w) in zip(columns, widths) ]) ]
+    for v in values:
+        lines.append("  ".join([ x.rjust(w) for (x, w) in zip(v, widths) ]))
+    return "\n".join(lines)
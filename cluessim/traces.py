@@ -0,0 +1,176 @@
+import collections
+import calendar
+import heapq
+import math
+import time
+import cpyutils.log
+
+_LOGGER = cpyutils.log.Log("DC-TRACE")
+
+# A job of a workload trace: the time in which it is submitted (relative to the first job of the trace), the cores and the memory (MB.)
+#   that it needs in each node, the duration and the number of nodes
+TraceJob = collections.namedtuple("TraceJob", [ "t", "cores", "memory", "seconds", "nodecount", "name" ])
+
+def _open(trace):
+    # The trace can be a filename or a file-like object (i.e. the lines can be read lazily from anywhere)
+    if isinstance(trace, str):
+        return open(trace)
+    return trace
+
+def _split_processors(processors, cores_per_node):
+    # Distributes the processors of a job in nodes of cores_per_node cores (if it is None, the job needs a single node)
+    if (cores_per_node is None) or (cores_per_node <= 0) or (processors <= cores_per_node):
+        return processors, 1
+    nodecount = int(math.ceil(float(processors) / cores_per_node))
+    return int(math.ceil(float(processors) / nodecount)), nodecount
+
+def sort_by_time(items, window = 1000):
+    # The traces are not always ordered by submission time (e.g. sacct dumps are ordered by job id), so the items (anything with
+    #   an attribute "t") are sorted using a buffer of "window" items; the items that are out of order by more than the window are
+    #   yielded as soon as possible (the simulation will launch them in that moment)
+    buffered = []
+    sequence = 0
+    for item in items:
+        heapq.heappush(buffered, (item.t, sequence, item))
+        sequence += 1
+        if len(buffered) > window:
+            yield heapq.heappop(buffered)[2]
+    while len(buffered) > 0:
+        yield heapq.heappop(buffered)[2]
+
+# The fields of the Standard Workload Format (see http://www.cs.huji.ac.il/labs/parallel/workload/swf.html)
+SWF_JOB_NUMBER = 0
+SWF_SUBMIT_TIME = 1
+SWF_RUN_TIME = 3
+SWF_ALLOCATED_PROCESSORS = 4
+SWF_USED_MEMORY = 6
+SWF_REQUESTED_PROCESSORS = 7
+SWF_REQUESTED_MEMORY = 9
+
+def read_swf(trace, cores_per_node = None, offset = 0):
+    # Reads the jobs of a trace in the Standard Workload Format, line by line. The lines that start with ";" are comments (the
+    #   header), and -1 means that the value is unknown. The memory in SWF is in KB. per processor.
+    t0 = None
+    with _open(trace) as swf:
+        for line in swf:
+            line = line.strip()
+            if (line == "") or line.startswith(";"):
+                continue
+            fields = line.split()
+            if len(fields) <= SWF_REQUESTED_MEMORY:
+                _LOGGER.warning("ignoring invalid line in SWF trace: %s" % line)
+                continue
+            try:
+                submit = float(fields[SWF_SUBMIT_TIME])
+                seconds = float(fields[SWF_RUN_TIME])
+                processors = int(fields[SWF_REQUESTED_PROCESSORS])
+                if processors <= 0:
+                    processors = int(fields[SWF_ALLOCATED_PROCESSORS])
+                memory = float(fields[SWF_REQUESTED_MEMORY])
+                if memory <= 0:
+                    memory = float(fields[SWF_USED_MEMORY])
+            except ValueError:
+                _LOGGER.warning("ignoring invalid line in SWF trace: %s" % line)
+                continue
+
+            # The jobs that did not run are not simulated
+            if (submit < 0) or (seconds < 0) or (processors <= 0):
+                continue
+            if t0 is None:
+                t0 = submit
+
+            cores, nodecount = _split_processors(processors, cores_per_node)
+            memory = max(0, memory) * cores / 1024.0
+            yield TraceJob(submit - t0 + offset, cores, memory, seconds, nodecount, "swf%s" % fields[SWF_JOB_NUMBER])
+
+def _sacct_seconds(elapsed):
+    # Converts the time from sacct ([DD-[HH:]]MM:SS[.mmm]) to seconds
+    days = 0
+    if "-" in elapsed:
+        days, elapsed = elapsed.split("-", 1)
+    seconds = 0.0
+    for value in elapsed.split(":"):
+        seconds = seconds * 60 + float(value)
+    return int(days) * 86400 + seconds
+
+def _sacct_timestamp(date):
+    # The dates of sacct are in ISO format (the timezone does not matter, because the times are relative to the first job)
+    return calendar.timegm(time.strptime(date, "%Y-%m-%dT%H:%M:%S"))
+
+_SACCT_MEMORY_UNITS = { "K": 1.0 / 1024, "M": 1.0, "G": 1024.0, "T": 1024.0 * 1024 }
+
+def _sacct_memory(reqmem, cores):
+    # Converts the memory requested (e.g. 4000Mc, 16Gn or 16G) to MB. per node
+    if reqmem == "":
+        return 0
+    per_cpu = False
+    if reqmem[-1] in [ "c", "n" ]:
+        per_cpu = reqmem[-1] == "c"
+        reqmem = reqmem[:-1]
+    factor = 1.0
+    if reqmem[-1].upper() in _SACCT_MEMORY_UNITS:
+        factor = _SACCT_MEMORY_UNITS[reqmem[-1].upper()]
+        reqmem = reqmem[:-1]
+    memory = float(reqmem) * factor
+    if per_cpu:
+        memory = memory * cores
+    return memory
+
+def _sacct_column(columns, names):
+    for name in names:
+        if name in columns:
+            return columns[name]
+    return None
+
+def read_sacct(trace, offset = 0):
+    # Reads the jobs from the output of "sacct --parsable2" (the first line must be the header, and the output must contain at
+    #   least the columns JobID, Submit, Elapsed or ElapsedRaw and NCPUS or AllocCPUS; NNodes and ReqMem are also used if they
+    #   are present). The steps of the jobs and the jobs that never started are ignored.
+    t0 = None
+    with _open(trace) as sacct:
+        header = sacct.readline().strip()
+        columns = dict((name, i) for (i, name) in enumerate(header.split("|")))
+        c_id = _sacct_column(columns, [ "JobID", "JobIDRaw" ])
+        c_submit = _sacct_column(columns, [ "Submit" ])
+        c_start = _sacct_column(columns, [ "Start" ])
+        c_elapsed_raw = _sacct_column(columns, [ "ElapsedRaw" ])
+        c_elapsed = _sacct_column(columns, [ "Elapsed" ])
+        c_cpus = _sacct_column(columns, [ "NCPUS", "AllocCPUS", "ReqCPUS" ])
+        c_nodes = _sacct_column(columns, [ "NNodes", "AllocNodes", "ReqNodes" ])
+        c_memory = _sacct_column(columns, [ "ReqMem" ])
+        if (c_id is None) or (c_submit is None) or (c_cpus is None) or ((c_elapsed is None) and (c_elapsed_raw is None)):
+            raise Exception("the sacct trace must contain the columns JobID, Submit, Elapsed (or ElapsedRaw) and NCPUS (or AllocCPUS)")
+
+        for line in sacct:
+            fields = line.rstrip("\n").split("|")
+            if len(fields) < len(columns):
+                continue
+            job_id = fields[c_id]
+            if "." in job_id:
+                # It is a step of a job
+                continue
+            if (c_start is not None) and (fields[c_start] in [ "Unknown", "None", "" ]):
+                continue
+            try:
+                submit = _sacct_timestamp(fields[c_submit])
+                if c_elapsed_raw is not None:
+                    seconds = float(fields[c_elapsed_raw])
+                else:
+                    seconds = _sacct_seconds(fields[c_elapsed])
+                processors = int(fields[c_cpus])
+                nodecount = 1
+                if (c_nodes is not None) and (fields[c_nodes] != ""):
+                    nodecount = max(1, int(fields[c_nodes]))
+                cores = int(math.ceil(float(processors) / nodecount))
+                memory = 0
+                if c_memory is not None:
+                    memory = _sacct_memory(fields[c_memory], cores)
+            except ValueError:
+                _LOGGER.warning("ignoring invalid line in sacct trace: %s" % line.strip())
+                continue
+
+            if processors <= 0:
+                continue
+            if t0 is None:
+                t0 = submit
+            yield TraceJob(submit - t0 + offset, cores, memory, seconds, nodecount, "slurm%s" % job_id)
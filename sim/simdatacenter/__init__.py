@@ -1,4 +1,5 @@
 from .powermanager import PowerManager_dummy
 from .job import Job
 from .node import Node, NodePool
+from .powermodel import PowerModel, Fixed, Uniform, Empirical
 from .lrms import LRMS_FIFO
\ No newline at end of file
@@ -2,6 +2,7 @@ import cpyutils.eventloop
 import cpyutils.log
 import random
 import collections
+from .powermodel import PowerModel
 
 _LOGGER = cpyutils.log.Log("DC-NODE")
 
@@ -20,66 +21,98 @@ class Node:
         Node.__current_id += 1
         return Node.__current_id
     
-    def __init__(self, cores, memory, name = None):
+    def __init__(self, cores, memory, name = None, node_class = None, power_model = None):
         if name is None:
             name = "node%.02d" % Node.get_id()
+        if power_model is None:
+            power_model = PowerModel()
         self.name = name
+        # The class of the node (e.g. the name of the nodes in the simulation file), that sets its power model in the pool
+        self.node_class = node_class
+        self.power_model = power_model
+        # The random number generator for the power transitions (the pool can set a stream for each node)
+        self.rng = random
         self.total_cores = cores
         self.total_memory = memory
         self.state = Node.OFF
         self.cores = cores
         self.memory = memory
-        self.min_poweron = 5
-        self.min_poweroff = 5
-        self.max_poweron = 10
-        self.max_poweroff = 10
+        # The time spent in each state and the number of times that the node has been powered on or off (the time is accounted
+        #   from the start of the simulation, i.e. the time 0 of the simulated event loop)
+        self.timestamp_state = None
+        self.state_seconds = dict((state, 0.0) for state in Node.STATE2STR)
+        self.power_on_count = 0
+        self.power_off_count = 0
+        # The pool in which the node is included (it is notified when the state of the node changes)
+        self.nodepool = None
         
     def clone(self):
-        n = Node(self.total_cores, self.total_memory, self.name)
+        n = Node(self.total_cores, self.total_memory, self.name, self.node_class, self.power_model)
         n.memory = self.memory
         n.cores = self.cores
         n.state = self.state
-        n.min_poweron = self.min_poweron
-        n.max_poweron = self.max_poweron
-        n.min_poweroff = self.min_poweroff
-        n.max_poweroff = self.max_poweroff
+        n.rng = self.rng
         return n
 
     def copy(self):
-        n = Node(self.cores, self.memory)
-        n.min_poweron = self.min_poweron
-        n.max_poweron = self.max_poweron
-        n.min_poweroff = self.min_poweroff
-        n.max_poweroff = self.max_poweroff
+        n = Node(self.cores, self.memory, None, self.node_class, self.power_model)
         return n        
 
+    def _set_state(self, state):
+        now = cpyutils.eventloop.now()
+        since = self.timestamp_state
+        if since is None:
+            since = 0
+        self.state_seconds[self.state] += now - since
+        self.timestamp_state = now
+        if state == Node.POW_ON:
+            self.power_on_count += 1
+        elif state == Node.POW_OFF:
+            self.power_off_count += 1
+        self.state = state
+        if self.nodepool is not None:
+            self.nodepool.state_changed(self)
+
+    def get_state_seconds(self):
+        # Returns the time spent in each state, including the time in the current state up to now
+        state_seconds = dict(self.state_seconds)
+        since = self.timestamp_state
+        if since is None:
+            since = 0
+        state_seconds[self.state] += cpyutils.eventloop.now() - since
+        return state_seconds
+
     def power_off(self):
-        self.state = Node.POW_OFF
-        elapsed = self.min_poweroff + random.random()* (self.max_poweroff - self.min_poweroff)
+        self._set_state(Node.POW_OFF)
+        elapsed = self.power_model.poweroff_time(self.rng)
         cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event(elapsed, description = "node %s powered off (event set in %s, to happen %s later)" % (self.name, cpyutils.eventloop.now(), elapsed), callback = self._power_off))
         _LOGGER.debug("powering off node %s" % self.name)
         return True
         
     def _power_off(self):
-        self.state = Node.OFF
+        if self.power_model.poweroff_fails(self.rng):
+            _LOGGER.error("node %s failed to power off" % self.name)
+            self._set_state(Node.ON)
+        else:
+            self._set_state(Node.OFF)
 
     def power_on(self):
         if self.state in [ Node.POW_OFF ]:
             return False
         if self.state in [ Node.ON, Node.POW_ON ]:
             return True
-        self.state = Node.POW_ON
-        elapsed = self.min_poweron + random.random()* (self.max_poweron - self.min_poweron)
+        self._set_state(Node.POW_ON)
+        elapsed = self.power_model.poweron_time(self.rng)
         _LOGGER.debug("node %s will power on in %s" % (self.name, elapsed))
         cpyutils.eventloop.get_eventloop().add_event(cpyutils.eventloop.Event(elapsed, description = "node %s powered on (event set in %s, to happen %s later)" % (self.name, cpyutils.eventloop.now(), elapsed), callback = self._power_on))
         return True
         
     def _power_on(self):
-        if random.random() > 0.95:
+        if self.power_model.poweron_fails(self.rng):
             _LOGGER.error("node %s failed to power on" % self.name)
-            self.state = Node.OFF
+            self._set_state(Node.OFF)
         else:
-            self.state = Node.ON
+            self._set_state(Node.ON)
         
     def meets_requirements(self, j):
         if self.state != Node.ON: return False
@@ -109,8 +142,14 @@ class NodePool():
             np.add(node.copy())
         return np
     
-    def __init__(self):
+    def __init__(self, seed = None):
+        # If a seed is set, each node gets its own stream of random numbers for the power transitions (derived from the seed and
+        #   the name of the node), so the simulations are reproducible even if the nodes are powered on or off in other order;
+        #   otherwise the nodes use the global random number generator
         self.nodes = collections.OrderedDict()
+        self._listeners = []
+        self.seed = seed
+        self.power_models = {}
 
     def clone(self):
         n_dict = collections.OrderedDict()
@@ -128,6 +167,27 @@ class NodePool():
         if node.name in self.nodes:
             raise Exception("node %s already exists" % node.name)
         self.nodes[node.name] = node
+        node.nodepool = self
+        if node.node_class in self.power_models:
+            node.power_model = self.power_models[node.node_class]
+        if self.seed is not None:
+            node.rng = random.Random("%s:%s" % (self.seed, node.name))
+        self.state_changed(node)
+
+    def set_power_model(self, node_class, power_model):
+        # Sets the power model of the nodes of a class (both the nodes in the pool and those that will be added)
+        self.power_models[node_class] = power_model
+        for node in self:
+            if node.node_class == node_class:
+                node.power_model = power_model
+
+    def add_listener(self, callback):
+        # The callback is called with the node each time that the state of a node of the pool changes
+        self._listeners.append(callback)
+
+    def state_changed(self, node):
+        for callback in self._listeners:
+            callback(node)
         
     def get_node(self, node_name):
         if node_name not in self.nodes:
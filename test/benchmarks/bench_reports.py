@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Measures the time and the peak memory needed to generate the data for the reports (the
+# JSON that is served to the web page) from a synthetic CLUES database with a big number of
+# rows in host_monitoring. The database is generated the first time, and it is reused if
+# the file already exists (generating 50M rows takes a while).
+#
+#   $ python test/benchmarks/bench_reports.py -d /tmp/clues-bench.db -r 50000000
+import sys
+import os
+import time
+import random
+import resource
+import sqlite3
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib import reports
+
+
+def synthetic_db(path, rowcount, hostcount, period, change_ratio):
+    # Each host is monitored each period seconds; one of each change_ratio samples changes the state of the host
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE host_monitoring(name varchar(128), timestamp_state INTEGER, slots_count INTEGER, slots_free INTEGER, memory_total INTEGER, memory_free INTEGER, state INTEGER, timestamp INTEGER, x INTEGER PRIMARY KEY)")
+    con.execute("CREATE TABLE requests(reqid varchar, timestamp_created INTEGER, timestamp_state INTEGER, state INTEGER, slots INTEGER, memory INTEGER, expressions varchar, taskcount INTEGER, maxtaskspernode INTEGER, jobid varchar, nodes varchar, x INTEGER PRIMARY KEY)")
+
+    rnd = random.Random(0)
+    states = [ (0, 8, 16384) ] * hostcount
+    timestamps = [ 0 ] * hostcount
+    rows = []
+    for i in range(rowcount):
+        h = i % hostcount
+        t = (i // hostcount) * period
+        state, slots_free, memory_free = states[h]
+        if rnd.randint(1, change_ratio) == 1:
+            state = rnd.choice([ 0, 1, 2 ])
+            slots_free = 8 if state != 1 else rnd.randint(0, 7)
+            memory_free = slots_free * 2048
+            states[h] = (state, slots_free, memory_free)
+            timestamps[h] = t
+        rows.append(("wn%05d" % h, timestamps[h], 8, slots_free, 16384, memory_free, state, t))
+        if len(rows) >= 100000:
+            con.executemany("INSERT INTO host_monitoring VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)", rows)
+            rows = []
+    if len(rows) > 0:
+        con.executemany("INSERT INTO host_monitoring VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)", rows)
+
+    requests = [ (str(i), i * period, i * period + 60, 2, 1, 1024, "[]", 1, 1, "null", "[]") for i in range(rowcount // hostcount) ]
+    con.executemany("INSERT INTO requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)", requests)
+
+    # The indexes that are created by the migrations of CLUES
+    con.execute("CREATE INDEX host_monitoring_name_timestamp ON host_monitoring(name, timestamp)")
+    con.execute("CREATE INDEX host_monitoring_timestamp_state ON host_monitoring(timestamp_state)")
+    con.execute("CREATE INDEX requests_timestamp_created ON requests(timestamp_created)")
+    con.commit()
+    con.close()
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option("-d", "--database", dest="DATABASE", default="/tmp/clues-bench-reports.db", help="the database file (it is generated if it does not exist)")
+    parser.add_option("-r", "--rows", dest="ROWS", default=50000000, type="int", help="number of rows in host_monitoring")
+    parser.add_option("-n", "--hosts", dest="HOSTS", default=2000, type="int", help="number of hosts")
+    parser.add_option("-p", "--period", dest="PERIOD", default=30, type="int", help="seconds between the monitoring samples of each host")
+    parser.add_option("-c", "--change-ratio", dest="CHANGE_RATIO", default=50, type="int", help="one of each CHANGE_RATIO samples changes the state of the host")
+    parser.add_option("-f", "--from", dest="FROM", default=0, type="int", help="the starting timestamp for the reports (as in cluesreports)")
+    (options, args) = parser.parse_args()
+
+    if not os.path.isfile(options.DATABASE):
+        t0 = time.time()
+        synthetic_db(options.DATABASE, options.ROWS, options.HOSTS, options.PERIOD, options.CHANGE_RATIO)
+        print("generated %d rows for %d hosts in %.1f seconds" % (options.ROWS, options.HOSTS, time.time() - t0))
+
+    connection_string = "sqlite://%s" % options.DATABASE
+    t0 = time.time()
+    with open(os.devnull, "w") as out:
+        reports.write_reports_json(connection_string, options.FROM, 0, out)
+    elapsed = time.time() - t0
+
+    # ru_maxrss is in kilobytes in linux
+    print("reports data written in %.1f seconds (peak memory %.1f MB)" % (elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Measures the time of a scheduling step of CLUES_Scheduler_PowOn_Requests for synthetic
+# clusters of increasing size in which most of the nodes are busy, and a deep queue of
+# requests that need to power on nodes.
+#
+#   $ python test/benchmarks/bench_scheduler.py -n 1000,10000 -q 200
+import sys
+import time
+import collections
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib.node import Node, NodeList
+from clueslib.request import Request, RequestList, ResourcesNeeded
+from clueslib.cluesd import MonitoringInfo
+from clueslib import schedulers
+
+
+def synthetic_cluster(nodecount, free_ratio):
+    nodes = collections.OrderedDict()
+    for i in range(nodecount):
+        name = "wn%05d" % i
+        node = Node(name, 8, 8, 16384, 16384)
+        if i % free_ratio == 0:
+            node.state = Node.OFF
+        else:
+            node.state = Node.USED
+            node.slots_free = i % 2
+            node.memory_free = 1024 * (i % 2)
+        nodes[name] = node
+    return nodes
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option("-n", "--nodes", dest="NODES", default="1000,2500,5000,10000", help="comma separated list of cluster sizes")
+    parser.add_option("-q", "--queue", dest="QUEUE", default=200, type="int", help="number of requests in the queue")
+    parser.add_option("-f", "--free-ratio", dest="FREE_RATIO", default=10, type="int", help="one of each FREE_RATIO nodes is off")
+    (options, args) = parser.parse_args()
+
+    for nodecount in [ int(x) for x in options.NODES.split(",") ]:
+        nodes = synthetic_cluster(nodecount, options.FREE_RATIO)
+        requests = RequestList([ Request(ResourcesNeeded(4, 4096, [], 2)) for i in range(options.QUEUE) ])
+
+        scheduler = schedulers.CLUES_Scheduler_PowOn_Requests()
+        scheduler._booking_system = schedulers.BookingSystem(0)
+
+        t0 = time.time()
+        candidates_on = {}
+        scheduler.schedule(requests, MonitoringInfo(NodeList(nodes), 0, None, 0), candidates_on, {})
+        elapsed = time.time() - t0
+        print("%d nodes, %d requests: %.3f seconds (%d nodes to power on)" % (nodecount, options.QUEUE, elapsed, len(candidates_on)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Measures the time of a monitoring pass of the SLURM plugin (get_nodeinfolist) for a
+# synthetic cluster. The scontrol commands are emulated, so it only measures the time
+# spent by CLUES parsing the output and building the node list.
+#
+#   $ python test/benchmarks/bench_slurm.py -n 10000
+import sys
+import time
+from mock import patch
+
+sys.path.append("..")
+sys.path.append(".")
+
+from cluesplugins import slurm
+
+
+def synthetic_scontrol(nodecount, partition_size):
+    nodes = []
+    for i in range(nodecount):
+        nodes.append("NodeName=wn%05d Arch=x86_64 CoresPerSocket=1 CPUAlloc=%d CPUTot=4 RealMemory=8 AllocMem=0 State=%s" %
+                     (i, i % 4, "IDLE" if i % 4 == 0 else "MIXED"))
+
+    partitions = []
+    for p, start in enumerate(range(0, nodecount, partition_size)):
+        end = min(start + partition_size, nodecount) - 1
+        partitions.append("PartitionName=part%d Nodes=wn[%05d-%05d] State=UP" % (p, start, end))
+    # A partition that contains all the nodes (as usual in the default partition)
+    partitions.append("PartitionName=all Nodes=wn[%05d-%05d] State=UP" % (0, nodecount - 1))
+
+    return "\n".join(nodes).encode(), "\n".join(partitions).encode()
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option("-n", "--nodes", dest="NODES", default=10000, type="int", help="number of nodes in the cluster")
+    parser.add_option("-p", "--partition-size", dest="PARTITION_SIZE", default=500, type="int", help="number of nodes per partition")
+    parser.add_option("-r", "--repeat", dest="REPEAT", default=3, type="int", help="number of monitoring passes")
+    (options, args) = parser.parse_args()
+
+    nodes_out, partitions_out = synthetic_scontrol(options.NODES, options.PARTITION_SIZE)
+    lrms = slurm.lrms()
+
+    def fake_runcommand(command, *args, **kwargs):
+        if command == lrms._partition:
+            return True, partitions_out
+        return True, nodes_out
+
+    with patch('cluesplugins.slurm.runcommand', side_effect=fake_runcommand) as runcommand:
+        for i in range(options.REPEAT):
+            runcommand.reset_mock()
+            t0 = time.time()
+            nodeinfolist = lrms.get_nodeinfolist()
+            elapsed = time.time() - t0
+            print("pass %d: %d nodes in %.3f seconds (%d commands executed)" % (i, len(nodeinfolist), elapsed, runcommand.call_count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import os
+import tempfile
+import shutil
+import sqlite3 as sqlite
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib import analytics
+
+IDLE, USED, OFF, POW_ON = 0, 1, 2, 3
+
+
+class TestAnalytics(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def setUp(self):
+        self._folder = tempfile.mkdtemp()
+        self._db_file = os.path.join(self._folder, "clues.db")
+        self._connection_string = "sqlite://%s" % self._db_file
+        con = sqlite.connect(self._db_file)
+        con.execute("CREATE TABLE host_monitoring(name varchar(128), timestamp_state INTEGER, slots_count INTEGER, slots_free INTEGER, memory_total INTEGER, memory_free INTEGER, state INTEGER, timestamp INTEGER, x INTEGER PRIMARY KEY)")
+        con.execute("CREATE TABLE requests(reqid varchar, timestamp_created INTEGER, timestamp_state INTEGER, state INTEGER, slots INTEGER, memory INTEGER, expressions varchar, taskcount INTEGER, maxtaskspernode INTEGER, jobid varchar, nodes varchar, x INTEGER PRIMARY KEY)")
+        # node01 is off for one hour, it takes 100 seconds to power on and then it is used (half of its slots) for one hour;
+        #   node02 is idle for two hours (with its own power), but it fails to power on at the end
+        rows = [
+            ("node01", 0, 2, 2, 1024, 1024, OFF, 0),
+            ("node02", 0, 2, 2, 1024, 1024, IDLE, 0),
+            ("node01", 3600, 2, 2, 1024, 1024, POW_ON, 3600),
+            ("node01", 3700, 2, 1, 1024, 512, USED, 3700),
+            ("node02", 7200, 2, 2, 1024, 1024, POW_ON, 7200),
+            ("node02", 7250, 2, 2, 1024, 1024, OFF, 7250),
+            ("node01", 7300, 2, 1, 1024, 512, USED, 7300),
+        ]
+        con.executemany("INSERT INTO host_monitoring VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)", rows)
+        requests = [
+            ("1", 3500, 3700, 2, 1, 512, "[]", 1, 1, "null", "[]"),
+            ("2", 3500, 3600, 2, 1, 512, "[]", 1, 1, "null", "[]"),
+            ("3", 4000, 4000, -2, 1, 512, "[]", 1, 1, "null", "[]"),
+        ]
+        con.executemany("INSERT INTO requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)", requests)
+        con.commit()
+        con.close()
+
+    def tearDown(self):
+        shutil.rmtree(self._folder)
+
+    def test_percentiles(self):
+        self.assertEqual(analytics.percentiles([]), { "count": 0 })
+        result = analytics.percentiles(list(range(100, 0, -1)))
+        self.assertEqual((result["count"], result["mean"], result["p50"], result["p90"], result["p99"], result["max"]), (100, 50.5, 50, 90, 99, 100))
+
+    def test_analytics(self):
+        power_model = analytics.PowerModel(100, 200, 10, 150, analytics.parse_node_watts("node02=50:100"))
+        result = analytics.get_analytics(self._connection_string, 0, 0, power_model, True)
+
+        self.assertEqual((result["from"], result["to"], result["hosts_count"]), (0, 7300, 2))
+        self.assertEqual(result["hosts"]["node01"]["time"], { "off": 3600, "powon": 100, "used": 3600 })
+        self.assertEqual(result["hosts"]["node02"]["time"], { "idle": 7200, "powon": 50, "off": 50 })
+        self.assertEqual(result["node_hours_off"], 3650 / 3600.0)
+        self.assertEqual(result["slot_utilization"], (1 * 3600.0) / (2 * 3600 + 2 * 7200))
+
+        self.assertEqual(result["power_on_latency"]["count"], 1)
+        self.assertEqual(result["power_on_latency"]["max"], 100)
+        self.assertEqual(result["failed_power_ons"], 1)
+
+        energy_node01 = 10 * 3600 + 150 * 100 + 150 * 3600
+        energy_node02 = 50 * 7200 + 150 * 50 + 10 * 50
+        baseline = 100 * 3600 + 100 * 100 + 150 * 3600 + 50 * 7200 + 50 * 50 + 50 * 50
+        self.assertAlmostEqual(result["energy_kwh"], (energy_node01 + energy_node02) / 3600000.0)
+        self.assertAlmostEqual(result["energy_baseline_kwh"], baseline / 3600000.0)
+        self.assertAlmostEqual(result["energy_saved_kwh"], (baseline - energy_node01 - energy_node02) / 3600000.0)
+
+        self.assertEqual(result["requests"]["states"], { "served": 2, "not-served": 1 })
+        self.assertEqual((result["requests"]["wait_served"]["count"], result["requests"]["wait_served"]["mean"]), (2, 150.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
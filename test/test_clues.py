@@ -45,6 +45,12 @@ class TestCLUES(unittest.TestCase):
         options.RANDOM_SEED = 10402
         options.FORCETRUNCATE = True
         options.END = True
+        options.HEADLESS = False
+        options.TRACE_FILE = None
+        options.TRACE_FORMAT = None
+        options.TRACE_OFFSET = 10
+        options.CORES_PER_NODE = None
+        options.BACKFILL = False
 
         main(options)
 
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import os
+import tempfile
+import shutil
+import sqlite3 as sqlite
+from mock import patch
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib.cluesd import DBSystem, _CONFIGURATION_CLUES
+from clueslib.node import Node
+from clueslib.request import Request, ResourcesNeeded
+
+
+class TestDBSystem(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def setUp(self):
+        self._folder = tempfile.mkdtemp()
+        self._db_file = os.path.join(self._folder, "clues.db")
+
+    def tearDown(self):
+        shutil.rmtree(self._folder)
+
+    def _query(self, sql):
+        con = sqlite.connect(self._db_file)
+        rows = con.execute(sql).fetchall()
+        con.close()
+        return rows
+
+    @patch.object(_CONFIGURATION_CLUES, "DB_WRITE_BUFFER_PERIOD", 1000, create = True)
+    @patch.object(_CONFIGURATION_CLUES, "DB_WRITE_BUFFER_SIZE", 10, create = True)
+    def test_write_buffer(self):
+        db = DBSystem("sqlite://%s" % self._db_file)
+
+        for i in range(9):
+            db.store_node_info(Node("node%02d" % i, 1, 1, 1024, 1024))
+        self.assertEqual(self._query("SELECT count(*) FROM host_monitoring"), [(0,)])
+
+        # the buffer is flushed when it is full
+        db.store_node_info(Node("node09", 1, 1, 1024, 1024))
+        self.assertEqual(self._query("SELECT count(*) FROM host_monitoring"), [(10,)])
+
+        # the requests are written before they are updated
+        request = Request(ResourcesNeeded(1, 1024, ['hostname=="node01"']))
+        db.store_request_info(request)
+        self.assertEqual(self._query("SELECT count(*) FROM requests"), [(0,)])
+        request.set_state(Request.SERVED)
+        db.update_request_info(request)
+        self.assertEqual(self._query("SELECT reqid, state, slots, memory, expressions, jobid FROM requests"), [(str(request.id), Request.SERVED, 1, 1024, '["hostname==\\"node01\\""]', "null")])
+
+        db.store_node_info(Node("node00", 1, 0, 1024, 0))
+        db.flush()
+        self.assertEqual(self._query("SELECT count(*) FROM host_monitoring"), [(11,)])
+
+    def test_migrations_and_latest_data(self):
+        # a database created by a previous version
+        con = sqlite.connect(self._db_file)
+        con.execute("CREATE TABLE host_monitoring(name varchar(128), timestamp_state INTEGER, slots_count INTEGER, slots_free INTEGER, memory_total INTEGER, memory_free INTEGER, state INTEGER, timestamp INTEGER, x INTEGER PRIMARY KEY)")
+        con.execute("INSERT INTO host_monitoring(name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp) VALUES ('node01', 10, 1, 1, 1024, 1024, %d, 10)" % Node.IDLE)
+        con.execute("INSERT INTO host_monitoring(name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp) VALUES ('node01', 20, 1, 0, 1024, 0, %d, 20)" % Node.USED)
+        con.execute("INSERT INTO host_monitoring(name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp) VALUES ('node02', 15, 1, 1, 1024, 1024, %d, 15)" % Node.OFF)
+        con.commit()
+        con.close()
+
+        db = DBSystem("sqlite://%s" % self._db_file)
+        self.assertEqual(self._query("SELECT version FROM schema_version"), [(len(DBSystem._MIGRATIONS),)])
+        indexes = [ name for (name,) in self._query("SELECT name FROM sqlite_master WHERE type = 'index'") ]
+        for index in [ "host_monitoring_name_timestamp", "host_monitoring_timestamp_state", "requests_timestamp_created" ]:
+            self.assertIn(index, indexes)
+
+        nodes = db.retrieve_latest_monitoring_data()
+        self.assertEqual(list(nodes.keys()), [ "node01", "node02" ])
+        self.assertEqual((nodes["node01"].state, nodes["node01"].timestamp_state, nodes["node01"].slots_free), (Node.USED, 20, 0))
+        self.assertEqual(nodes["node02"].state, Node.OFF)
+
+        node = Node("node02", 1, 1, 1024, 1024)
+        node.timestamp_state = 30
+        db.store_node_info(node)
+        nodes = db.retrieve_latest_monitoring_data()
+        self.assertEqual((nodes["node02"].state, nodes["node02"].timestamp_state), (Node.IDLE, 30))
+
+        # the migrations are not applied again
+        DBSystem("sqlite://%s" % self._db_file)
+        self.assertEqual(self._query("SELECT count(*) FROM host_latest"), [(2,)])
+
+    def _create_old_db(self):
+        con = sqlite.connect(self._db_file)
+        con.execute("CREATE TABLE host_monitoring(name varchar(128), timestamp_state INTEGER, slots_count INTEGER, slots_free INTEGER, memory_total INTEGER, memory_free INTEGER, state INTEGER, timestamp INTEGER, x INTEGER PRIMARY KEY)")
+        con.execute("INSERT INTO host_monitoring(name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp) VALUES ('node01', 10, 1, 1, 1024, 1024, %d, 10)" % Node.IDLE)
+        con.execute("INSERT INTO host_monitoring(name, timestamp_state, slots_count, slots_free, memory_total, memory_free, state, timestamp) VALUES ('node01', 20, 1, 0, 1024, 0, %d, 20)" % Node.USED)
+        con.commit()
+        con.close()
+
+    def test_interrupted_migration(self):
+        # the migrations were interrupted after creating an index and filling host_latest, but before updating the version
+        self._create_old_db()
+        con = sqlite.connect(self._db_file)
+        con.execute("CREATE INDEX host_monitoring_name_timestamp ON host_monitoring(name, timestamp)")
+        con.execute("CREATE TABLE host_latest(name varchar(128) PRIMARY KEY, timestamp_state INTEGER, slots_count INTEGER, slots_free INTEGER, memory_total INTEGER, memory_free INTEGER, state INTEGER, timestamp INTEGER)")
+        con.execute("INSERT INTO host_latest VALUES ('node01', 10, 1, 1, 1024, 1024, %d, 10)" % Node.IDLE)
+        con.commit()
+        con.close()
+
+        db = DBSystem("sqlite://%s" % self._db_file)
+        self.assertEqual(self._query("SELECT version FROM schema_version"), [(len(DBSystem._MIGRATIONS),)])
+        self.assertEqual(self._query("SELECT name, state FROM host_latest"), [("node01", Node.USED)])
+
+    def test_old_schema(self):
+        # if the table host_latest is not available, the latest data is obtained from host_monitoring
+        self._create_old_db()
+        with patch.object(DBSystem, "_MIGRATIONS", DBSystem._MIGRATIONS[:1]):
+            db = DBSystem("sqlite://%s" % self._db_file)
+        self.assertEqual(self._query("SELECT version FROM schema_version"), [(1,)])
+
+        nodes = db.retrieve_latest_monitoring_data()
+        self.assertEqual((nodes["node01"].state, nodes["node01"].timestamp_state, nodes["node01"].slots_free), (Node.USED, 20, 0))
+
+        node = Node("node01", 1, 1, 1024, 1024)
+        node.timestamp_state = 30
+        db.store_node_info(node)
+        nodes = db.retrieve_latest_monitoring_data()
+        self.assertEqual((nodes["node01"].state, nodes["node01"].timestamp_state), (Node.IDLE, 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,8 +19,15 @@ import unittest
 import sys
 import os
 import json
+import threading
 from shutil import copyfile
 from mock.mock import MagicMock, patch
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from urlparse import urlparse, parse_qs
 
 
 sys.path.append("..")
@@ -31,6 +38,44 @@ from clueslib.request import Request
 from clueslib.node import Node
 
 
+class FakeKubeAPIHandler(BaseHTTPRequestHandler):
+    """ Fake Kubernetes API server that serves the lists in chunks and replays recorded watch streams """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.server.requests.append(self.path)
+        if url.path not in self.server.lists:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        if query.get("watch") == ["true"]:
+            events = self.server.events.pop(url.path, [])
+            self.send_response(200)
+            self.end_headers()
+            for event in events:
+                self.wfile.write((event.strip() + "\n").encode())
+            return
+
+        data = self.server.lists[url.path]
+        limit = int(query.get("limit", [len(data["items"])])[0])
+        start = int(query.get("continue", [0])[0])
+        chunk = {"kind": "List", "items": data["items"][start:start + limit],
+                 "metadata": {"resourceVersion": data["metadata"]["resourceVersion"]}}
+        if start + limit < len(data["items"]):
+            chunk["metadata"]["continue"] = str(start + limit)
+        body = json.dumps(chunk).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
 class TestKubernetes(unittest.TestCase):
 
     TESTS_PATH = os.path.dirname(os.path.abspath(__file__))
@@ -94,6 +139,92 @@ class TestKubernetes(unittest.TestCase):
                                                                  '(nodeName == "wn-2.localdomain") && ' +
                                                                  '(nvidia_gpu >= 1) && (sgx >= 1)')])
 
+    @patch("requests.request")
+    def test_get_nodes_used_resources(self, request):
+        kube = lrms()
+        pods_data = json.load(open(os.path.join(self.TESTS_PATH, 'test-files/pods.json')))
+        used = kube._get_nodes_used_resources(pods_data)
+        self.assertEqual(sorted(used.keys()), ['wn-1.localdomain', 'wn-2.localdomain'])
+        # used_mem, used_cpus, used_agpus, used_ngpus, used_sgx, used_pods, system_pods
+        self.assertEqual(used['wn-2.localdomain'][5], 2)
+        self.assertEqual(used['wn-2.localdomain'][3], 1)
+        self.assertEqual(used['wn-1.localdomain'][5], 1)
+
+    @patch("requests.request")
+    def test_reuse_pods_data(self, request):
+        kube = lrms()
+        kube.VNODE_FILE = "/tmp/kubernetes_vnodes_none.info"
+
+        nodes_resp = MagicMock()
+        nodes_resp.status_code = 200
+        nodes_resp.json.return_value = json.load(open(os.path.join(self.TESTS_PATH, 'test-files/nodes.json')))
+        pods_resp = MagicMock()
+        pods_resp.status_code = 200
+        pods_resp.json.return_value = json.load(open(os.path.join(self.TESTS_PATH, 'test-files/pods.json')))
+        request.side_effect = [nodes_resp, pods_resp, pods_resp]
+
+        kube.get_nodeinfolist()
+        jobs = kube.get_jobinfolist()
+        # the job list is obtained from the pods got when monitoring the nodes
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(len(jobs), 3)
+
+        # the list is only reused once
+        kube.get_jobinfolist()
+        self.assertEqual(request.call_count, 3)
+
+    def test_watch_pods(self):
+        server = HTTPServer(("127.0.0.1", 0), FakeKubeAPIHandler)
+        server.requests = []
+        pods = json.load(open(os.path.join(self.TESTS_PATH, 'test-files/pods.json')))
+        pods["metadata"]["resourceVersion"] = "184190964"
+        server.lists = {"/api/v1/pods": pods}
+        server.events = {"/api/v1/pods": open(os.path.join(self.TESTS_PATH,
+                                                           'test-files/kubernetes_pods_events.json')).readlines()}
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            kube = lrms(KUBERNETES_SERVER="http://127.0.0.1:%d" % server.server_port, KUBERNETES_WATCH=True,
+                        KUBERNETES_LIST_CHUNK_SIZE=2)
+            cache = kube._pods_cache
+            self.assertEqual(cache.get_data(), None)
+
+            # list (in two chunks) and replay the recorded watch stream
+            self.assertTrue(cache.sync())
+            self.assertEqual(server.requests[0], "/api/v1/pods?limit=2")
+            self.assertEqual(server.requests[1], "/api/v1/pods?limit=2&continue=2")
+            self.assertIn("watch=true", server.requests[2])
+            self.assertIn("resourceVersion=184190964", server.requests[2])
+
+            data = cache.get_data()
+            self.assertEqual(data["metadata"]["resourceVersion"], "184190980")
+            names = [pod["metadata"]["name"] for pod in data["items"]]
+            self.assertEqual(names, ["im-dashboard-65889c645b-rblrs", "im-web-6d74c5d9bd-gm9qf", "new-job-pod"])
+
+            # the jobs are obtained from the cache (without listing the pods again)
+            with patch.object(cache, "start"):
+                jobs = kube.get_jobinfolist()
+            self.assertEqual(len(server.requests), 3)
+            self.assertEqual(len(jobs), 3)
+            self.assertEqual(jobs[2].job_id, "5c1b2b8e-3f5e-4a53-9d3c-2f6b8a8f0a11")
+            self.assertEqual(jobs[2].state, Request.PENDING)
+
+            used = kube._get_nodes_used_resources(data)
+            self.assertEqual(used['wn-2.localdomain'][5], 1)
+            self.assertNotIn('wn-1.localdomain', used)
+
+            # a watch that ends with an error forces to list again
+            server.events["/api/v1/pods"] = ['{"type": "ERROR", "object": {"code": 410, "message": "too old"}}']
+            self.assertFalse(cache.sync())
+            self.assertEqual(cache.get_data(), None)
+            self.assertTrue(cache.sync())
+            self.assertEqual(len(cache.get_data()["items"]), 3)
+        finally:
+            server.shutdown()
+            server.server_close()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+
+sys.path.append("..")
+sys.path.append(".")
+
+import cpyutils.eventloop
+import cluessim
+
+
+class TestLRMS_FIFO(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def setUp(self):
+        self._eventloop = cpyutils.eventloop.get_eventloop()
+        cpyutils.eventloop.set_eventloop(cluessim.EventLoop_Heap())
+
+    def tearDown(self):
+        cpyutils.eventloop.set_eventloop(self._eventloop)
+
+    def _create_lrms(self, count, backfill = False):
+        nodepool = cluessim.NodePool()
+        for i in range(count):
+            node = cluessim.Node(4, 4096, "node%02d" % i)
+            nodepool.add(node)
+            node._set_state(cluessim.Node.ON)
+        return nodepool, cluessim.LRMS_FIFO(nodepool, backfill)
+
+    def _run(self, lrms, t):
+        eventloop = cpyutils.eventloop.get_eventloop()
+        eventloop.add_event(cpyutils.eventloop.Event_Periodical(0, 1, callback = lrms.lifecycle, mute = True))
+        eventloop.add_event(cpyutils.eventloop.Event(t, callback = eventloop.stop, mute = True))
+        eventloop.loop()
+
+    def _queue_jobs(self, lrms):
+        # the first job blocks the second one (that needs the 3 nodes), and the third one could run while the second one waits
+        jobs = [ cluessim.Job(4, 1024, 100), cluessim.Job(4, 1024, 10, 3), cluessim.Job(4, 1024, 50), cluessim.Job(4, 1024, 500) ]
+        for job in jobs:
+            lrms.qsub(job, "test")
+        return jobs
+
+    def test_fifo(self):
+        nodepool, lrms = self._create_lrms(3)
+        jobs = self._queue_jobs(lrms)
+        self._run(lrms, 5)
+
+        self.assertEqual([ j.state for j in jobs ], [ cluessim.Job.RUNNING, cluessim.Job.INIT, cluessim.Job.INIT, cluessim.Job.INIT ])
+        self.assertEqual(lrms.job2nodes[jobs[0].name], [ "node00" ])
+        self.assertEqual(lrms.active_jobs(), 4)
+
+    def test_backfill(self):
+        nodepool, lrms = self._create_lrms(3, True)
+        jobs = self._queue_jobs(lrms)
+        self._run(lrms, 5)
+
+        # the third job ends before the second one can start, but the fourth one does not
+        self.assertEqual([ j.state for j in jobs ], [ cluessim.Job.RUNNING, cluessim.Job.INIT, cluessim.Job.RUNNING, cluessim.Job.INIT ])
+        self.assertEqual(lrms.job2nodes[jobs[2].name], [ "node01" ])
+
+        self._run(lrms, 105)
+        self.assertEqual([ j.state for j in jobs[:3] ], [ cluessim.Job.END, cluessim.Job.RUNNING, cluessim.Job.END ])
+        self.assertEqual(lrms.job2nodes[jobs[1].name], [ "node00", "node01", "node02" ])
+
+    def test_node_changes(self):
+        nodepool, lrms = self._create_lrms(1)
+        nodepool["node00"]._set_state(cluessim.Node.OFF)
+        nodepool.add(cluessim.Node(8, 4096, "node01"))
+        job = cluessim.Job(4, 1024, 10, 2)
+        lrms.qsub(job, "test")
+        self._run(lrms, 5)
+        self.assertEqual(job.state, cluessim.Job.INIT)
+
+        # the job is scheduled once a node with enough resources is on (a node can host several nodes of the job)
+        nodepool["node01"]._set_state(cluessim.Node.ON)
+        self._run(lrms, 10)
+        self.assertEqual(job.state, cluessim.Job.RUNNING)
+        self.assertEqual(lrms.job2nodes[job.name], [ "node01", "node01" ])
+        self.assertEqual(nodepool["node01"].cores, 0)
+
+        self._run(lrms, 30)
+        self.assertEqual(job.state, cluessim.Job.END)
+        self.assertEqual(nodepool["node01"].cores, 8)
+        self.assertEqual(lrms.active_jobs(), 0)
+
+    def test_finished_jobs_are_dropped(self):
+        nodepool, lrms = self._create_lrms(3)
+        jobs = self._queue_jobs(lrms)
+        self._run(lrms, 105)
+        self.assertEqual(jobs[0].state, cluessim.Job.END)
+        self.assertNotIn(jobs[0].name, lrms.jobs)
+        self.assertEqual((lrms.jobs_submitted, lrms.jobs_finished), (4, 1))
+
+        self._run(lrms, 1000)
+        self.assertEqual(lrms.jobs, {})
+        self.assertEqual((lrms.jobs_submitted, lrms.jobs_started, lrms.jobs_finished), (4, 4, 4))
+        self.assertEqual(lrms.wait_max, max([ j.timestamp_start - j.timestamp_creation for j in jobs ]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib import metrics
+from clueslib.platform import Platform, LRMS, PowerManager
+
+
+class TestMetrics(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def test_disabled(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram("test_seconds", "test", [ "task" ])
+        counter = registry.counter("test_total", "test")
+        with histogram.time(("a", )):
+            pass
+        counter.inc()
+        self.assertEqual(registry.render(), "# HELP test_seconds test\n# TYPE test_seconds histogram\n# HELP test_total test\n# TYPE test_total counter\n")
+
+    def test_render(self):
+        registry = metrics.Registry(True)
+        histogram = registry.histogram("test_seconds", "test", [ "task" ], buckets = [ 0.1, 1 ])
+        histogram.observe(0.05, ("a", ))
+        histogram.observe(0.5, ("a", ))
+        histogram.observe(5, ("a", ))
+        registry.counter("test_total", "test", [ "result" ]).inc(("ok", ), 2)
+        registry.gauge("test_nodes", "test", [ "state" ], callback = lambda: { ("idle", ): 3, ("off", ): 1 })
+
+        lines = registry.render().splitlines()
+        self.assertIn("test_seconds_bucket{task=\"a\",le=\"0.1\"} 1", lines)
+        self.assertIn("test_seconds_bucket{task=\"a\",le=\"1\"} 2", lines)
+        self.assertIn("test_seconds_bucket{task=\"a\",le=\"+Inf\"} 3", lines)
+        self.assertIn("test_seconds_sum{task=\"a\"} 5.55", lines)
+        self.assertIn("test_seconds_count{task=\"a\"} 3", lines)
+        self.assertIn("test_total{result=\"ok\"} 2", lines)
+        self.assertIn("test_nodes{state=\"idle\"} 3", lines)
+        self.assertIn("test_nodes{state=\"off\"} 1", lines)
+
+    def test_platform_calls(self):
+        class failing_powermanager(PowerManager):
+            def power_on(self, nname):
+                return False, nname
+
+        metrics.REGISTRY.enabled = True
+        self.addCleanup(setattr, metrics.REGISTRY, "enabled", False)
+        platform = Platform(LRMS("test"), failing_powermanager())
+        platform.get_nodeinfolist()
+        platform.power_on("node01")
+
+        lines = metrics.REGISTRY.render().splitlines()
+        self.assertIn("clues_plugin_call_seconds_count{plugin=\"clueslib.platform\",call=\"get_nodeinfolist\"} 1", lines)
+        self.assertIn("clues_plugin_call_failures_total{plugin=\"%s\",call=\"power_on\"} 1" % failing_powermanager.__module__, lines)
+        self.assertIn("clues_power_operations_total{operation=\"power_on\",result=\"failure\"} 1", lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import collections
+from mock import patch
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib.node import Node, NodeList
+from clueslib import node
+from clueslib.request import Resources, ResourcesNeeded
+from clueslib import schedulers
+
+
+class TestNodeList(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def _create_nodes(self, count):
+        nodes = collections.OrderedDict()
+        for i in range(count):
+            name = "node%02d" % i
+            nodes[name] = Node(name, 4, 4, 1024, 1024)
+        return nodes
+
+    def test_copy_on_write(self):
+        nodes = self._create_nodes(3)
+        nodelist = NodeList(nodes)
+
+        # the nodes are shared until they are modified
+        self.assertIs(nodelist.get_node("node00"), nodes["node00"])
+        nodelist.allocate("node00", Resources(1, 256))
+        self.assertIsNot(nodelist.get_node("node00"), nodes["node00"])
+        self.assertEqual(nodes["node00"].slots_free, 4)
+        self.assertEqual(nodelist.get_node("node00").slots_free, 3)
+        self.assertIs(nodelist.get_node("node01"), nodes["node01"])
+
+        # the duplicates do not see the changes of the other lists
+        duplicate = nodelist.duplicate()
+        duplicate.allocate("node00", Resources(1, 256))
+        nodelist.allocate("node00", Resources(2, 256))
+        self.assertEqual(duplicate.get_node("node00").slots_free, 2)
+        self.assertEqual(nodelist.get_node("node00").slots_free, 1)
+        self.assertEqual(nodes["node00"].slots_free, 4)
+
+        self.assertEqual([n.name for n in nodelist], list(nodes.keys()))
+        self.assertEqual(nodelist.get_list()["node00"].slots_free, 1)
+
+    def test_nodes_meet_resources(self):
+        nodes = self._create_nodes(3)
+        nodelist = NodeList(nodes)
+        nodelist.allocate("node00", Resources(3, 0))
+
+        met, allocated = schedulers._nodes_meet_resources(ResourcesNeeded(2, 0, [], 3, 2), nodelist, list(nodes.keys()))
+        self.assertTrue(met)
+        self.assertEqual(allocated, ["node01", "node01", "node02"])
+        # checking the resources does not modify the list
+        self.assertEqual(nodelist.get_node("node01").slots_free, 4)
+        self.assertEqual(nodelist.get_node("node00").slots_free, 1)
+
+    def test_get_nodes_meeting(self):
+        nodes = self._create_nodes(20)
+        for i, node in enumerate(nodes.values()):
+            node.state = [Node.IDLE, Node.USED, Node.OFF, Node.POW_ON][i % 4]
+            node.slots_free = i % 5
+            node.memory_free = 100 * (i % 7)
+        nodes["node03"].enabled = False
+        nodelist = NodeList(nodes)
+
+        def filtered(resources, enabled = None, states = None):
+            nodelist.FILTER_reset()
+            return list(nodelist.FILTER_basic(resources, enabled, states).keys())
+
+        for resources, enabled, states in [ (Resources(2, 300), None, [Node.IDLE, Node.USED]), (Resources(None, 500), True, [Node.OFF, Node.POW_ON]), (None, None, [Node.POW_ON]) ]:
+            self.assertEqual(nodelist.get_nodes_meeting(resources, enabled, states), filtered(resources, enabled, states))
+
+        # the indexes are updated when the resources are allocated
+        self.assertIn("node04", nodelist.get_nodes_meeting(Resources(4, 0), states = [Node.IDLE]))
+        nodelist.allocate("node04", Resources(1, 0))
+        self.assertNotIn("node04", nodelist.get_nodes_meeting(Resources(4, 0), states = [Node.IDLE]))
+        nodelist.deallocate("node04", Resources(1, 0))
+        self.assertEqual(nodelist.get_nodes_meeting(Resources(4, 0)), filtered(Resources(4, 0)))
+        self.assertEqual(nodelist.get_nodes_meeting(Resources(1, 100), enabled = True), filtered(Resources(1, 100), enabled = True))
+
+
+class TestExpressionCache(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def test_meets_resources_cached(self):
+        node._expression_cache.clear()
+        n = Node("node01", 4, 4, 1024, 1024, {"hostname": node.cpyutils.evaluate.TypedClass.auto("node01")})
+        resources = Resources(1, 256, ['hostname=="node01"', ' '])
+
+        with patch.object(node._annie, "check", wraps=node._annie.check) as check:
+            self.assertTrue(n.meets_resources(resources))
+            self.assertTrue(n.meets_resources(resources))
+            # the copies share the results, as they have the same keywords
+            self.assertTrue(n.copy().meets_resources(resources))
+            self.assertEqual(check.call_count, 1)
+
+            # the expression is evaluated again if the keywords change
+            updated = Node("node01", 4, 4, 1024, 1024, {"hostname": node.cpyutils.evaluate.TypedClass.auto("node02")})
+            n.update_info(updated)
+            self.assertFalse(n.meets_resources(resources))
+            self.assertEqual(check.call_count, 2)
+
+    def test_results_per_node(self):
+        node._expression_cache.clear()
+        nodes = [ Node("node%02d" % i, 4, 4, 1024, 1024, {"hostname": node.cpyutils.evaluate.TypedClass.auto("node%02d" % i)}) for i in range(20) ]
+        resources = Resources(1, 256, ['hostname!="node00"'])
+
+        with patch.object(node._annie, "check", wraps=node._annie.check) as check:
+            for i in range(3):
+                self.assertEqual([ n.meets_resources(resources) for n in nodes ], [ False ] + [ True ] * 19)
+            self.assertEqual(check.call_count, 20)
+
+            # only the result for the latest keywords of each node is kept
+            nodes[1].update_info(Node("node01", 4, 4, 1024, 1024, {"hostname": node.cpyutils.evaluate.TypedClass.auto("node00")}))
+            self.assertFalse(nodes[1].meets_resources(resources))
+            self.assertEqual(check.call_count, 21)
+            self.assertEqual(len(node._expression_cache.get('hostname!="node00"')._results), 20)
+
+    def test_lru_eviction(self):
+        node._expression_cache.clear()
+        with patch.object(node._CONFIGURATION_MONITORING, "EXPRESSION_CACHE_SIZE", 2, create=True):
+            e1 = node._expression_cache.get("a==1")
+            node._expression_cache.get("b==1")
+            self.assertIs(node._expression_cache.get("a==1"), e1)
+            node._expression_cache.get("c==1")
+            self.assertIs(node._expression_cache.get("a==1"), e1)
+            self.assertIsNot(node._expression_cache.get("a==1 "), e1)
+            self.assertEqual(list(node._expression_cache._expressions.keys()), ["a==1", "a==1 "])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import os
+import random
+import tempfile
+
+sys.path.append("..")
+sys.path.append(".")
+
+import cpyutils.eventloop
+import cluessim
+from cluessim import powermodel
+
+
+class TestPowerModel(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def setUp(self):
+        self._eventloop = cpyutils.eventloop.get_eventloop()
+        cpyutils.eventloop.set_eventloop(cluessim.EventLoop_Heap())
+
+    def tearDown(self):
+        cpyutils.eventloop.set_eventloop(self._eventloop)
+
+    def test_distributions(self):
+        rng = random.Random(1)
+        self.assertEqual(powermodel.parse_distribution("30").sample(rng), 30)
+        self.assertEqual(powermodel.parse_distribution("fixed:45").sample(rng), 45)
+        for i in range(100):
+            self.assertTrue(60 <= powermodel.parse_distribution("uniform:60:120").sample(rng) <= 120)
+            self.assertIn(powermodel.parse_distribution("empirical:20,25,40").sample(rng), [ 20, 25, 40 ])
+        self.assertRaises(Exception, powermodel.parse_distribution, "normal:1:2")
+        self.assertRaises(Exception, powermodel.parse_distribution, "uniform:10:5")
+
+        handle, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(handle, "w") as samples:
+                samples.write("# boot times from IPMI\n182.5 node01\n\n201 node02\n")
+            self.assertEqual(powermodel.parse_distribution("empirical:%s" % filename).samples, [ 182.5, 201 ])
+        finally:
+            os.remove(filename)
+
+    def _power_on_times(self, seed, names):
+        nodepool = cluessim.NodePool(seed)
+        nodepool.set_power_model("node", cluessim.PowerModel(cluessim.Uniform(60, 120), cluessim.Fixed(10), 0))
+        times = {}
+        for name in names:
+            node = cluessim.Node(1, 1024, name, "node")
+            nodepool.add(node)
+            node.power_on()
+        eventloop = cpyutils.eventloop.get_eventloop()
+        eventloop.add_event(cpyutils.eventloop.Event(200, callback = eventloop.stop, mute = True))
+        eventloop.loop()
+        for node in nodepool:
+            self.assertEqual(node.state, cluessim.Node.ON)
+            times[node.name] = node.get_state_seconds()[cluessim.Node.POW_ON]
+        return times
+
+    def test_streams(self):
+        # each node has its own stream, so the times do not depend on the order in which the nodes are powered on
+        times = self._power_on_times(1, [ "node01", "node02", "node03" ])
+        cpyutils.eventloop.set_eventloop(cluessim.EventLoop_Heap())
+        self.assertEqual(times, self._power_on_times(1, [ "node03", "node01", "node02" ]))
+        for t in times.values():
+            self.assertTrue(60 <= t <= 120)
+
+        cpyutils.eventloop.set_eventloop(cluessim.EventLoop_Heap())
+        self.assertNotEqual(times, self._power_on_times(2, [ "node01", "node02", "node03" ]))
+
+    def test_failures(self):
+        nodepool = cluessim.NodePool(1)
+        node = cluessim.Node(1, 1024, "node01", "node")
+        nodepool.add(node)
+        # the model of the class is also set for the nodes that are already in the pool
+        nodepool.set_power_model("node", cluessim.PowerModel(cluessim.Fixed(10), cluessim.Fixed(10), 1, 1))
+        node.power_on()
+        eventloop = cpyutils.eventloop.get_eventloop()
+        eventloop.add_event(cpyutils.eventloop.Event(20, callback = eventloop.stop, mute = True))
+        eventloop.loop()
+        self.assertEqual(node.state, cluessim.Node.OFF)
+        self.assertEqual(node.power_on_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import time
+import threading
+import collections
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib.poweroperations import PowerOperation, PowerOperationsExecutor, parse_plugin_concurrency
+from clueslib import schedulers
+from clueslib import cluesd
+from clueslib.node import Node
+from clueslib.request import Request, ResourcesNeeded
+
+
+class TestPowerOperationsExecutor(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def _wait_finished(self, executor, count, timeout = 5):
+        finished = []
+        t0 = time.time()
+        while len(finished) < count and time.time() - t0 < timeout:
+            finished += executor.get_finished()
+            time.sleep(0.01)
+        return finished
+
+    def test_parse_plugin_concurrency(self):
+        self.assertEqual(parse_plugin_concurrency("cluesplugins.ipmi=4, cluesplugins.one = 2,wrong"), { "cluesplugins.ipmi": 4, "cluesplugins.one": 2 })
+        self.assertEqual(parse_plugin_concurrency(""), {})
+
+    def test_concurrency_and_ordering(self):
+        lock = threading.Lock()
+        running = { "ipmi": 0, "one": 0 }
+        max_running = { "ipmi": 0, "one": 0 }
+        calls = []
+
+        def operation(n_id, plugin_id, operation):
+            with lock:
+                running[plugin_id] += 1
+                max_running[plugin_id] = max(max_running[plugin_id], running[plugin_id])
+                calls.append((n_id, operation))
+            time.sleep(0.05)
+            with lock:
+                running[plugin_id] -= 1
+            return True, n_id
+
+        executor = PowerOperationsExecutor(4, { "ipmi": 2 })
+        for i in range(6):
+            n_id = "node%02d" % i
+            plugin_id = "ipmi" if i % 2 == 0 else "one"
+            self.assertTrue(executor.submit(PowerOperation(n_id, "power_on", plugin_id, operation, [ n_id, plugin_id, "power_on" ])))
+        # the same operation is not queued twice, but the operations for a node are queued in order
+        self.assertFalse(executor.submit(PowerOperation("node00", "power_on", "ipmi", operation, [ "node00", "ipmi", "power_on" ])))
+        self.assertTrue(executor.submit(PowerOperation("node00", "power_off", "ipmi", operation, [ "node00", "ipmi", "power_off" ])))
+        self.assertEqual(executor.pending("node00"), [ "power_on", "power_off" ])
+
+        finished = self._wait_finished(executor, 7)
+        self.assertEqual(len(finished), 7)
+        self.assertEqual(max_running["ipmi"], 2)
+        self.assertEqual([ op for n_id, op in calls if n_id == "node00" ], [ "power_on", "power_off" ])
+        self.assertEqual(finished[0].result, (True, finished[0].n_id))
+        self.assertEqual(executor.pending("node00"), [])
+
+
+
+class _BlockingPlatform:
+    # A platform whose power operations wait until they are released by the test
+    def __init__(self):
+        self.released = threading.Event()
+        self.calls = []
+        self.success = True
+
+    def attach_clues_system(self, clues_system):
+        pass
+
+    def get_power_manager_id(self):
+        return "test"
+
+    def power_on(self, n_id):
+        self.calls.append(("power_on", n_id))
+        self.released.wait(5)
+        return self.success, n_id
+
+    def power_off(self, n_id):
+        self.calls.append(("power_off", n_id))
+        self.released.wait(5)
+        return self.success, n_id
+
+
+class TestPowerOperationsDaemon(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def setUp(self):
+        self._workers = schedulers.config_scheduling.POWER_OPERATIONS_WORKERS
+        self._connection_string = cluesd._CONFIGURATION_CLUES.DB_CONNECTION_STRING
+        schedulers.config_scheduling.POWER_OPERATIONS_WORKERS = 1
+        cluesd._CONFIGURATION_CLUES.DB_CONNECTION_STRING = ""
+
+    def tearDown(self):
+        schedulers.config_scheduling.POWER_OPERATIONS_WORKERS = self._workers
+        cluesd._CONFIGURATION_CLUES.DB_CONNECTION_STRING = self._connection_string
+
+    def _create_daemon(self, platform):
+        daemon = cluesd.CluesDaemon(platform, [ schedulers.CLUES_Scheduler_PowOn_Requests() ])
+        nodes = collections.OrderedDict()
+        for name, state in [ ("node01", Node.IDLE), ("node02", Node.OFF) ]:
+            nodes[name] = Node(name, 1, 1, 1024, 1024)
+            nodes[name].state = state
+        daemon._lrms_nodelist = nodes
+        daemon._lrms_joblist = None
+        return daemon
+
+    def _wait_applied(self, daemon, timeout = 5):
+        t0 = time.time()
+        while len(daemon._power_executor.pending("node01")) > 0 and time.time() - t0 < timeout:
+            time.sleep(0.01)
+        daemon._apply_power_operations()
+
+    def test_request_while_powering_off(self):
+        platform = _BlockingPlatform()
+        daemon = self._create_daemon(platform)
+
+        daemon._dispatch_power_operation("node01", "power_off")
+        self.assertEqual(daemon._lrms_nodelist["node01"].state, Node.POW_OFF)
+
+        # The request must not be served by the node that is being powered off, so node02 is powered on
+        req = Request(ResourcesNeeded(1, 256))
+        daemon.request(req)
+        daemon._schedulers_pipeline()
+        self.assertNotEqual(req.state, Request.SERVED)
+        self.assertEqual(daemon._lrms_nodelist["node02"].state, Node.POW_ON)
+
+        platform.released.set()
+        self._wait_applied(daemon)
+        self.assertEqual(daemon._lrms_nodelist["node01"].state, Node.POW_OFF)
+        self.assertEqual(sorted(platform.calls), [ ("power_off", "node01"), ("power_on", "node02") ])
+
+    def test_failed_power_off(self):
+        platform = _BlockingPlatform()
+        platform.success = False
+        daemon = self._create_daemon(platform)
+
+        daemon._dispatch_power_operation("node01", "power_off")
+        self.assertEqual(daemon._lrms_nodelist["node01"].state, Node.POW_OFF)
+
+        # If the operation fails, the node is considered to be on again
+        platform.released.set()
+        self._wait_applied(daemon)
+        self.assertEqual(daemon._lrms_nodelist["node01"].state, Node.ON_ERR)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import os
+import tempfile
+import shutil
+import sqlite3 as sqlite
+import json
+import io
+import threading
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib import reports
+
+IDLE, USED, OFF, POW_ON = 0, 1, 2, 3
+
+
+class TestReports(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def setUp(self):
+        self._folder = tempfile.mkdtemp()
+        self._db_file = os.path.join(self._folder, "clues.db")
+        self._connection_string = "sqlite://%s" % self._db_file
+        con = sqlite.connect(self._db_file)
+        con.execute("CREATE TABLE host_monitoring(name varchar(128), timestamp_state INTEGER, slots_count INTEGER, slots_free INTEGER, memory_total INTEGER, memory_free INTEGER, state INTEGER, timestamp INTEGER, x INTEGER PRIMARY KEY)")
+        con.execute("CREATE TABLE requests(reqid varchar, timestamp_created INTEGER, timestamp_state INTEGER, state INTEGER, slots INTEGER, memory INTEGER, expressions varchar, taskcount INTEGER, maxtaskspernode INTEGER, jobid varchar, nodes varchar, x INTEGER PRIMARY KEY)")
+        con.commit()
+        con.close()
+
+    def tearDown(self):
+        shutil.rmtree(self._folder)
+
+    def _insert(self, table, rows):
+        con = sqlite.connect(self._db_file)
+        for row in rows:
+            con.execute("INSERT INTO %s VALUES (%s)" % (table, ",".join(["?"] * len(row))), row)
+        con.commit()
+        con.close()
+
+    def _query(self, sql):
+        con = sqlite.connect(self._db_file)
+        rows = con.execute(sql).fetchall()
+        con.close()
+        return rows
+
+    def test_compact(self):
+        # node01 is off, it is powered on at 1800 and used from 2400 up to 4500; node02 is idle all the time
+        self._insert("host_monitoring", [
+            ("node01", 0, 2, 2, 1024, 1024, OFF, 0, None),
+            ("node02", 0, 2, 2, 1024, 1024, IDLE, 0, None),
+            ("node01", 1800, 2, 2, 1024, 1024, POW_ON, 1800, None),
+            ("node01", 2400, 2, 0, 1024, 512, USED, 2400, None),
+            ("node01", 4500, 2, 2, 1024, 1024, IDLE, 4500, None),
+            ("node01", 9000, 2, 2, 1024, 1024, OFF, 9000, None),
+        ])
+        self._insert("requests", [
+            ("1", 100, 2400, 2, 1, 512, "[]", 2, 1, "null", "[]", None),
+            ("2", 200, 200, -2, 1, 512, "[]", 1, 1, "null", "[]", None),
+            ("3", 8000, 8000, 0, 1, 512, "[]", 1, 1, "null", "[]", None),
+        ])
+
+        summary = reports.compact(self._connection_string, 3600, 3600, now = 3600 * 3 + 100)
+        self.assertEqual((summary["cutoff"], summary["intervals"], summary["host_rows"], summary["requests_rows"]), (7200, 2, 3, 1))
+
+        rows = self._query("SELECT name, interval_start, state, slots_used_avg, time_off, time_powon, time_used, time_idle, power_ons FROM host_monitoring_rollup ORDER BY interval_start, name")
+        self.assertEqual(rows, [
+            ("node01", 0, USED, 2.0 * 1200 / 3600, 1800.0, 600.0, 1200.0, 0.0, 1),
+            ("node02", 0, IDLE, 0.0, 0.0, 0.0, 0.0, 3600.0, 0),
+            ("node01", 3600, IDLE, 2.0 * 900 / 3600, 0.0, 0.0, 900.0, 2700.0, 0),
+        ])
+        self.assertEqual(self._query("SELECT interval_start, requests, served, not_served, slots, wait_served FROM requests_rollup"), [(0, 2, 1, 1, 3.0, 2300.0)])
+
+        # the raw information that has been rolled up is deleted
+        self.assertEqual(self._query("SELECT name, timestamp FROM host_monitoring"), [("node01", 9000)])
+        self.assertEqual(self._query("SELECT reqid FROM requests"), [("3",)])
+
+        # the compaction is incremental, and the hosts are only rolled up in the intervals in which they change
+        summary = reports.compact(self._connection_string, 3600, 3600, now = 3600 * 3 + 200)
+        self.assertEqual(summary["intervals"], 0)
+        summary = reports.compact(self._connection_string, 3600, 3600, now = 3600 * 4)
+        self.assertEqual((summary["intervals"], summary["host_rows"]), (1, 1))
+        self.assertEqual(self._query("SELECT time_idle, time_off FROM host_monitoring_rollup WHERE name = 'node01' AND interval_start = 7200"), [(1800.0, 1800.0)])
+
+        # the reports use the rollups for the information that is not available anymore
+        hostdata, min_t, max_t = reports.get_reports_data(self._connection_string, 0, 0)
+        self.assertEqual(min_t, 0)
+        self.assertEqual([ (e["t"], e["state"]) for e in hostdata["node01"] ], [ (0, OFF), (3600, IDLE), (7200, IDLE) ])
+        self.assertEqual([ e["t"] for e in hostdata["node02"] ], [ 0 ])
+        self.assertEqual(max_t, 3600 * 3)
+
+    def test_compact_interrupted(self):
+        self._insert("host_monitoring", [
+            ("node01", 0, 2, 2, 1024, 1024, IDLE, 0, None),
+            ("node01", 2400, 2, 0, 1024, 512, USED, 2400, None),
+            ("node01", 9000, 2, 2, 1024, 1024, OFF, 9000, None),
+        ])
+        self._insert("requests", [
+            ("1", 100, 2400, 2, 1, 512, "[]", 2, 1, "null", "[]", None),
+            ("2", 4000, 4000, -2, 1, 512, "[]", 1, 1, "null", "[]", None),
+        ])
+
+        # the process fails after writing the rollups and deleting the raw information of the hosts, but before deleting the requests
+        con = sqlite.connect(self._db_file)
+        con.execute("CREATE TRIGGER crash BEFORE DELETE ON requests BEGIN SELECT RAISE(ABORT, 'crash'); END")
+        con.commit()
+        con.close()
+        self.assertRaises(Exception, reports.compact, self._connection_string, 3600, 3600, 3600 * 3 + 100)
+        self.assertEqual(self._query("SELECT count(*) FROM host_monitoring_rollup"), [(0,)])
+        self.assertEqual(self._query("SELECT count(*) FROM host_monitoring"), [(3,)])
+
+        # the chunk is rolled up again, and the requests are only counted once
+        con = sqlite.connect(self._db_file)
+        con.execute("DROP TRIGGER crash")
+        con.commit()
+        con.close()
+        summary = reports.compact(self._connection_string, 3600, 3600, now = 3600 * 3 + 100)
+        self.assertEqual((summary["intervals"], summary["host_rows"], summary["requests_rows"]), (2, 1, 2))
+        self.assertEqual(self._query("SELECT count(*) FROM host_monitoring_rollup"), [(1,)])
+        self.assertEqual(self._query("SELECT interval_start, requests, served, not_served FROM requests_rollup ORDER BY interval_start"), [(0, 1, 1, 0), (3600, 1, 0, 1)])
+
+    def test_compact_max_chunks(self):
+        self._insert("host_monitoring", [ ("node01", t, 2, 2, 1024, 1024, IDLE, t, None) for t in range(0, 3600 * 24 * 3, 3600) ])
+        summary = reports.compact(self._connection_string, 3600, 3600, now = 3600 * 24 * 3, max_chunks = 1)
+        self.assertEqual((summary["intervals"], summary["pending"]), (reports.ROLLUP_INTERVALS_PER_CHUNK, True))
+        summary = reports.compact(self._connection_string, 3600, 3600, now = 3600 * 24 * 3, max_chunks = 1)
+        self.assertEqual((summary["intervals"], summary["pending"]), (reports.ROLLUP_INTERVALS_PER_CHUNK, True))
+        summary = reports.compact(self._connection_string, 3600, 3600, now = 3600 * 24 * 3)
+        self.assertEqual((summary["intervals"], summary["pending"]), (reports.ROLLUP_INTERVALS_PER_CHUNK - 1, False))
+        self.assertEqual(self._query("SELECT count(*) FROM host_monitoring_rollup"), [(3600 * 24 * 3 // 3600 - 1,)])
+
+    def test_reports_data(self):
+        # node01 only changes at 20 (and is monitored twice at 20); node02 only appears at 10
+        self._insert("host_monitoring", [
+            ("node01", 0, 2, 2, 1024, 1024, IDLE, 0, None),
+            ("node01", 0, 2, 2, 1024, 1024, IDLE, 10, None),
+            ("node02", 10, 2, 2, 1024, 1024, OFF, 10, None),
+            ("node01", 20, 2, 1, 1024, 512, USED, 20, None),
+            ("node01", 20, 2, 0, 1024, 0, USED, 20, None),
+            ("node01", 20, 2, 1, 1024, 512, USED, 30, None),
+        ])
+        self._insert("requests", [
+            ("1", 15, 20, 1, 1, 512, "[]", 1, 1, "null", "[]", None),
+        ])
+
+        hostdata, min_t, max_t = reports.get_reports_data(self._connection_string, 0, 0)
+        self.assertEqual((min_t, max_t), (0, 30))
+        self.assertEqual(hostdata["node01"], [
+            { "slots": 2.0, "slots_used": 0.0, "memory": 1024.0, "memory_used": 0.0, "state": IDLE, "t": 0 },
+            { "slots": 2.0, "slots_used": 1.0, "memory": 1024.0, "memory_used": 512.0, "state": USED, "t": 20 },
+        ])
+        self.assertEqual([ e["t"] for e in hostdata["node02"] ], [ 10 ])
+
+        hostdata, _, _ = reports.get_reports_data(self._connection_string, -15, 0)
+        self.assertEqual([ e["t"] for e in hostdata["node01"] ], [ 20 ])
+        self.assertNotIn("node02", hostdata)
+
+        # the JSON is written while it is read, and contains the same information
+        out = StringIO()
+        reports.write_reports_json(self._connection_string, 0, 0, out)
+        result = json.loads(out.getvalue())
+        hostdata, _, _ = reports.get_reports_data(self._connection_string, 0, 0)
+        requests, _, _ = reports.get_requests_data(self._connection_string, 0, 0)
+        self.assertEqual(result, json.loads(json.dumps({ "hostevents": hostdata, "requests": requests, "mintime_avail": 0, "maxtime_avail": 30 })))
+        self.assertEqual([ r["id"] for r in result["requests"] ], [ "1" ])
+
+
+    def test_reports_cache(self):
+        self._insert("host_monitoring", [
+            ("node01", 0, 2, 2, 1024, 1024, IDLE, 0, None),
+            ("node02", 0, 2, 2, 1024, 1024, OFF, 0, None),
+            ("node01", 100, 2, 1, 1024, 512, USED, 100, None),
+        ])
+        self._insert("requests", [
+            ("1", 90, 90, 0, 1, 512, "[]", 1, 1, "null", "[]", None),
+        ])
+        cache = reports.ReportsCache(self._connection_string)
+        etag, body = cache.get(0, 0)
+        self.assertEqual(cache.get(0, 0), (etag, body))
+        self.assertEqual(json.loads(body)["hostevents"], reports.get_reports_data(self._connection_string, 0, 0)[0])
+
+        # the new information extends the entry, with the same result than reading it again
+        self._insert("host_monitoring", [
+            ("node01", 100, 2, 1, 1024, 512, USED, 130, None),
+            ("node02", 150, 2, 2, 1024, 1024, IDLE, 150, None),
+            ("node03", 150, 2, 2, 1024, 1024, IDLE, 150, None),
+        ])
+        self._insert("requests", [
+            ("2", 150, 150, 0, 1, 512, "[]", 1, 1, "null", "[]", None),
+        ])
+        con = sqlite.connect(self._db_file)
+        con.execute("UPDATE requests SET state = 2, timestamp_state = 150 WHERE reqid = '1'")
+        con.commit()
+        con.close()
+
+        new_etag, body = cache.get(0, 0, 0, True, False)
+        self.assertNotEqual(new_etag, etag)
+        result = json.loads(body[len("var cluesdata="):-1])
+        hostdata, min_t, max_t = reports.get_reports_data(self._connection_string, 0, 0)
+        requests, _, _ = reports.get_requests_data(self._connection_string, 0, 0)
+        self.assertEqual(result["hostevents"], hostdata)
+        self.assertEqual(result["requests"], requests)
+        self.assertEqual((result["mintime_avail"], result["maxtime_avail"]), (min_t, max_t))
+        self.assertEqual([ e["t"] for e in result["hostevents"]["node02"] ], [ 0, 150 ])
+
+        import gzip
+        self.assertEqual(gzip.GzipFile(fileobj = io.BytesIO(cache.get(0, 0, 0, False, True)[1])).read().decode("utf-8"), cache.get(0, 0)[1])
+
+        # the information is aligned to the step
+        _, body = cache.get(0, 0, 60)
+        self.assertEqual([ e["t"] for e in json.loads(body)["hostevents"]["node01"] ], [ 0, 60 ])
+
+
+    def test_reports_check(self):
+        self._insert("host_monitoring", [
+            ("node01", 0, 2, 2, 1024, 1024, IDLE, 0, None),
+        ])
+        calls = []
+        cache = reports.ReportsCache(self._connection_string)
+        cache.get(0, 0, check = lambda: calls.append(True))
+        self.assertGreater(len(calls), 0)
+
+        # the check may stop reading the information (e.g. when the time for the call expires)
+        def expired():
+            raise Exception("expired")
+        cache = reports.ReportsCache(self._connection_string)
+        self.assertRaises(Exception, cache.get, 0, 0, check = expired)
+        self.assertEqual(json.loads(cache.get(0, 0)[1])["hostevents"], reports.get_reports_data(self._connection_string, 0, 0)[0])
+
+    def test_reports_cache_threads(self):
+        self._insert("host_monitoring", [
+            ("node01", 0, 2, 2, 1024, 1024, IDLE, 0, None),
+        ])
+        cache = reports.ReportsCache(self._connection_string)
+        results = []
+        errors = []
+
+        def reader():
+            try:
+                for i in range(20):
+                    results.append(cache.get(0, 0))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [ threading.Thread(target = reader) for i in range(4) ]
+        for t in threads:
+            t.start()
+        for i in range(1, 20):
+            self._insert("host_monitoring", [
+                ("node01", i * 10, 2, 2 - (i % 2), 1024, 1024, [ IDLE, USED ][i % 2], i * 10, None),
+            ])
+        for t in threads:
+            t.join()
+
+        # the same etag always comes with the same body
+        self.assertEqual(errors, [])
+        bodies = {}
+        for etag, body in results:
+            self.assertEqual(bodies.setdefault(etag, body), body)
+        self.assertEqual(json.loads(cache.get(0, 0)[1])["hostevents"], reports.get_reports_data(self._connection_string, 0, 0)[0])
+
+    def test_export_columns(self):
+        import array
+        self._insert("host_monitoring", [
+            ("node01", 0, 2, 2, 1024, 1024, IDLE, 1000, None),
+            ("node02", 0, 2, 2, 1024, 1024, OFF, 1000, None),
+            ("node01", 100, 2, 1, 1024, 512, USED, 1100, None),
+            ("node01", 100, 2, 1, 1024, 512, USED, 1130, None),
+            ("node01", 200, 2, 2, 1024, 1024, IDLE, 1200, None),
+        ])
+        self._insert("requests", [
+            ("1", 1090, 1100, 2, 1, 512, "[]", 1, 1, "null", "[]", None),
+            ("2", 1150, 1150, 0, 2, 256, "[]", 2, 1, "null", "[]", None),
+        ])
+        folder = os.path.join(self._folder, "export")
+        description = reports.export_columns(self._connection_string, 0, 0, folder)
+
+        def column(name):
+            c = json.load(open(os.path.join(folder, "columns.json")))["columns"][name]
+            values = array.array(reports._COLUMN_TYPES[c["dtype"]])
+            with open(os.path.join(folder, c["file"]), "rb") as f:
+                values.fromfile(f, c["length"])
+            if sys.byteorder != "little":
+                values.byteswap()
+            return list(values)
+
+        # the events of each host, with delta encoded timestamps, have the same information than get_reports_data
+        self.assertEqual(description["hosts"], [ "node01", "node02" ])
+        self.assertEqual((description["states"]["hosts"]["POW_ON"], description["states"]["hosts"]["OFF_ERR"]), (POW_ON, 6))
+        self.assertEqual(description["states"]["requests"]["DISCARDED"], -3)
+        self.assertEqual(column("hosts.offsets"), [ 0, 3, 4 ])
+        self.assertEqual(column("host_events.t"), [ 1000, 100, 100, 1000 ])
+        self.assertEqual(column("host_events.state"), [ IDLE, USED, IDLE, OFF ])
+        hostdata, _, _ = reports.get_reports_data(self._connection_string, 0, 0)
+        self.assertEqual(column("host_events.memory_used"), [ e["memory_used"] for e in hostdata["node01"] + hostdata["node02"] ])
+
+        self.assertEqual(column("requests.t_created"), [ 1090, 60 ])
+        self.assertEqual(column("requests.t_state"), [ 10, 0 ])
+        self.assertEqual(column("requests.taskcount"), [ 1, 2 ])
+        self.assertEqual(open(os.path.join(folder, "requests.id.txt")).read().splitlines(), [ "1", "2" ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import threading
+import time
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib.request import Request, ResourcesNeeded
+from clueslib.hooks import HookSystem
+
+
+class TestRequest(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def test_wait_finished(self):
+        req = Request(ResourcesNeeded(1, 1024))
+        self.assertFalse(req.wait_finished(0.01))
+
+        # the waiters are woken up when the request reaches a final state (and not before)
+        results = []
+        waiters = [ threading.Thread(target = lambda: results.append(req.wait_finished(10))) for i in range(20) ]
+        for th in waiters:
+            th.start()
+        req.set_state(Request.ATTENDED)
+        time.sleep(0.1)
+        self.assertEqual(results, [])
+
+        t0 = time.time()
+        req.set_state(Request.SERVED)
+        for th in waiters:
+            th.join()
+        self.assertEqual(results, [ True ] * 20)
+        self.assertLess(time.time() - t0, 5)
+
+        self.assertTrue(req.copy().wait_finished(0))
+        req.set_state(Request.PENDING)
+        self.assertFalse(req.wait_finished(0))
+
+    def test_unique_ids(self):
+        ids = []
+        def create():
+            for i in range(200):
+                ids.append(Request(ResourcesNeeded(1, 1024)).id)
+        threads = [ threading.Thread(target = create) for i in range(8) ]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        self.assertEqual(len(set(ids)), 1600)
+
+    def test_hook_requests_grouped(self):
+        calls = []
+        hooks = HookSystem()
+        hooks._run_hook = lambda hook, ids, *parameters: calls.append((ids, parameters)) or True
+
+        array = [ Request(ResourcesNeeded(2, 1024, [ "i386" ], 1)) for i in range(5) ]
+        other = Request(ResourcesNeeded(4, 1024))
+        self.assertTrue(hooks.requests(array + [ other ]))
+
+        # the hook is invoked once for the tasks of the job array, and once for the other request
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0], (",".join([ str(r.id) for r in array ]), (2, 1024, 1, 1, "i386")))
+        self.assertEqual(calls[1][0], str(other.id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import threading
+import time
+import socket
+try:
+    from xmlrpc.server import SimpleXMLRPCServer
+    import xmlrpc.client as xmlrpclib
+except ImportError:
+    from SimpleXMLRPCServer import SimpleXMLRPCServer
+    import xmlrpclib
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib import rpcserver
+
+
+class pool_server(rpcserver.ThreadPoolMixIn, SimpleXMLRPCServer):
+    def _dispatch(self, method, params):
+        with rpcserver.deadline(self.endpoint_timeout(method)):
+            if method == "wait":
+                return self.call_waiting(SimpleXMLRPCServer._dispatch, (self, method, params))
+            return SimpleXMLRPCServer._dispatch(self, method, params)
+
+
+class TestRPCServer(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def _start_server(self, workers, queue_size, timeouts = {}, max_waiting = None):
+        self.release = threading.Event()
+        server = pool_server(("localhost", 0), logRequests = False)
+        server.register_function(lambda: self.release.wait(10), "slow")
+        server.register_function(lambda: self.release.wait(rpcserver.remaining_time(10)), "wait")
+        server.register_function(self._chunks, "chunks")
+        server.register_function(lambda: True, "fast")
+        server.setup_pool(workers, queue_size, timeouts, max_waiting)
+        th = threading.Thread(target = server.serve_forever)
+        th.daemon = True
+        th.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(self.release.set)
+        return server, "http://localhost:%d" % server.server_address[1]
+
+    def _chunks(self):
+        # a long call that checks the deadline from time to time (e.g. the reports)
+        while not self.release.is_set():
+            rpcserver.check_deadline()
+            time.sleep(0.05)
+        return True
+
+    def _call_in_thread(self, url, method):
+        th = threading.Thread(target = lambda: getattr(xmlrpclib.ServerProxy(url), method)())
+        th.daemon = True
+        th.start()
+        return th
+
+    def test_parse_endpoint_timeouts(self):
+        self.assertEqual(rpcserver.parse_endpoint_timeouts(" request_wait=600, reports = 60,wrong,"), { "request_wait": 600.0, "reports": 60.0 })
+        self.assertEqual(rpcserver.parse_endpoint_timeouts(""), {})
+
+    def test_slow_calls_do_not_block(self):
+        server, url = self._start_server(4, 8)
+        slow_calls = [ self._call_in_thread(url, "slow") for i in range(3) ]
+        time.sleep(0.2)
+
+        t0 = time.time()
+        self.assertTrue(xmlrpclib.ServerProxy(url).fast())
+        self.assertLess(time.time() - t0, 2)
+
+        self.release.set()
+        for th in slow_calls:
+            th.join(5)
+            self.assertFalse(th.is_alive())
+
+    def test_queue_full(self):
+        server, url = self._start_server(1, 1)
+        busy = self._call_in_thread(url, "slow")
+        time.sleep(0.2)
+        queued = self._call_in_thread(url, "fast")
+        time.sleep(0.2)
+        self.assertEqual(server.queued_requests(), 1)
+
+        # the worker is busy and the queue is full, so the connection is rejected
+        try:
+            xmlrpclib.ServerProxy(url).fast()
+            self.fail("the call should have been rejected")
+        except xmlrpclib.ProtocolError as e:
+            self.assertEqual(e.errcode, 503)
+
+        self.release.set()
+        busy.join(5)
+        queued.join(5)
+        self.assertTrue(xmlrpclib.ServerProxy(url).fast())
+
+    def test_reject_deadline(self):
+        server, url = self._start_server(1, 1)
+        busy = self._call_in_thread(url, "slow")
+        time.sleep(0.2)
+        queued = self._call_in_thread(url, "fast")
+        time.sleep(0.2)
+
+        # a client that sends its request slowly does not block the server more than the deadline to drain the connection
+        request, client = socket.socketpair()
+        stop = threading.Event()
+        def trickle():
+            try:
+                while not stop.wait(0.1):
+                    client.sendall(b"x")
+            except Exception:
+                pass
+        th = threading.Thread(target = trickle)
+        th.daemon = True
+        th.start()
+
+        t0 = time.time()
+        server.process_request(request, ("localhost", 0))
+        self.assertLess(time.time() - t0, rpcserver._REJECT_DRAIN_TIMEOUT + 0.5)
+        stop.set()
+        th.join(5)
+        client.close()
+
+        self.release.set()
+        busy.join(5)
+        queued.join(5)
+
+    def test_endpoint_timeout(self):
+        server, url = self._start_server(1, 8, { "wait": 0.2, "chunks": 0.2 })
+        t0 = time.time()
+        # the wait ends when the time of the endpoint expires, as if its own timeout had expired
+        self.assertFalse(xmlrpclib.ServerProxy(url).wait())
+        self.assertLess(time.time() - t0, 5)
+
+        t0 = time.time()
+        self.assertRaises(xmlrpclib.Fault, xmlrpclib.ServerProxy(url).chunks)
+        self.assertLess(time.time() - t0, 5)
+
+        # the worker is free again
+        self.assertTrue(xmlrpclib.ServerProxy(url).fast())
+
+    def test_deadline(self):
+        self.assertEqual(rpcserver.remaining_time(5), 5)
+        self.assertEqual(rpcserver.remaining_time(), None)
+        with rpcserver.deadline(10):
+            self.assertLessEqual(rpcserver.remaining_time(), 10)
+            self.assertEqual(rpcserver.remaining_time(1), 1)
+            # the nested blocks cannot extend the limit
+            with rpcserver.deadline(100):
+                self.assertLessEqual(rpcserver.remaining_time(), 10)
+            with rpcserver.deadline(0):
+                self.assertEqual(rpcserver.remaining_time(5), 0)
+                time.sleep(0.01)
+                self.assertRaises(rpcserver.CallTimeout, rpcserver.check_deadline)
+            rpcserver.check_deadline()
+        self.assertEqual(rpcserver.remaining_time(5), 5)
+
+    def test_waiting_calls_do_not_take_workers(self):
+        server, url = self._start_server(2, 8)
+        waiting = [ self._call_in_thread(url, "wait") for i in range(6) ]
+        time.sleep(0.5)
+        self.assertEqual(server.waiting_calls(), 6)
+        self.assertEqual(server.queued_requests(), 0)
+
+        # there are more calls waiting than workers, but the rest of calls are attended at once
+        for i in range(4):
+            t0 = time.time()
+            self.assertTrue(xmlrpclib.ServerProxy(url).fast())
+            self.assertLess(time.time() - t0, 2)
+
+        self.release.set()
+        for th in waiting:
+            th.join(5)
+            self.assertFalse(th.is_alive())
+        time.sleep(0.2)
+        self.assertEqual(server.waiting_calls(), 0)
+        # the workers started for the calls that waited have ended
+        self.assertEqual(server._rpc_threads, 2)
+
+    def test_max_waiting(self):
+        server, url = self._start_server(1, 8, max_waiting = 1)
+        waiting = self._call_in_thread(url, "wait")
+        time.sleep(0.2)
+        self.assertEqual(server.waiting_calls(), 1)
+
+        # the limit of calls waiting has been reached, so the new call returns at once
+        t0 = time.time()
+        self.assertFalse(xmlrpclib.ServerProxy(url).wait())
+        self.assertLess(time.time() - t0, 2)
+
+        self.release.set()
+        waiting.join(5)
+        self.assertFalse(waiting.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
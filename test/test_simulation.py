@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import random
+
+sys.path.append("..")
+sys.path.append(".")
+
+import cpyutils.eventloop
+from clueslib.configlib import _CONFIGURATION_CLUES
+import cluessim
+
+
+class SubmitJob:
+    def __init__(self, t, job, makerequest = True):
+        self.t = t
+        self.job = job
+        self.makerequest = makerequest
+
+    def simulate(self, simulation):
+        simulation.submit(self.job, self.makerequest)
+
+
+class TestSimulation(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def setUp(self):
+        self._eventloop = cpyutils.eventloop.get_eventloop()
+        self._db_connection_string = _CONFIGURATION_CLUES.DB_CONNECTION_STRING
+        _CONFIGURATION_CLUES.DB_CONNECTION_STRING = ""
+
+    def tearDown(self):
+        cpyutils.eventloop.set_eventloop(self._eventloop)
+        _CONFIGURATION_CLUES.DB_CONNECTION_STRING = self._db_connection_string
+
+    def test_eventloop_order(self):
+        eventloop = cluessim.EventLoop_Heap()
+        cpyutils.eventloop.set_eventloop(eventloop)
+        executed = []
+        def record(name):
+            executed.append((name, cpyutils.eventloop.now()))
+
+        eventloop.add_event(cpyutils.eventloop.Event_Periodical(0, 4, callback = record, parameters = [ "periodical" ], mute = True))
+        eventloop.add_event(cpyutils.eventloop.Event(4, callback = record, parameters = [ "normal" ], mute = True))
+        eventloop.add_event(cpyutils.eventloop.Event(4, callback = record, parameters = [ "high" ], priority = cpyutils.eventloop.Event.PRIO_HIGH, mute = True))
+        cancelled = eventloop.add_event(cpyutils.eventloop.Event(2, callback = record, parameters = [ "cancelled" ], mute = True))
+        eventloop.cancel_event(cancelled.id)
+        eventloop.add_event(cpyutils.eventloop.Event(9, callback = eventloop.stop, mute = True))
+        eventloop.loop()
+
+        self.assertEqual(executed, [ ("periodical", 0), ("high", 4), ("normal", 4), ("periodical", 4), ("periodical", 8) ])
+        self.assertEqual(eventloop.time(), 9)
+
+    def test_headless(self):
+        random.seed(1)
+        nodepool = cluessim.NodePool()
+        for i in range(4):
+            nodepool.add(cluessim.Node(2, 4096, "node%02d" % i))
+        lrms = cluessim.LRMS_FIFO(nodepool)
+        simulation = cluessim.Simulation(nodepool, lrms, cluessim.PowerManager_dummy(nodepool), "clueslib.schedulers.CLUES_Scheduler_PowOn_Requests")
+
+        jobs = [ cluessim.Job(1, 1024, 30), cluessim.Job(2, 2048, 60, 2), cluessim.Job(1, 512, 10) ]
+        t = simulation.run([ SubmitJob(10, jobs[0]), SubmitJob(20, jobs[1]), SubmitJob(25, jobs[2], False) ])
+
+        # the jobs with requests are submitted once the nodes are powered on (and all of them end before the simulation)
+        for job in jobs:
+            self.assertEqual(job.state, cluessim.Job.END)
+        self.assertGreater(jobs[0].timestamp_queued, 10)
+        self.assertEqual(jobs[2].timestamp_queued, 25)
+        self.assertEqual(lrms.active_jobs(), 0)
+        self.assertGreater(t, max([ j.timestamp_finish for j in jobs ]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -78,6 +78,30 @@ class TestSLURMPlugin(unittest.TestCase):
         self.assertEqual(len(node_info['vnode-2'].keywords), 2)
         self.assertEqual(node_info['vnode-2'].keywords['queues'], TypedList([TypedClass.auto('debug')]))
         self.assertEqual(node_info['vnode-2'].state, NodeInfo.OFF)
+        # the partitions are obtained only once for the whole list of nodes
+        self.assertEqual(runcommand.call_count, 2)
+
+    def test_expand_hostlist(self):
+        self.assertEqual(slurm.expand_hostlist('wn1'), ['wn1'])
+        self.assertEqual(slurm.expand_hostlist('(null)'), [])
+        self.assertEqual(slurm.expand_hostlist('wn[0-4,7,10-12]'),
+                         ['wn0', 'wn1', 'wn2', 'wn3', 'wn4', 'wn7', 'wn10', 'wn11', 'wn12'])
+        self.assertEqual(slurm.expand_hostlist('gpu[08-10],login1'), ['gpu08', 'gpu09', 'gpu10', 'login1'])
+        self.assertEqual(slurm.expand_hostlist('rack[1-2]-n[01-02]'),
+                         ['rack1-n01', 'rack1-n02', 'rack2-n01', 'rack2-n02'])
+
+    @patch('cluesplugins.slurm.runcommand')
+    def test_get_partition_several(self, runcommand):
+        lrms = slurm.lrms()
+        partitions = ("PartitionName=wn Nodes=wn[0-4,7] State=UP\n"
+                      "PartitionName=big Nodes=wn[3-5],gpu[01-02] State=UP\n")
+        runcommand.return_value = True, partitions.encode()
+        index = lrms._get_partitions_index()
+        self.assertEqual(index['wn3'], ['wn', 'big'])
+        self.assertEqual(index['wn7'], ['wn'])
+        self.assertEqual(index['gpu02'], ['big'])
+        self.assertEqual(lrms._get_partition('wn5', index), ['big'])
+        self.assertEqual(lrms._get_partition('wn6', index), [])
 
     @patch('cluesplugins.slurm.runcommand')
     def test_get_jobinfolist(self, runcommand):
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import collections
+
+sys.path.append("..")
+sys.path.append(".")
+
+from clueslib.node import Node
+from clueslib.request import Request, ResourcesNeeded
+from clueslib.snapshot import SnapshotPublisher, get_status
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def test_publish(self):
+        nodes = collections.OrderedDict()
+        for i in range(3):
+            nodes["node%02d" % i] = Node("node%02d" % i, 4, 4, 1024, 1024)
+        requests = [ Request(ResourcesNeeded(1, 256)) ]
+
+        publisher = SnapshotPublisher()
+        first = publisher.publish(nodes, requests, None, 10, -1, 10)
+        self.assertEqual(first.version, 1)
+        self.assertEqual(list(first.nodes.keys()), [ "node00", "node01", "node02" ])
+        self.assertIsNot(first.get_node("node00"), nodes["node00"])
+
+        # if nothing has changed, the same snapshot is kept
+        self.assertIs(publisher.publish(nodes, requests, None, 10, -1, 20), first)
+
+        # the snapshots do not see the changes until a new one is published, and the unchanged nodes are shared
+        nodes["node01"].set_state(Node.USED)
+        self.assertEqual(first.get_node("node01").state, Node.IDLE)
+        second = publisher.publish(nodes, requests, None, 20, -1, 20)
+        self.assertEqual(second.version, 2)
+        self.assertEqual(second.get_node("node01").state, Node.USED)
+        self.assertIs(second.get_node("node00"), first.get_node("node00"))
+        self.assertEqual(second.node_versions, { "node00": 1, "node01": 2, "node02": 1 })
+        self.assertEqual(first.get_node("node01").state, Node.IDLE)
+
+        # the removed items are not in the new snapshot
+        del nodes["node02"]
+        third = publisher.publish(nodes, [], None, 30, -1, 30)
+        self.assertEqual(third.version, 3)
+        self.assertIsNone(third.get_node("node02"))
+        self.assertIsNone(third.get_request(requests[0].id))
+        self.assertIsNotNone(second.get_request(requests[0].id))
+
+    def test_wait_copied_request(self):
+        request = Request(ResourcesNeeded(1, 256))
+        publisher = SnapshotPublisher()
+        copied = publisher.publish(None, [ request ], None, -1, -1, 0).get_request(request.id)
+        self.assertFalse(copied.wait_finished(0))
+
+        # the waiters on the copy are woken up when the original request finishes
+        request.set_state(Request.SERVED)
+        self.assertTrue(copied.wait_finished(1))
+
+    def test_status_deltas(self):
+        nodes = collections.OrderedDict()
+        for i in range(3):
+            nodes["node%02d" % i] = Node("node%02d" % i, 4, 4, 1024, 1024)
+        request = Request(ResourcesNeeded(1, 256))
+        publisher = SnapshotPublisher()
+        first = publisher.publish(nodes, [ request ], None, 10, -1, 10)
+
+        status = get_status(first)
+        self.assertTrue(status["full"])
+        self.assertEqual(status["nodes"]["node00"], [ "idle", True, 4, 4, 1024, 1024, nodes["node00"].timestamp_state ])
+        self.assertEqual(status["requests"][str(request.id)][0], "pending")
+
+        # only the changes are included, and the ids only if any item has been added or removed
+        self.assertEqual(get_status(first, first.version)["nodes"], {})
+        nodes["node01"].set_state(Node.USED)
+        second = publisher.publish(nodes, [ request ], None, 20, -1, 20)
+        delta = get_status(second, first.version)
+        self.assertFalse(delta["full"])
+        self.assertEqual(list(delta["nodes"].keys()), [ "node01" ])
+        self.assertEqual(delta["requests"], {})
+        self.assertNotIn("nodes_ids", delta)
+
+        del nodes["node02"]
+        third = publisher.publish(nodes, [], None, 30, -1, 30)
+        delta = get_status(third, second.version)
+        self.assertEqual(delta["nodes"], {})
+        self.assertEqual(delta["nodes_ids"], [ "node00", "node01" ])
+        self.assertEqual(delta["requests_ids"], [])
+
+        # an unknown version (e.g. the daemon has been restarted) gets the whole status
+        self.assertTrue(get_status(third, third.version + 10)["full"])
+
+
+if __name__ == '__main__':
+    unittest.main()
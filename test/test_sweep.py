@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import random
+
+sys.path.append("..")
+sys.path.append(".")
+
+import cpyutils.eventloop
+import clueslib.schedulers
+from clueslib.configlib import _CONFIGURATION_MONITORING
+from cluessim import sweep
+import cluessim
+
+
+class TestSweep(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def test_parse(self):
+        scheduler = clueslib.schedulers.CLUES_Scheduler_PowOff_IDLE()
+        parameter = sweep.Parameter.parse("IDLE_TIME=60, 600", [ scheduler ])
+        self.assertEqual(parameter.name, "scheduling.IDLE_TIME")
+        self.assertEqual(parameter.values, [ 60, 600 ])
+
+        parameter = sweep.Parameter.parse("monitoring.PERIOD_LIFECYCLE=5:30")
+        self.assertEqual(parameter.name, "monitoring.PERIOD_LIFECYCLE")
+        self.assertEqual(parameter.value_range, (5, 30))
+
+        self.assertRaises(Exception, sweep.Parameter.parse, "IDLE_TIME=60")
+        self.assertRaises(Exception, sweep.Parameter.parse, "MAX_BOOTING_NODES")
+
+    def test_search(self):
+        parameters = [ sweep.Parameter("scheduling.A", [ 1, 2 ]), sweep.Parameter("scheduling.B", [ "x", "y", "z" ]) ]
+        combinations = list(sweep.grid_search(parameters))
+        self.assertEqual(len(combinations), 6)
+        self.assertEqual(combinations[0], { "scheduling.A": 1, "scheduling.B": "x" })
+        self.assertEqual(combinations[5], { "scheduling.A": 2, "scheduling.B": "z" })
+
+        # the ranges can only be used in a random search, that is reproducible using the same seed
+        parameters.append(sweep.Parameter("scheduling.C", value_range = (1, 10)))
+        self.assertRaises(Exception, list, sweep.grid_search(parameters))
+        combinations = list(sweep.random_search(parameters, 5, random.Random(1)))
+        self.assertEqual(len(combinations), 5)
+        self.assertEqual(combinations, list(sweep.random_search(parameters, 5, random.Random(1))))
+        for values in combinations:
+            self.assertTrue(1 <= values["scheduling.C"] <= 10)
+
+    def test_set_parameters(self):
+        scheduler = clueslib.schedulers.CLUES_Scheduler_PowOff_IDLE()
+        max_booting_nodes = clueslib.schedulers.config_scheduling.MAX_BOOTING_NODES
+        period_lifecycle = _CONFIGURATION_MONITORING.PERIOD_LIFECYCLE
+        try:
+            sweep.set_parameters({ "scheduling.IDLE_TIME": 42, "scheduling.MAX_BOOTING_NODES": 3, "monitoring.PERIOD_LIFECYCLE": 7 }, [ scheduler ])
+            self.assertEqual(scheduler.IDLE_TIME, 42)
+            self.assertEqual(clueslib.schedulers.config_scheduling.MAX_BOOTING_NODES, 3)
+            self.assertEqual(_CONFIGURATION_MONITORING.PERIOD_LIFECYCLE, 7)
+        finally:
+            clueslib.schedulers.config_scheduling.MAX_BOOTING_NODES = max_booting_nodes
+            _CONFIGURATION_MONITORING.PERIOD_LIFECYCLE = period_lifecycle
+
+    def test_node_state_seconds(self):
+        eventloop = cpyutils.eventloop.get_eventloop()
+        try:
+            cpyutils.eventloop.set_eventloop(cluessim.EventLoop_Heap())
+            node = cluessim.Node(2, 1024, "node01")
+            loop = cpyutils.eventloop.get_eventloop()
+            loop.add_event(cpyutils.eventloop.Event(10, callback = node._set_state, parameters = [ cluessim.Node.POW_ON ], mute = True))
+            loop.add_event(cpyutils.eventloop.Event(30, callback = node._set_state, parameters = [ cluessim.Node.ON ], mute = True))
+            loop.add_event(cpyutils.eventloop.Event(50, callback = loop.stop, mute = True))
+            loop.loop()
+
+            # the time in the current state is also accounted
+            state_seconds = node.get_state_seconds()
+            self.assertEqual(state_seconds[cluessim.Node.OFF], 10)
+            self.assertEqual(state_seconds[cluessim.Node.POW_ON], 20)
+            self.assertEqual(state_seconds[cluessim.Node.ON], 20)
+            self.assertEqual(node.power_on_count, 1)
+            self.assertEqual(node.power_off_count, 0)
+        finally:
+            cpyutils.eventloop.set_eventloop(eventloop)
+
+    def test_format_table(self):
+        table = sweep.format_table([ { "run": 0, "energy": 1.5 }, { "run": 10, "energy": 12.25 } ])
+        self.assertEqual(table.split("\n"), [ "run  energy", "  0    1.50", " 10   12.25" ])
+        self.assertEqual(sweep.parse_watts("on=200,off=10")["on"], 200.0)
+        self.assertRaises(Exception, sweep.parse_watts, "sleeping=1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import sys
+import io
+
+sys.path.append("..")
+sys.path.append(".")
+
+from cluessim import traces
+
+SWF_TRACE = u"""; Version: 2.2
+; MaxProcs: 64
+1 100 5 3600 4 -1 -1 4 7200 262144 1 1 1 -1 1 -1 -1 -1
+2 160 0 60 -1 -1 131072 16 120 -1 1 1 1 -1 1 -1 -1 -1
+3 200 10 -1 8 -1 -1 8 120 -1 5 1 1 -1 1 -1 -1 -1
+"""
+
+SACCT_TRACE = u"""JobID|Submit|Start|Elapsed|NCPUS|NNodes|ReqMem|State
+1001|2024-03-01T10:00:00|2024-03-01T10:00:05|01:00:00|4|1|4000M|COMPLETED
+1001.batch|2024-03-01T10:00:05|2024-03-01T10:00:05|01:00:00|4|1||COMPLETED
+1003|2024-03-01T10:00:30|2024-03-01T10:01:00|1-00:00:10|32|2|2Gc|TIMEOUT
+1002|2024-03-01T10:00:20|2024-03-01T10:00:20|00:30.500|1|1|1Gn|FAILED
+1004|2024-03-01T10:01:00|Unknown|00:00:00|1|1|1G|CANCELLED by 0
+"""
+
+
+class TestTraces(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def test_swf(self):
+        jobs = list(traces.read_swf(io.StringIO(SWF_TRACE), cores_per_node = 8, offset = 10))
+
+        # the job that did not run is ignored, and the processors are split in nodes of 8 cores
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0], traces.TraceJob(10, 4, 1024, 3600, 1, "swf1"))
+        self.assertEqual(jobs[1], traces.TraceJob(70, 8, 1024, 60, 2, "swf2"))
+
+    def test_sacct(self):
+        jobs = list(traces.sort_by_time(traces.read_sacct(io.StringIO(SACCT_TRACE))))
+
+        # the steps and the jobs that did not start are ignored, and the memory is per node
+        self.assertEqual([ j.name for j in jobs ], [ "slurm1001", "slurm1002", "slurm1003" ])
+        self.assertEqual(jobs[0], traces.TraceJob(0, 4, 4000, 3600, 1, "slurm1001"))
+        self.assertEqual(jobs[1], traces.TraceJob(20, 1, 1024, 30.5, 1, "slurm1002"))
+        self.assertEqual(jobs[2], traces.TraceJob(30, 16, 32768, 86410, 2, "slurm1003"))
+
+    def test_sort_by_time(self):
+        jobs = [ traces.TraceJob(t, 1, 1, 1, 1, str(t)) for t in [ 5, 1, 3, 9, 7, 2 ] ]
+        self.assertEqual([ j.t for j in traces.sort_by_time(jobs) ], [ 1, 2, 3, 5, 7, 9 ])
+
+        # the items that are out of order by more than the window are yielded as soon as possible
+        self.assertEqual([ j.t for j in traces.sort_by_time(jobs, 2) ], [ 1, 3, 5, 2, 7, 9 ])
+
+    def test_lazy(self):
+        def lines():
+            yield u"; header\n"
+            for i in range(10):
+                yield u"%d %d 0 10 1 -1 -1 1 10 -1 1 1 1 -1 1 -1 -1 -1\n" % (i, i * 10)
+            raise Exception("the trace should not be read beyond the jobs that are used")
+
+        class trace_file:
+            def __enter__(self):
+                return lines()
+            def __exit__(self, *args):
+                return False
+
+        jobs = traces.read_swf(trace_file())
+        self.assertEqual([ next(jobs).t for i in range(10) ], list(range(0, 100, 10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
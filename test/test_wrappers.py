@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+#
+# CLUES - Cluster Energy Saving System
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import os
+import sys
+import importlib.util
+from importlib.machinery import SourceFileLoader
+
+sys.path.append("..")
+sys.path.append(".")
+
+
+def load_wrapper(name, file_name):
+    # The wrappers are scripts without the .py extension, so they are loaded from their path
+    tests_path = os.path.dirname(os.path.abspath(__file__))
+    abs_file_path = os.path.join(tests_path, "..", "addons", file_name)
+    loader = SourceFileLoader(name, abs_file_path)
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+class TestWrappers(unittest.TestCase):
+
+    def __init__(self, *args):
+        """Init test class."""
+        unittest.TestCase.__init__(self, *args)
+
+    def test_slurm_array_tasks(self):
+        wrapper = load_wrapper("clues_slurm_wrapper", os.path.join("slurm", "clues-slurm-wrapper"))
+        self.assertEqual(wrapper.count_array_tasks("0-15:4,20,30-32"), 8)
+        self.assertEqual(wrapper.count_array_tasks("0-99%4"), 4)
+        self.assertEqual(wrapper.count_array_tasks("0-2%10"), 3)
+
+    def test_sge_array_tasks(self):
+        wrapper = load_wrapper("clues_sge_wrapper", os.path.join("sge", "clues-sge-wrapper"))
+        self.assertEqual(wrapper.get_array_tasks([]), 1)
+        self.assertEqual(wrapper.get_array_tasks([ ["t_min", "1"], ["t_max", "10"], ["t_step", "3"] ]), 4)
+
+        # -t 1-1000 -tc 10: only 10 tasks run at the same time
+        params = [ ["t_min", "1"], ["t_max", "1000"], ["t_step", "1"], ["tc", "10"] ]
+        self.assertEqual(wrapper.get_array_tasks(params), 10)
+        self.assertEqual(wrapper.get_num_slots(params), 10)
+        self.assertEqual(wrapper.get_array_tasks([ ["t_min", "1"], ["t_max", "5"], ["t_step", "1"], ["tc", "10"] ]), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()